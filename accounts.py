@@ -0,0 +1,110 @@
+import threading
+from contextlib import contextmanager
+
+from messages import MessageFactory
+
+# Gmail's documented sending limit for regular accounts
+DEFAULT_DAILY_QUOTA = 500
+
+
+class QuotaExhausted(Exception):
+    """Every sender account has used its daily quota"""
+
+
+class SenderAccount:
+    """One Gmail account messages can be sent from"""
+
+    def __init__(self, email, app_password, daily_quota=DEFAULT_DAILY_QUOTA):
+        self.email = email.strip()
+        # Spaces are allowed when pasting the 16-digit app password
+        self.app_password = app_password.replace(" ", "")
+        # None means no limit is tracked
+        self.daily_quota = daily_quota
+
+
+def parse_accounts(text, daily_quota=DEFAULT_DAILY_QUOTA):
+    """Parse "email, app password[, daily quota]" lines into SenderAccounts
+
+    Blank lines and lines starting with # are ignored.
+    """
+    accounts = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        fields = [field.strip() for field in line.split(',')]
+        if len(fields) not in (2, 3) or not fields[0] or not fields[1]:
+            raise ValueError(f"Line {number}: expected 'email, app password[, daily quota]'")
+        quota = daily_quota
+        if len(fields) == 3 and fields[2]:
+            try:
+                quota = int(fields[2])
+            except ValueError:
+                raise ValueError(f"Line {number}: daily quota must be a whole number") from None
+        accounts.append(SenderAccount(fields[0], fields[1], quota))
+    return accounts
+
+
+class AccountPool:
+    """Shards sends across sender accounts within their daily quotas
+
+    Each account has its own MessageFactory (the From header differs); the
+    transport keeps its connections. Accounts are leased round-robin,
+    skipping any without enough quota left, so work spills over to the
+    others until all are exhausted. Quota bookkeeping here is in memory;
+    persisting it is up to the caller.
+    """
+
+    def __init__(self, accounts, used=None, cc=None, bcc=None, bcc_header=False):
+        if not accounts:
+            raise ValueError("at least one sender account is required")
+        self.accounts = list(accounts)
+        used = used or {}
+        self.factories = {}
+        # Sends left today per account, counting in-flight sends as used
+        self._remaining = {}
+        for account in self.accounts:
+            self.factories[account.email] = MessageFactory(account.email, cc=cc, bcc=bcc,
+                                                           bcc_header=bcc_header)
+            if account.daily_quota is None:
+                self._remaining[account.email] = float('inf')
+            else:
+                self._remaining[account.email] = max(0, account.daily_quota - used.get(account.email, 0))
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def exhausted(self, count=1):
+        """True when no account has count sends left"""
+        with self._lock:
+            return all(remaining < count for remaining in self._remaining.values())
+
+    def remaining(self):
+        """{account email: sends left today}"""
+        with self._lock:
+            return dict(self._remaining)
+
+    def _reserve(self, count):
+        with self._lock:
+            for offset in range(len(self.accounts)):
+                account = self.accounts[(self._next + offset) % len(self.accounts)]
+                if self._remaining[account.email] >= count:
+                    self._remaining[account.email] -= count
+                    self._next = (self._next + offset + 1) % len(self.accounts)
+                    return account
+        raise QuotaExhausted("All sender accounts have reached their daily quota")
+
+    @contextmanager
+    def lease(self, count=1):
+        """Reserve count sends on the next account with that much quota left
+
+        The reservation is given back if the with-block raises. A batch
+        only goes to an account that can take all of it, so quota left
+        over below the batch size is not used.
+        """
+        account = self._reserve(count)
+        try:
+            yield account
+        except BaseException:
+            with self._lock:
+                self._remaining[account.email] += count
+            raise
@@ -0,0 +1,202 @@
+"""Attachment files as ready-to-send MIME parts
+
+A campaign attaches the same brochure to thousands of messages, and
+several recipients often share a per-recipient file. Each file is read
+through mmap and base64-encoded once into a complete MIME part (headers
+plus CRLF-wrapped base64 lines); messages.MessageFactory then joins those
+bytes into every message that attaches the file, without encoding again.
+"""
+import base64
+import hashlib
+import mimetypes
+import mmap
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+# Encoded parts kept in memory per run
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+# Where the app keeps uploaded attachments, so a background run can read them
+DEFAULT_STAGING_DIR = os.path.join(os.path.expanduser('~'), '.mail_sender', 'attachments')
+
+# Several paths in one cell of the attachment column are separated by this
+PATH_SEPARATOR = ';'
+
+
+def split_paths(value):
+    """Attachment paths listed in one cell ("" or NaN means none)"""
+    if value is None or value != value:
+        return []
+    return [path.strip() for path in str(value).split(PATH_SEPARATOR) if path.strip()]
+
+
+def resolve_path(path):
+    """Absolute path of an attachment given by the person running the campaign"""
+    return os.path.abspath(os.path.expanduser(path))
+
+
+def confined_path(path, base_dir):
+    """Absolute path of a file listed in a recipient row, which must lie in base_dir
+
+    Raises ValueError for an absolute path or one resolving outside
+    base_dir (through '..' or a symbolic link), so the recipient list can't
+    attach any other file on the computer.
+    """
+    if os.path.isabs(path) or os.path.splitdrive(path)[0]:
+        raise ValueError(f"Attachment path must be relative to the attachment folder: {path}")
+    base = os.path.realpath(os.path.expanduser(base_dir))
+    full = os.path.realpath(os.path.join(base, path))
+    if os.path.commonpath([base, full]) != base:
+        raise ValueError(f"Attachment path leads outside the attachment folder: {path}")
+    return full
+
+
+def _filename_param(name):
+    # Plain quoted filename when possible, else RFC 2231 (e.g. non-ASCII names)
+    if name.isascii() and not any(char in name for char in '"\\\r\n'):
+        return f'filename="{name}"'
+    return f"filename*=utf-8''{urllib.parse.quote(name, safe='')}"
+
+
+class AttachmentPart:
+    """One encoded attachment: the bytes of its MIME part, shared by every message"""
+
+    __slots__ = ('path', 'filename', 'content_type', 'size', 'data')
+
+    def __init__(self, path, filename, content_type, size, data):
+        self.path = path
+        self.filename = filename
+        self.content_type = content_type
+        # Size of the file itself; len(data) is the encoded part
+        self.size = size
+        self.data = data
+
+
+def encode_attachment(path, filename=None):
+    """Read a file through mmap and encode it as a base64 MIME part"""
+    filename = filename or os.path.basename(path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                payload = base64.encodebytes(mapped).replace(b'\n', b'\r\n')
+        else:
+            payload = b''
+    param = _filename_param(filename)
+    headers = (
+        f'Content-Type: {content_type}; {param.replace("filename", "name", 1)}\r\n'
+        f'Content-Transfer-Encoding: base64\r\n'
+        f'Content-Disposition: attachment; {param}\r\n'
+        f'\r\n'
+    ).encode('ascii')
+    return AttachmentPart(path, filename, content_type, size, headers + payload)
+
+
+class AttachmentCache:
+    """Encoded AttachmentParts by file, least recently used evicted first
+
+    Entries are keyed by path, size and modification time, so a file
+    replaced on disk is encoded again. Concurrent requests for the same file
+    wait for a single encode. Once the parts held pass max_bytes the least
+    recently used are dropped (callers holding a part keep it alive); a part
+    larger than max_bytes on its own is returned without being kept.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, metrics=None):
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self._parts = OrderedDict()
+        self._bytes = 0
+        self._file_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.encodes = 0
+        self.evictions = 0
+
+    def part(self, path):
+        """AttachmentPart of the file at path; raises OSError if it can't be read"""
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            part = self._lookup(key)
+            if part is not None:
+                return part
+            file_lock = self._file_locks.setdefault(path, threading.Lock())
+        with file_lock:
+            with self._lock:
+                part = self._lookup(key)
+                if part is not None:
+                    return part
+            started = time.perf_counter()
+            part = encode_attachment(path)
+            if self.metrics is not None:
+                self.metrics.record('attachment_encode', time.perf_counter() - started)
+            with self._lock:
+                self.encodes += 1
+                self._store(key, part)
+        return part
+
+    def _lookup(self, key):
+        part = self._parts.get(key)
+        if part is not None:
+            self._parts.move_to_end(key)
+            self.hits += 1
+        return part
+
+    def _store(self, key, part):
+        size = len(part.data)
+        if size > self.max_bytes:
+            return
+        # An older version of the same file can never be hit again
+        for old_key in [old_key for old_key in self._parts if old_key[0] == key[0]]:
+            self._bytes -= len(self._parts.pop(old_key).data)
+        self._parts[key] = part
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._parts.popitem(last=False)
+            self._bytes -= len(evicted.data)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._parts),
+                'bytes': self._bytes,
+                'encodes': self.encodes,
+                'hits': self.hits,
+                'evictions': self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._parts.clear()
+            self._bytes = 0
+
+
+def stage_file(name, data, directory=DEFAULT_STAGING_DIR):
+    """Save uploaded bytes as <directory>/<content hash>/<name> and return the path
+
+    Files with the same contents are stored once, so uploading a brochure
+    again reuses the copy already on disk.
+    """
+    name = os.path.basename(name) or 'attachment'
+    folder = os.path.join(directory, hashlib.sha1(data).hexdigest()[:16])
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        return path
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
@@ -0,0 +1,94 @@
+"""Cost of building messages with an attachment, encoded per message vs once
+
+Run from the repository root:  python benchmarks/bench_attachments.py --messages 200 --megabytes 5
+
+    per_message  email.message.EmailMessage with add_attachment() for every
+                 recipient: the file is read and base64-encoded each time
+    shared       MessageFactory.build with the part from an AttachmentCache:
+                 one mmap read and encode, then the bytes are joined in
+
+Both build the same multipart/mixed messages (checked on the first one).
+"""
+import argparse
+import email
+import email.policy
+import os
+import sys
+import tempfile
+import time
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from attachments import AttachmentCache
+from messages import MessageFactory
+
+SENDER = 'bench@example.com'
+BODY = "Dear {name},\n\nPlease find our brochure attached.\n"
+
+
+def per_message(path, count):
+    sizes = 0
+    for i in range(count):
+        message = EmailMessage()
+        message['From'] = SENDER
+        message['To'] = f"user{i}@example.com"
+        message['Subject'] = "Our brochure"
+        message.set_content(BODY.format(name=f"Person {i}"))
+        with open(path, 'rb') as f:
+            message.add_attachment(f.read(), maintype='application', subtype='pdf',
+                                   filename=os.path.basename(path))
+        sizes += len(message.as_bytes(policy=email.policy.SMTP))
+    return sizes
+
+
+def shared(path, count, cache):
+    factory = MessageFactory(SENDER)
+    sizes = 0
+    for i in range(count):
+        message, _ = factory.build(f"user{i}@example.com", "Our brochure", BODY.format(name=f"Person {i}"),
+                                   [cache.part(path)])
+        sizes += len(message)
+    return sizes
+
+
+def attachment_of(raw):
+    parsed = email.message_from_bytes(raw, policy=email.policy.default)
+    return next(parsed.iter_attachments()).get_content()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--megabytes', type=float, default=5, help='Size of the attachment')
+    args = parser.parse_args()
+    count, megabytes = args.messages, args.megabytes
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'brochure.pdf')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(int(megabytes * 1024 * 1024)))
+
+        cache = AttachmentCache()
+        with open(path, 'rb') as f:
+            original = f.read()
+        raw, _ = MessageFactory(SENDER).build('check@example.com', 'Check', 'Check', [cache.part(path)])
+        assert attachment_of(raw) == original
+        cache.clear()
+
+        print(f"{count} messages with a {megabytes:g} MB attachment")
+        print(f"{'':>12} {'seconds':>8} {'ms/message':>11} {'encodes':>8} {'MB built':>9}")
+        started = time.perf_counter()
+        size = per_message(path, count)
+        elapsed = time.perf_counter() - started
+        print(f"{'per_message':>12} {elapsed:>8.2f} {elapsed / count * 1000:>11.2f} {count:>8} "
+              f"{size / (1024 * 1024):>9.0f}")
+        cache = AttachmentCache()
+        started = time.perf_counter()
+        size = shared(path, count, cache)
+        elapsed = time.perf_counter() - started
+        print(f"{'shared':>12} {elapsed:>8.2f} {elapsed / count * 1000:>11.2f} {cache.encodes:>8} "
+              f"{size / (1024 * 1024):>9.0f}")
+
+
+if __name__ == '__main__':
+    main()
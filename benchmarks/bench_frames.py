@@ -0,0 +1,76 @@
+"""Memory and per-rerun cost of a loaded recipient list, plain vs compacted
+
+Run from the repository root:  python benchmarks/bench_frames.py --rows 100000
+
+The frame mimics a sheet read by loaders: a unique address and name, a few
+repetitive text columns and a number column with blanks filled with "".
+"Display" is the Arrow serialization st.dataframe does on every rerun, for
+the whole frame and for the PREVIEW_ROWS the page now shows.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from streamlit.dataframe_util import convert_pandas_df_to_arrow_bytes
+
+from frames import compact_frame, frame_bytes
+from templating import compile_template
+
+PREVIEW_ROWS = 1000
+BODY = "Dear {{name}},\n\nYour {{plan}} plan at {{company}} ({{city}}) renews for {{amount}}.\n"
+
+
+def make_frame(rows):
+    companies = [f"Company {i}" for i in range(50)]
+    cities = [f"City {i}" for i in range(200)]
+    return pd.DataFrame({
+        'email': [f"user{i}@example.com" for i in range(rows)],
+        'name': [f"Person {i}" for i in range(rows)],
+        'company': [companies[i % len(companies)] for i in range(rows)],
+        'city': [cities[i * 7 % len(cities)] for i in range(rows)],
+        'plan': [("Basic", "Pro", "Team")[i % 3] for i in range(rows)],
+        'amount': pd.Series([i % 90 + 10 if i % 4 else "" for i in range(rows)], dtype=object),
+    })
+
+
+def timed(function, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    rows = parser.parse_args().rows
+
+    # Streamlit logs every failed Arrow conversion of the plain frame
+    logging.getLogger('streamlit.dataframe_util').setLevel(logging.ERROR)
+    plain = make_frame(rows)
+    started = time.perf_counter()
+    compact = compact_frame(plain)
+    compact_seconds = time.perf_counter() - started
+    template = compile_template(BODY)
+    assert template.render_frame(plain).tolist() == template.render_frame(compact).tolist()
+
+    print(f"{rows} rows, compacted in {compact_seconds * 1000:.0f} ms: "
+          + ", ".join(f"{column}={dtype}" for column, dtype in compact.dtypes.items()))
+    print(f"{'':>10} {'memory (MB)':>12} {'display all (ms)':>17} "
+          f"{'display preview (ms)':>21} {'render (ms)':>12}")
+    for label, frame in (('plain', plain), ('compact', compact)):
+        print(f"{label:>10} {frame_bytes(frame) / (1024 * 1024):>12.1f} "
+              f"{timed(lambda: convert_pandas_df_to_arrow_bytes(frame)) * 1000:>17.1f} "
+              f"{timed(lambda: convert_pandas_df_to_arrow_bytes(frame.head(PREVIEW_ROWS))) * 1000:>21.1f} "
+              f"{timed(lambda: template.render_frame(frame)) * 1000:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
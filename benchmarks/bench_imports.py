@@ -0,0 +1,109 @@
+"""Cold-start import time per data source and transport
+
+Run from the repository root:  python benchmarks/bench_imports.py [--repeat N]
+
+Each mode runs in a fresh interpreter (best of --repeat runs) and is timed
+from the first import until it is ready to load or send:
+
+    app        the imports at the top of main.py (Streamlit's first script run)
+    cli        import cli
+    excel      cli, then load_excel_data on a one-row workbook
+    sheets     cli, then a gspread client for a generated service account
+    drive      cli, then a Drive service for that account
+    gmail_api  cli, then a Gmail API service for a sender account
+    eager      cli, then every source and transport library, as each start
+               used to pay for
+
+Nothing is requested over the network. The last column lists the heavy
+libraries the mode ended up importing.
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('pandas', 'pyarrow', 'openpyxl', 'gspread', 'googleapiclient', 'google.oauth2', 'streamlit')
+
+MODES = {
+    'app': "{app_imports}",
+    'cli': "import cli",
+    'excel': "import cli\ncli.load_excel_data({workbook!r}, 'Sheet1')",
+    'sheets': "import cli\ncli.ClientCache().sheets_client({credentials!r})",
+    'drive': "import cli\ncli.ClientCache().drive_service({credentials!r})",
+    'gmail_api': "import cli\nfrom accounts import SenderAccount\n"
+                 "cli.gmail_service_factory({credentials!r})(SenderAccount('me@example.com', ''))",
+    'eager': "import cli\nimport pandas, pyarrow.parquet, openpyxl, gspread, googleapiclient.discovery\n"
+             "import google.oauth2.service_account",
+}
+
+CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+print(elapsed, ' '.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def app_imports():
+    """The top-level import statements of main.py"""
+    with open(os.path.join(ROOT, 'main.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def service_account_json():
+    """A syntactically valid service account with a throwaway key"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode('ascii')
+    return json.dumps({
+        'type': 'service_account', 'project_id': 'bench', 'private_key_id': 'bench',
+        'private_key': pem, 'client_email': 'bench@bench.iam.gserviceaccount.com',
+        'client_id': '1', 'token_uri': 'https://oauth2.googleapis.com/token',
+    })
+
+
+def run_mode(code, repeat):
+    script = CHILD.format(root=ROOT, code=code, heavy=HEAVY)
+    best, loaded = float('inf'), ''
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip().splitlines()[-1]
+        seconds, _, modules = output.partition(' ')
+        if float(seconds) < best:
+            best, loaded = float(seconds), modules
+    return best, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    with tempfile.TemporaryDirectory() as directory:
+        workbook = os.path.join(directory, 'recipients.xlsx')
+        pd.DataFrame({'email': ['user@example.com'], 'name': ['User']}).to_excel(
+            workbook, sheet_name='Sheet1', index=False)
+        values = {'app_imports': app_imports(), 'workbook': workbook, 'credentials': service_account_json()}
+
+        print(f"{'mode':>10} {'import (ms)':>12}  libraries loaded")
+        for mode in args.modes:
+            seconds, loaded = run_mode(MODES[mode].format(**values), args.repeat)
+            print(f"{mode:>10} {seconds * 1000:>12.0f}  {loaded or '-'}")
+
+
+if __name__ == '__main__':
+    main()
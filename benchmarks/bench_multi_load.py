@@ -0,0 +1,84 @@
+"""Wall time of loading several recipient sheets one after another vs load_sources
+
+Run from the repository root:
+    python benchmarks/bench_multi_load.py --sources 6 --rows 5000 --latency 0.5
+
+Each source is a generated workbook tab read by load_excel_data, behind a
+simulated fetch of `latency` seconds (a Drive download or Sheets request).
+The cold run parses every workbook; the warm run reads them back from a
+fresh RecipientCache directory. openpyxl parses holding the GIL, so cold
+parsing overlaps less than network waits and cache reads do.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from loaders import load_excel_data, load_sources, merge_frames
+from recipient_cache import RecipientCache
+
+
+def make_workbook(path, index, rows):
+    pd.DataFrame({
+        'email': [f"user{index}_{i}@example.com" for i in range(rows)],
+        'name': [f"Person {i}" for i in range(rows)],
+        'region': f"Region {index}",
+    }).to_excel(path, sheet_name='Sheet1', index=False)
+
+
+def fetched(load, latency):
+    time.sleep(latency)
+    return load()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sources', type=int, default=6, help='Workbooks to load')
+    parser.add_argument('--rows', type=int, default=5000, help='Rows per workbook')
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds of simulated fetch per source')
+    args = parser.parse_args()
+    sources, rows, latency = args.sources, args.rows, args.latency
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index in range(sources):
+            paths.append(os.path.join(directory, f"source{index}.xlsx"))
+            make_workbook(paths[-1], index, rows)
+
+        print(f"{sources} sources x {rows} rows, {latency * 1000:.0f} ms fetch latency each")
+        print(f"{'':>6} {'slowest single (s)':>19} {'serial (s)':>11} {'load_sources (s)':>17}")
+        for label in ('cold', 'warm'):
+            timings = {}
+            for mode in ('serial', 'parallel'):
+                cache_dir = os.path.join(directory, f"cache-{mode}")
+                cache = RecipientCache(cache_dir)
+                if label == 'warm':
+                    for path in paths:
+                        load_excel_data(path, 'Sheet1', recipient_cache=cache)
+                loads = [(path, partial(fetched, partial(load_excel_data, path, 'Sheet1', recipient_cache=cache),
+                                        latency))
+                         for path in paths]
+                started = time.perf_counter()
+                if mode == 'serial':
+                    single = []
+                    for _, load in loads:
+                        load_started = time.perf_counter()
+                        load()
+                        single.append(time.perf_counter() - load_started)
+                    timings['single'] = max(single)
+                else:
+                    frames = [frame for _, frame, _ in load_sources(loads)]
+                    merged, _ = merge_frames(frames, 'email')
+                    assert len(merged) == sources * rows
+                timings[mode] = time.perf_counter() - started
+            print(f"{label:>6} {timings['single']:>19.2f} {timings['serial']:>11.2f} "
+                  f"{timings['parallel']:>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
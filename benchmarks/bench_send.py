@@ -0,0 +1,231 @@
+"""End-to-end send benchmark against the local SMTP stand-in
+
+Generates synthetic recipient sheets, then drives the real code paths
+against an in-process SMTP server, so nothing touches Gmail:
+
+    legacy     load_excel_data -> apply_template -> send_email_simple, one row at a
+               time, connecting, STARTTLS-ing and logging in for every message
+    engine     stream_excel_data -> Campaign.run (column-wise render, pooled workers)
+    gmail_api  as engine, through GmailAPITransport batches against an offline
+               Gmail stand-in (--latency is then per HTTP round trip)
+
+Each case runs in its own subprocess so peak RSS is measured per case.
+
+Run from the repository root, e.g.:
+    python benchmarks/bench_send.py --rows 1000 10000 --latency 0.001 --workers 4
+    python benchmarks/bench_send.py --rows 100000 --modes engine --error-rate-421 0.001
+    python benchmarks/bench_send.py --rows 10000 --modes gmail_api --latency 0.05 --batch-size 50
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# The SMTP and Gmail stand-ins are shared with the tests
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+SUBJECT = "Hello {{name}} - your {{plan}} update"
+BODY = """Dear {{name}},
+
+Thank you for being a {{plan}} customer since {{since}}.
+
+{{message}}
+
+Best regards,
+Support Team
+"""
+FILLER_COLUMNS = 20
+
+
+def make_sheet(path, rows):
+    """Write a synthetic recipient sheet with template columns plus filler columns"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    filler = [f"extra_{i}" for i in range(FILLER_COLUMNS)]
+    sheet.append(['email', 'name', 'plan', 'since', 'message'] + filler)
+    for i in range(rows):
+        sheet.append([f"user{i}@example.com", f"User {i}", ('Basic', 'Pro', 'Team')[i % 3],
+                      2000 + i % 25, f"Your reference number is {i:08d}."]
+                     + [f"x{i}-{j}" for j in range(FILLER_COLUMNS)])
+    workbook.save(path)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_legacy(path, standin, workers, messages_per_connection):
+    from loaders import load_excel_data
+    from templating import apply_template
+    from engine import send_email_simple
+
+    df = load_excel_data(path, 'Sheet1')
+    latencies = []
+    failed = 0
+    connections = standin.stats.connections
+    for row in df.to_dict('records'):
+        subject = apply_template(SUBJECT, row)
+        body = apply_template(BODY, row)
+        started = time.perf_counter()
+        # No pool: a new session per message, as the app sent before pooling
+        if not send_email_simple(row['email'], subject, body, 'bench@example.com', 'password',
+                                 smtp_host=standin.host, smtp_port=standin.port):
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+    return len(df), failed, latencies, standin.stats.connections - connections
+
+
+def run_engine(path, standin, workers, messages_per_connection):
+    from engine import Campaign, SendEvent
+    from loaders import stream_excel_data
+
+    campaign = Campaign(SUBJECT, BODY, sender_email='bench@example.com', app_password='password',
+                        test_mode=False, send_rate=1e9, rate_unit='second', workers=workers,
+                        messages_per_connection=messages_per_connection,
+                        smtp_host=standin.host, smtp_port=standin.port)
+    latencies = []
+
+    def on_event(event):
+        if event.kind in (SendEvent.SENT, SendEvent.FAILED):
+            latencies.append(event.elapsed)
+
+    with stream_excel_data(path, 'Sheet1', columns=campaign.required_columns()) as stream:
+        result = campaign.run(stream, on_event=on_event)
+    return result.total, result.failed, latencies, result.pool_stats['handshakes']
+
+
+def run_gmail_api(path, standin, workers, batch_size):
+    from googleapiclient.discovery import build
+    from engine import Campaign, SendEvent
+    from loaders import stream_excel_data
+    from transports import GmailAPITransport
+
+    transport = GmailAPITransport(lambda account: build('gmail', 'v1', http=standin, static_discovery=True),
+                                  batch_size=batch_size)
+    campaign = Campaign(SUBJECT, BODY, sender_email='bench@example.com', test_mode=False,
+                        send_rate=1e9, rate_unit='second', workers=workers, transport=transport)
+    latencies = []
+
+    def on_event(event):
+        if event.kind in (SendEvent.SENT, SendEvent.FAILED, SendEvent.REJECTED):
+            latencies.append(event.elapsed)
+
+    with stream_excel_data(path, 'Sheet1', columns=campaign.required_columns()) as stream:
+        result = campaign.run(stream, on_event=on_event)
+    return result.total, result.failed, latencies, result.pool_stats['batches']
+
+
+def run_case(args):
+    if args.single == 'gmail_api':
+        from gmail_standin import GmailBatchStandin
+
+        standin = GmailBatchStandin(latency=args.latency, error_rates={
+            429: args.error_rate_421, 500: args.error_rate_451, 400: args.error_rate_550})
+        started = time.perf_counter()
+        total, failed, latencies, handshakes = run_gmail_api(args.sheet, standin, args.workers[0],
+                                                             args.batch_size)
+        elapsed = time.perf_counter() - started
+        report(total, failed, elapsed, latencies, handshakes, standin.stats.as_dict())
+        return
+
+    from smtp_standin import SMTPStandin
+
+    error_rates = {421: args.error_rate_421, 451: args.error_rate_451, 550: args.error_rate_550}
+    with SMTPStandin(latency=args.latency, error_rates=error_rates) as standin:
+        runner = run_legacy if args.single == 'legacy' else run_engine
+        started = time.perf_counter()
+        total, failed, latencies, handshakes = runner(args.sheet, standin, args.workers[0],
+                                                      args.messages_per_connection)
+        elapsed = time.perf_counter() - started
+        server = standin.stats.as_dict()
+    report(total, failed, elapsed, latencies, handshakes, server)
+
+
+def report(total, failed, elapsed, latencies, handshakes, server):
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    print(json.dumps({
+        'total': total,
+        'failed': failed,
+        'seconds': elapsed,
+        'throughput': total / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss_mb': peak_mb,
+        'handshakes': handshakes,
+        'server': server,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--modes', nargs='+', choices=['legacy', 'engine', 'gmail_api'],
+                        default=['legacy', 'engine'])
+    parser.add_argument('--workers', type=int, nargs='+', default=[4],
+                        help='Worker counts to try for the engine mode')
+    parser.add_argument('--messages-per-connection', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0005, help='Seconds added to every server reply')
+    parser.add_argument('--batch-size', type=int, default=50, help='Messages per Gmail API batch')
+    # In gmail_api mode these inject 429, 500 and 400 responses instead
+    parser.add_argument('--error-rate-421', type=float, default=0.0)
+    parser.add_argument('--error-rate-451', type=float, default=0.0)
+    parser.add_argument('--error-rate-550', type=float, default=0.0)
+    parser.add_argument('--json', help='Also write all results to this file')
+    parser.add_argument('--single', choices=['legacy', 'engine', 'gmail_api'], help=argparse.SUPPRESS)
+    parser.add_argument('--sheet', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_case(args)
+        return
+
+    results = []
+    # handshakes is the number of batch requests in gmail_api mode
+    print(f"{'mode':<9} {'rows':>8} {'workers':>7} {'msg/s':>9} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'RSS MB':>8} {'handshakes':>10} {'failed':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            sheet = os.path.join(directory, f"recipients_{rows}.xlsx")
+            make_sheet(sheet, rows)
+            for mode in args.modes:
+                for workers in (args.workers if mode != 'legacy' else [1]):
+                    command = [
+                        sys.executable, os.path.abspath(__file__), '--single', mode, '--sheet', sheet,
+                        '--workers', str(workers),
+                        '--messages-per-connection', str(args.messages_per_connection),
+                        '--latency', str(args.latency),
+                        '--batch-size', str(args.batch_size),
+                        '--error-rate-421', str(args.error_rate_421),
+                        '--error-rate-451', str(args.error_rate_451),
+                        '--error-rate-550', str(args.error_rate_550),
+                    ]
+                    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+                    result = json.loads(output.strip().splitlines()[-1])
+                    result.update({'mode': mode, 'rows': rows, 'workers': workers})
+                    results.append(result)
+                    print(f"{mode:<9} {rows:>8} {workers:>7} {result['throughput']:>9.1f} "
+                          f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['peak_rss_mb']:>8.1f} "
+                          f"{result['handshakes']:>10} {result['failed']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
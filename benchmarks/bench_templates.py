@@ -0,0 +1,50 @@
+"""Compare the compiled template engine with the old per-key str.replace loop
+
+Run from the repository root:  python benchmarks/bench_templates.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from templating import compile_template
+
+
+def apply_template_replace(template, data):
+    # The previous implementation: one full replace pass per column
+    result = template
+    for key, value in data.items():
+        placeholder = f"{{{{{key}}}}}"
+        result = result.replace(placeholder, str(value))
+    return result
+
+
+def make_case(columns, paragraphs):
+    row = {f"col_{i}": f"value {i}" for i in range(columns)}
+    used = [f"col_{i}" for i in range(0, columns, 7)]
+    paragraph = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4
+    body = "\n\n".join(f"{paragraph}{{{{{used[i % len(used)]}}}}}" for i in range(paragraphs))
+    return "Hello {{col_0}}, your {{col_1}} update", body, row
+
+
+def main():
+    print(f"{'columns':>8} {'body chars':>11} {'replace (us)':>13} {'compiled (us)':>14} {'speedup':>8}")
+    for columns, paragraphs in [(10, 10), (50, 40), (100, 80), (200, 160)]:
+        subject, body, row = make_case(columns, paragraphs)
+        compiled_subject = compile_template(subject)
+        compiled_body = compile_template(body)
+        assert compiled_body.render(row) == apply_template_replace(body, row)
+
+        number = 2000
+        legacy = timeit.timeit(
+            lambda: (apply_template_replace(subject, row), apply_template_replace(body, row)),
+            number=number) / number
+        compiled = timeit.timeit(
+            lambda: (compiled_subject.render(row), compiled_body.render(row)),
+            number=number) / number
+        print(f"{columns:>8} {len(body):>11} {legacy * 1e6:>13.1f} {compiled * 1e6:>14.1f} {legacy / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
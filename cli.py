@@ -0,0 +1,382 @@
+"""Run a campaign from the command line, without Streamlit
+
+Examples:
+    python cli.py --excel recipients.xlsx --subject-file subject.txt --body-file body.txt
+    GMAIL_APP_PASSWORD=... python cli.py --excel recipients.xlsx --subject-file subject.txt \\
+        --body-file body.txt --sender me@gmail.com --send
+
+Without --send the run is a dry run that renders every message but sends nothing.
+"""
+import argparse
+import os
+import sys
+from contextlib import ExitStack
+from functools import partial
+
+from engine import Campaign, SendEvent, parse_address_list, is_app_password_error
+from loaders import (
+    LoadError, load_excel_data, stream_excel_data, load_spreadsheet_data, load_google_drive_excel,
+    load_sources, merge_frames, parse_sheet_names
+)
+from google_clients import ClientCache, gmail_service_factory
+from transports import GmailAPITransport, SMTP, GMAIL_API, GMAIL_DEFAULT_BATCH_SIZE
+from drive_cache import DriveFileCache
+from recipient_cache import RecipientCache, DEFAULT_CACHE_DIR
+from journal import SendJournal, SuppressionList, QuotaLedger, DEFAULT_JOURNAL_PATH
+from accounts import SenderAccount, parse_accounts, DEFAULT_DAILY_QUOTA
+from metrics import RunMetrics
+from templating import check_placeholders
+from attachments import PATH_SEPARATOR, DEFAULT_MAX_BYTES as ATTACHMENT_CACHE_BYTES
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Send templated emails to a recipient list")
+
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--excel", nargs="+", metavar="PATH", help="Path of one or more local .xlsx files")
+    source.add_argument("--sheet-url", nargs="+", metavar="URL", help="URL of one or more Google Spreadsheets")
+    source.add_argument("--drive-url", nargs="+", metavar="URL",
+                        help="URL of one or more Excel files in Google Drive")
+    parser.add_argument("--sheet-name", default="Sheet1",
+                        help="Sheet (tab) name, or several separated by commas (default: Sheet1). "
+                             "Every sheet of every source is loaded at once and merged")
+    parser.add_argument("--credentials", help="Service account JSON file (Google Sheets / Drive)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"Recipient list cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always load the recipient list from its source")
+
+    subject = parser.add_mutually_exclusive_group(required=True)
+    subject.add_argument("--subject", help="Subject template text")
+    subject.add_argument("--subject-file", help="File containing the subject template")
+    body = parser.add_mutually_exclusive_group(required=True)
+    body.add_argument("--body", help="Body template text")
+    body.add_argument("--body-file", help="File containing the body template")
+    parser.add_argument("--email-column", default="email", help="Column with recipient addresses")
+
+    parser.add_argument("--sender", default="", help="Gmail address used to send")
+    parser.add_argument("--password-env", default="GMAIL_APP_PASSWORD",
+                        help="Environment variable holding the app password (default: GMAIL_APP_PASSWORD)")
+    parser.add_argument("--accounts",
+                        help="File of extra sender accounts, one 'email, app password[, daily quota]' per line")
+    parser.add_argument("--daily-quota", type=int, default=DEFAULT_DAILY_QUOTA,
+                        help=f"Emails each account may send per UTC day (default: {DEFAULT_DAILY_QUOTA})")
+    parser.add_argument("--backend", choices=[SMTP, GMAIL_API], default=SMTP,
+                        help="Send over SMTP with an app password or through Gmail API batches (default: smtp)")
+    parser.add_argument("--gmail-credentials",
+                        help="OAuth token or delegated service account JSON file (--backend gmail_api); "
+                             "--accounts needs the service account, a token sends only as its own account")
+    parser.add_argument("--batch-size", type=int, default=GMAIL_DEFAULT_BATCH_SIZE,
+                        help=f"Emails per Gmail API batch request (default: {GMAIL_DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--attach", nargs="+", default=[], metavar="PATH",
+                        help="Files attached to every email (each is encoded once per run)")
+    parser.add_argument("--attachment-column",
+                        help=f"Column listing files to attach per recipient, separated by '{PATH_SEPARATOR}'")
+    parser.add_argument("--attachment-dir",
+                        help="Folder the files in --attachment-column are read from (required with it); "
+                             "rows listing absolute paths or files outside it are skipped")
+    parser.add_argument("--attachment-cache-mb", type=int, default=ATTACHMENT_CACHE_BYTES // (1024 * 1024),
+                        help="Encoded attachments kept in memory during the run "
+                             f"(default: {ATTACHMENT_CACHE_BYTES // (1024 * 1024)})")
+    parser.add_argument("--cc", default="", help="Comma separated CC addresses")
+    parser.add_argument("--bcc", default="", help="Comma separated BCC addresses")
+
+    parser.add_argument("--send", action="store_true", help="Actually send (default is a dry run)")
+    parser.add_argument("--rate", type=float, default=30, help="Sending rate limit (default: 30)")
+    parser.add_argument("--per", choices=["minute", "second"], default="minute",
+                        help="Time unit of --rate (default: minute)")
+    parser.add_argument("--max-rate", type=float,
+                        help="Highest rate the adaptive controller may climb to (default: --rate)")
+    parser.add_argument("--no-adaptive", action="store_true",
+                        help="Keep the rate fixed instead of adapting it to throttling responses")
+    parser.add_argument("--max-attempts", type=int, default=3,
+                        help="Attempts per email for temporary (4xx) failures (default: 3)")
+    parser.add_argument("--coalesce", type=int, default=1, metavar="N",
+                        help="Send rows with identical subject and body as one email with up to N hidden "
+                             "recipients (default: 1, off)")
+    parser.add_argument("--workers", type=int, default=2, help="Parallel SMTP connections (default: 2)")
+    parser.add_argument("--messages-per-connection", type=int, default=100,
+                        help="Reconnect after this many emails per connection (default: 100)")
+    parser.add_argument("--campaign", help="Campaign ID in the send journal (default: derived from sender and templates)")
+    parser.add_argument("--journal", default=DEFAULT_JOURNAL_PATH,
+                        help=f"Send journal file (default: {DEFAULT_JOURNAL_PATH})")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Do not use the send journal; send every row again")
+    parser.add_argument("--start-over", action="store_true",
+                        help="Forget the campaign's journaled outcomes before the run, so every row is sent "
+                             "again and the new outcomes are journaled")
+    parser.add_argument("--suppression", default=DEFAULT_JOURNAL_PATH,
+                        help=f"Suppression list file (default: {DEFAULT_JOURNAL_PATH})")
+    parser.add_argument("--no-suppression", action="store_true",
+                        help="Do not drop unsubscribed or bounced addresses")
+    parser.add_argument("--unsubscribe",
+                        help="File of addresses (one per line) to add to the suppression list before the run")
+    parser.add_argument("--resubscribe",
+                        help="File of addresses (one per line) to take off the suppression list before the run")
+    parser.add_argument("--metrics",
+                        help="Write per-stage timings of a live run to this file "
+                             "(.prom/.txt: Prometheus text, otherwise JSON)")
+    parser.add_argument("--preview", type=int, default=3,
+                        help="Number of rendered emails printed by a dry run (default: 3)")
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    return parser
+
+
+def read_text(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def open_chunks(args, campaign, creds_json=None):
+    """Open the recipient sources as (chunks, columns, closer) reading only the needed columns
+
+    columns are those of the recipient list, not only the ones read.
+
+    creds_json is the text of the --credentials file (Sheets and Drive sources).
+    """
+    recipient_cache = None if args.no_cache else RecipientCache(args.cache_dir)
+    sheet_names = parse_sheet_names(args.sheet_name)
+    if not sheet_names:
+        raise LoadError("--sheet-name names no sheet")
+    if args.excel and len(args.excel) == len(sheet_names) == 1:
+        path, sheet_name = args.excel[0], sheet_names[0]
+        # Read from the cache when the workbook was loaded before; otherwise
+        # streamed without being cached, as a whole-sheet parse would hold
+        # every row in memory
+        stream = stream_excel_data(path, sheet_name, columns=campaign.required_columns(),
+                                   recipient_cache=recipient_cache)
+        return stream, stream.header, stream.close
+
+    if args.excel:
+        loads = [(f"{path} [{name}]", partial(load_excel_data, path, name, metrics=campaign.metrics,
+                                              recipient_cache=recipient_cache))
+                 for path in args.excel for name in sheet_names]
+    else:
+        if not creds_json:
+            raise LoadError("--credentials is required for Google Sheets and Google Drive sources")
+        client_cache = ClientCache()
+        if args.sheet_url:
+            loads = [(f"{url} [{name}]", partial(load_spreadsheet_data, creds_json, url, name, client_cache,
+                                                 columns=campaign.required_columns(),
+                                                 recipient_cache=recipient_cache))
+                     for url in args.sheet_url for name in sheet_names]
+        else:
+            drive_cache = DriveFileCache()
+            loads = [(f"{url} [{name}]", partial(load_google_drive_excel, creds_json, url, name, drive_cache,
+                                                 client_cache, metrics=campaign.metrics,
+                                                 recipient_cache=recipient_cache))
+                     for url in args.drive_url for name in sheet_names]
+
+    frames = []
+    for label, frame, error in load_sources(loads):
+        if error is not None:
+            # A run never starts with part of its recipient list
+            raise LoadError(f"{label}: {error.message}" if len(loads) > 1 else error.message, error.hint)
+        frames.append(frame)
+    data, duplicates = merge_frames(frames, campaign.email_column)
+    if duplicates:
+        print(f"left out {duplicates} rows repeating an address of an earlier source")
+    return [data], list(data.columns), None
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    app_password = os.environ.get(args.password_env, "")
+    if args.send and args.backend == GMAIL_API and (not args.sender or not args.gmail_credentials):
+        print("error: --send with --backend gmail_api needs --sender and --gmail-credentials", file=sys.stderr)
+        return 2
+    if args.send and args.backend == SMTP and (not args.sender or not app_password):
+        print(f"error: --send needs --sender and the {args.password_env} environment variable",
+              file=sys.stderr)
+        return 2
+    if args.start_over and args.no_resume:
+        print("error: --start-over cannot be combined with --no-resume", file=sys.stderr)
+        return 2
+    if args.attachment_column and not args.attachment_dir:
+        print("error: --attachment-column needs --attachment-dir", file=sys.stderr)
+        return 2
+    if (args.unsubscribe or args.resubscribe) and args.no_suppression:
+        print("error: --unsubscribe and --resubscribe cannot be combined with --no-suppression", file=sys.stderr)
+        return 2
+
+    # Every file named on the command line is read before anything is opened
+    try:
+        subject = args.subject if args.subject is not None else read_text(args.subject_file)
+        body = args.body if args.body is not None else read_text(args.body_file)
+        accounts_text = read_text(args.accounts) if args.accounts else None
+        gmail_creds_json = (read_text(args.gmail_credentials)
+                            if args.backend == GMAIL_API and args.send else None)
+        creds_json = read_text(args.credentials) if args.credentials and not args.excel else None
+        resubscribe = read_text(args.resubscribe).splitlines() if args.resubscribe else []
+        unsubscribe = read_text(args.unsubscribe).splitlines() if args.unsubscribe else []
+    except OSError as e:
+        print(f"error: cannot read {e.filename}: {e.strerror or e}", file=sys.stderr)
+        return 2
+
+    accounts = []
+    if args.sender:
+        accounts.append(SenderAccount(args.sender, app_password, args.daily_quota))
+    if accounts_text is not None:
+        try:
+            accounts += parse_accounts(accounts_text, args.daily_quota)
+        except ValueError as e:
+            print(f"error: {args.accounts}: {e}", file=sys.stderr)
+            return 2
+
+    transport = None
+    if gmail_creds_json is not None:
+        try:
+            service_factory = gmail_service_factory(gmail_creds_json,
+                                                    senders=[account.email for account in accounts])
+        except ValueError as e:
+            print(f"error: {args.gmail_credentials}: {e}", file=sys.stderr)
+            return 2
+        transport = GmailAPITransport(service_factory, batch_size=args.batch_size,
+                                      max_attempts=args.max_attempts)
+
+    # The journal, suppression list, quota ledger and recipient stream are
+    # closed however the run ends
+    with ExitStack() as resources:
+        return run_campaign(args, resources, subject, body, app_password, accounts, transport, creds_json,
+                            resubscribe, unsubscribe)
+
+
+def run_campaign(args, resources, subject_template, body_template, app_password, accounts, transport,
+                 creds_json, resubscribe, unsubscribe):
+    """The part of main() that opens stores; each is registered with resources to be closed"""
+    def opened(store):
+        if store is not None:
+            resources.callback(store.close)
+        return store
+
+    suppression = opened(None if args.no_suppression else SuppressionList(args.suppression))
+    if resubscribe:
+        removed = suppression.remove(line for line in resubscribe if line.strip())
+        print(f"removed {removed} addresses from the suppression list")
+    if unsubscribe:
+        added = suppression.add(line for line in unsubscribe if line.strip())
+        print(f"suppressed {added} addresses")
+
+    campaign = Campaign(
+        subject_template,
+        body_template,
+        email_column=args.email_column,
+        sender_email=args.sender,
+        app_password=app_password,
+        cc=parse_address_list(args.cc),
+        bcc=parse_address_list(args.bcc),
+        test_mode=not args.send,
+        send_rate=args.rate,
+        rate_unit=args.per,
+        workers=args.workers,
+        messages_per_connection=args.messages_per_connection,
+        journal=opened(SendJournal(args.journal) if args.send and not args.no_resume else None),
+        campaign_id=args.campaign,
+        metrics=RunMetrics() if args.send else None,
+        suppression=suppression,
+        accounts=accounts or None,
+        quota=opened(QuotaLedger(args.journal) if args.send else None),
+        max_rate=args.max_rate,
+        max_attempts=args.max_attempts,
+        adaptive=not args.no_adaptive,
+        transport=transport,
+        coalesce_size=args.coalesce,
+        attachments=args.attach,
+        attachment_column=args.attachment_column,
+        attachment_dir=args.attachment_dir,
+        attachment_cache_bytes=args.attachment_cache_mb * 1024 * 1024,
+    )
+    missing = campaign.missing_attachments()
+    if missing:
+        print(f"error: attachment not found: {', '.join(missing)}", file=sys.stderr)
+        return 2
+
+    try:
+        chunks, columns, close = open_chunks(args, campaign, creds_json)
+    except LoadError as e:
+        print(f"error: {e.message}", file=sys.stderr)
+        if e.hint:
+            print(f"hint: {e.hint}", file=sys.stderr)
+        return 1
+    if close is not None:
+        resources.callback(close)
+
+    if campaign.test_mode:
+        report, frame = campaign.dry_run(chunks, keep_frame=args.preview > 0)
+        if frame is not None and not args.quiet:
+            for idx, recipient_email, subject, body, attachments in campaign.render_page(frame, 0, args.preview):
+                attached = "".join(f"Attachment: {path}\n" for path in attachments)
+                print(f"--- row {idx + 1}: {recipient_email}\nSubject: {subject}\n{attached}\n{body}\n")
+        print(f"dry run: rows={report.total} ready={report.sendable} "
+              f"empty={report.empty_email} invalid={report.dropped['invalid']} "
+              f"duplicate={report.dropped['duplicate']} suppressed={report.dropped['suppressed']} "
+              f"distinct={report.distinct_messages} render_ms={report.render_seconds * 1000:.0f}")
+        if report.missing_email_column:
+            print(f"warning: email column '{campaign.email_column}' not found")
+        if report.unknown_placeholders:
+            print("warning: placeholders without a column: " + ", ".join(report.unknown_placeholders))
+        for key, count in report.empty_fields.items():
+            print(f"empty {key}: {count} rows")
+        if report.missing_attachment_column:
+            print(f"warning: attachment column '{campaign.attachment_column}' not found")
+        for path, count in report.missing_attachments.items():
+            print(f"warning: attachment not found: {path} ({count} rows skipped)")
+        for path, count in report.refused_attachments.items():
+            print(f"warning: attachment outside --attachment-dir: {path} ({count} rows skipped)")
+        if report.subject_line_breaks:
+            print(f"warning: subject contains a line break: {report.subject_line_breaks} rows skipped")
+        return 0
+
+    def print_event(event):
+        if args.quiet:
+            return
+        if event.kind in (SendEvent.SKIPPED, SendEvent.DROPPED, SendEvent.ALREADY_SENT, SendEvent.DEFERRED):
+            print(f"row {event.row + 1}: skipped ({event.message})")
+        elif event.kind == SendEvent.SENT:
+            print(f"row {event.row + 1}: sent {event.recipient} from {event.sender}")
+        elif event.kind == SendEvent.REJECTED:
+            print(f"row {event.row + 1}: REJECTED {event.recipient}: {event.error}")
+        elif is_app_password_error(event.error):
+            print(f"row {event.row + 1}: FAILED {event.recipient}: app password required")
+        else:
+            print(f"row {event.row + 1}: FAILED {event.recipient}: {event.error}")
+
+    # The same check the dry run reports, before anything is sent
+    unknown, unused = check_placeholders([campaign.subject, campaign.body], columns)
+    if unknown:
+        print("warning: placeholders without a column: " + ", ".join(unknown))
+    if unused and not args.quiet:
+        print("columns not used by the templates: " + ", ".join(unused))
+
+    if args.start_over and campaign.journal is not None:
+        forgotten = campaign.journal.forget(campaign.campaign_id)
+        print(f"forgot {forgotten} journaled rows of campaign '{campaign.campaign_id}'")
+
+    result = campaign.run(chunks, on_event=print_event)
+
+    print(f"total={result.total} success={result.success} failed={result.failed} "
+          f"already_sent={result.already_sent} " +
+          " ".join(f"{reason}={count}" for reason, count in result.dropped.items()))
+    if result.pool_stats is not None:
+        print(f"{args.backend} " + " ".join(f"{name}={value}" for name, value in result.pool_stats.items()))
+        print(f"retries={result.retries} throttles={result.throttles} rejected={result.rejected} "
+              f"final_rate={result.final_rate:g}/{args.per}")
+    if result.attachment_stats is not None:
+        print("attachments " + " ".join(f"{name}={value}" for name, value in result.attachment_stats.items()))
+    for account, left in result.quota_left.items():
+        print(f"sent from {account}: {result.accounts.get(account, 0)}"
+              + ("" if left is None else f" ({left} left today)"))
+    if result.quota_exhausted:
+        print("warning: every sender account reached its daily quota; run again tomorrow to continue")
+    if not args.quiet:
+        for stage, stats in campaign.metrics.summary().items():
+            print(f"{stage}: count={stats['count']} total_s={stats['total_seconds']:.3f} "
+                  f"p50_ms={stats['p50_seconds'] * 1000:.2f} p99_ms={stats['p99_seconds'] * 1000:.2f}")
+    if args.metrics:
+        campaign.metrics.write(args.metrics)
+    return 0 if result.failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
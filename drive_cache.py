@@ -0,0 +1,126 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'mail_sender_drive_cache')
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class DriveFileCache:
+    """Disk cache for Drive downloads, keyed by file ID and content version
+
+    The file's metadata is checked first and the download is skipped when
+    the md5Checksum (or modifiedTime, for files without one) is unchanged.
+    Downloads are spooled straight to disk in chunks, and the least recently
+    used files are evicted once the cache grows past max_bytes. Concurrent
+    fetches of one file (several tabs of a workbook loaded at once) share a
+    single download.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.hits = 0
+        self.misses = 0
+        # File ID -> lock held while that file is checked and downloaded
+        self._file_locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version(metadata):
+        """Short hash of the content version in a file's metadata"""
+        version = metadata.get('md5Checksum') or metadata.get('modifiedTime') or ''
+        return hashlib.sha1(version.encode('utf-8')).hexdigest()[:16]
+
+    def _path(self, file_id, version):
+        return os.path.join(self.cache_dir, f"{file_id}.{version}.bin")
+
+    @staticmethod
+    def metadata(service, file_id):
+        """The Drive metadata fetch() and version() need"""
+        return service.files().get(
+            fileId=file_id, fields='id,md5Checksum,modifiedTime,size'
+        ).execute()
+
+    def fetch(self, service, file_id, metadata=None):
+        """Return the local path of the current version of a Drive file
+
+        metadata, if the caller already has it, saves asking Drive again.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if metadata is None:
+            metadata = self.metadata(service, file_id)
+        with self._lock:
+            file_lock = self._file_locks.setdefault(file_id, threading.Lock())
+        with file_lock:
+            return self._fetch(service, file_id, self._path(file_id, self.version(metadata)))
+
+    def _fetch(self, service, file_id, path):
+        from googleapiclient.http import MediaIoBaseDownload
+
+        if os.path.exists(path):
+            self.hits += 1
+            # Mark as recently used for eviction
+            os.utime(path)
+            return path
+
+        self.misses += 1
+        request = service.files().get_media(fileId=file_id)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as file_content:
+                downloader = MediaIoBaseDownload(file_content, request, chunksize=self.chunk_size)
+                done = False
+                while not done:
+                    status, done = downloader.next_chunk()
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        self._remove_old_versions(file_id, keep=path)
+        self.evict(keep=path)
+        return path
+
+    def _remove_old_versions(self, file_id, keep):
+        prefix = f"{file_id}."
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(prefix) and path != keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def evict(self, keep=None):
+        """Delete least recently used files until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.part'):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Removed meanwhile by another fetch
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,834 @@
+"""Headless campaign engine: renders and sends a recipient list
+
+Nothing here touches Streamlit. Progress is reported through an on_event
+callback, which is always called on the thread that runs the campaign, so
+both the Streamlit page and the command line can drive the same code.
+"""
+import os
+import smtplib
+import threading
+import time
+from collections import OrderedDict, deque
+from email.errors import HeaderParseError
+
+from smtp_pool import SMTPPool, SMTP_HOST, SMTP_PORT, PERMANENT, THROTTLED
+from accounts import AccountPool, SenderAccount, QuotaExhausted
+from transports import SMTPTransport
+from messages import MessageFactory
+from templating import compile_template, check_placeholders, required_columns
+from send_pipeline import TokenBucket, AdaptiveRate, PartialFailure, backoff_delay, send_concurrently
+from journal import SENT, FAILED, REJECTED, BOUNCED, campaign_id_for, recipient_key
+from recipients import RecipientScreen, EMPTY, INVALID, DUPLICATE, SUPPRESSED
+from frames import compact_frame
+from attachments import (
+    AttachmentCache, DEFAULT_MAX_BYTES as ATTACHMENT_CACHE_BYTES, split_paths, resolve_path, confined_path
+)
+
+# RCPT replies meaning the mailbox does not exist or the address is unusable
+HARD_BOUNCE_CODES = (550, 551, 553)
+
+# Rows held back while waiting for identical messages to coalesce with
+COALESCE_BUFFER_ROWS = 5000
+
+# Shown for rows whose rendered subject would break into several headers
+SUBJECT_LINE_BREAK_MESSAGE = "Subject contains a line break"
+
+DROP_MESSAGES = {
+    INVALID: "Email address is not valid",
+    DUPLICATE: "Duplicate of an earlier row",
+    SUPPRESSED: "Address is on the suppression list",
+}
+
+
+def parse_address_list(text):
+    """Split a comma separated address string into a clean list"""
+    if not text or not text.strip():
+        return []
+    return [email.strip() for email in text.split(',') if email.strip()]
+
+
+def is_app_password_error(error):
+    """True when Gmail rejected a regular password where an app password is required"""
+    if not isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    error_msg = str(error)
+    return "Application-specific password required" in error_msg or "InvalidSecondFactor" in error_msg
+
+
+def is_hard_bounce(error, recipient):
+    """True when the server permanently refused this recipient's mailbox"""
+    if not isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    refused = {recipient_key(address): code for address, (code, _) in error.recipients.items()}
+    return refused.get(recipient_key(recipient)) in HARD_BOUNCE_CODES
+
+
+def group_identical(jobs, size):
+    """Split (row, recipient, subject, body, attachments) jobs into lists of identical messages
+
+    Lists hold at most size jobs and keep the order jobs first appeared in.
+    """
+    open_groups = {}
+    groups = []
+    for job in jobs:
+        key = job[2:]
+        group = open_groups.get(key)
+        if group is None or len(group) >= size:
+            group = open_groups[key] = []
+            groups.append(group)
+        group.append(job)
+    return groups
+
+
+def recipient_error(recipient, error):
+    """The part of a message's error that concerns one of its recipients
+
+    An SMTPRecipientsRefused from a message with several recipients (or CC
+    addresses) only fails the recipients it names.
+    """
+    if not isinstance(error, smtplib.SMTPRecipientsRefused):
+        return error
+    key = recipient_key(recipient)
+    for address, reply in error.recipients.items():
+        if recipient_key(address) == key:
+            return smtplib.SMTPRecipientsRefused({address: reply})
+    return None
+
+
+def deliver_email(to, subject, body, sender_email, app_password, cc=None, bcc=None, pool=None,
+                  attachments=None, attachment_cache=None, smtp_host=SMTP_HOST, smtp_port=SMTP_PORT):
+    """Send email using App Password with CC and BCC support
+
+    Raises on failure. When a pool is given its authenticated connection is
+    reused instead of connecting and logging in for this message alone.
+    attachments are file paths; pass the same attachments.AttachmentCache
+    to every call to encode each file once.
+    Without a pool, a connection to smtp_host:smtp_port is opened for this
+    message and closed again.
+    """
+    cc_list = cc if isinstance(cc, list) else ([cc] if cc else [])
+    bcc_list = bcc if isinstance(bcc, list) else ([bcc] if bcc else [])
+    factory = MessageFactory(sender_email, cc=cc_list, bcc=bcc_list)
+    parts = []
+    if attachments:
+        attachment_cache = attachment_cache or AttachmentCache()
+        parts = [attachment_cache.part(resolve_path(path)) for path in attachments]
+    message, mail_options = factory.build(to, subject, body, parts)
+    recipients = factory.envelope(to)
+
+    if pool is not None:
+        pool.sendmail(sender_email, recipients, message, mail_options)
+    else:
+        with SMTPPool(sender_email, app_password, max_messages=1, host=smtp_host,
+                      port=smtp_port) as one_off_pool:
+            one_off_pool.sendmail(sender_email, recipients, message, mail_options)
+
+
+def send_email_simple(to, subject, body, sender_email, app_password, cc=None, bcc=None, pool=None,
+                      attachments=None, attachment_cache=None, smtp_host=SMTP_HOST, smtp_port=SMTP_PORT):
+    """Send one email, returning True on success and False on any failure"""
+    try:
+        deliver_email(to, subject, body, sender_email, app_password, cc=cc, bcc=bcc, pool=pool,
+                      attachments=attachments, attachment_cache=attachment_cache,
+                      smtp_host=smtp_host, smtp_port=smtp_port)
+        return True
+    except Exception:
+        return False
+
+
+class SendEvent:
+    """Something that happened to one row during a run"""
+
+    SKIPPED = 'skipped'
+    DROPPED = 'dropped'
+    ALREADY_SENT = 'already_sent'
+    SIMULATED = 'simulated'
+    DEFERRED = 'deferred'
+    SENT = 'sent'
+    FAILED = 'failed'
+    # Permanently refused (5xx); not retried
+    REJECTED = 'rejected'
+
+    def __init__(self, kind, row, recipient=None, subject=None, body=None, error=None,
+                 message=None, processed=0, elapsed=0.0, reason=None, sender=None, attempts=1):
+        self.kind = kind
+        # 0-based row number in the recipient list
+        self.row = row
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+        self.error = error
+        self.message = message
+        # recipients.INVALID / DUPLICATE / SUPPRESSED (DROPPED only)
+        self.reason = reason
+        # Account the message was sent from (SENT/FAILED only)
+        self.sender = sender
+        # Send attempts made, including retries of transient failures
+        self.attempts = attempts
+        # Rows finished so far, including this one
+        self.processed = processed
+        # Seconds spent sending (SENT/FAILED only)
+        self.elapsed = elapsed
+
+
+# Journal status recorded for each final outcome
+JOURNAL_STATUS = {
+    SendEvent.SENT: SENT,
+    SendEvent.FAILED: FAILED,
+    SendEvent.REJECTED: REJECTED,
+}
+
+
+class CampaignResult:
+    """Totals for a finished run"""
+
+    def __init__(self):
+        self.total = 0
+        self.success = 0
+        self.failed = 0
+        # Failed rows the server refused permanently (also counted in failed)
+        self.rejected = 0
+        # Retries of transient failures and throttling responses seen
+        self.retries = 0
+        self.throttles = 0
+        # Sending rate per account (per rate unit, like send_rate) when the run ended
+        self.final_rate = None
+        self.skipped = 0
+        self.already_sent = 0
+        # Rows left for another day because every account hit its quota
+        self.deferred = 0
+        self.quota_exhausted = False
+        # Stopped on request before every row was read
+        self.cancelled = False
+        # Sender account -> messages sent from it
+        self.accounts = {}
+        # Sender account -> sends left of today's quota when the run ended
+        # (None for accounts without a quota)
+        self.quota_left = {}
+        # Drop reason -> rows removed before sending
+        self.dropped = {INVALID: 0, DUPLICATE: 0, SUPPRESSED: 0}
+        self.pool_stats = None
+        # attachments.AttachmentCache.stats() of runs with attachments
+        self.attachment_stats = None
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'success': self.success,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'final_rate': self.final_rate,
+            'skipped': self.skipped,
+            'already_sent': self.already_sent,
+            'deferred': self.deferred,
+            'quota_exhausted': self.quota_exhausted,
+            'cancelled': self.cancelled,
+            'accounts': self.accounts,
+            'quota_left': self.quota_left,
+            'dropped': self.dropped,
+            'pool_stats': self.pool_stats,
+            'attachment_stats': self.attachment_stats,
+        }
+
+
+class DryRunReport:
+    """Aggregate statistics of a dry run, in place of per-row output"""
+
+    def __init__(self):
+        self.total = 0
+        self.sendable = 0
+        self.empty_email = 0
+        self.missing_email_column = False
+        self.render_seconds = 0.0
+        # Distinct rendered (subject, body) pairs among the sendable rows
+        self.distinct_messages = 0
+        self.unknown_placeholders = []
+        # Drop reason -> rows that would be removed before sending
+        self.dropped = {INVALID: 0, DUPLICATE: 0, SUPPRESSED: 0}
+        # Placeholder -> number of rows where its column is empty
+        self.empty_fields = {}
+        # Attachment path -> rows listing it that would be skipped because
+        # the file is missing, and whether the attachment column is missing
+        self.missing_attachments = {}
+        self.missing_attachment_column = False
+        # Listed path -> rows that would be skipped because it is absolute or
+        # leads outside the attachment folder
+        self.refused_attachments = {}
+        # Rows whose rendered subject contains a line break (skipped when sent)
+        self.subject_line_breaks = 0
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'sendable': self.sendable,
+            'empty_email': self.empty_email,
+            'missing_email_column': self.missing_email_column,
+            'render_seconds': self.render_seconds,
+            'distinct_messages': self.distinct_messages,
+            'unknown_placeholders': self.unknown_placeholders,
+            'dropped': self.dropped,
+            'empty_fields': self.empty_fields,
+            'missing_attachments': self.missing_attachments,
+            'missing_attachment_column': self.missing_attachment_column,
+            'refused_attachments': self.refused_attachments,
+            'subject_line_breaks': self.subject_line_breaks,
+        }
+
+
+class Campaign:
+    """Templates plus sending settings for one run over a recipient list"""
+
+    def __init__(self, subject_template, body_template, email_column='email',
+                 sender_email='', app_password='', cc=None, bcc=None, test_mode=True,
+                 send_rate=30, rate_unit='minute', workers=2, messages_per_connection=100,
+                 journal=None, campaign_id=None, smtp_host=SMTP_HOST, smtp_port=SMTP_PORT,
+                 metrics=None, suppression=None, accounts=None, quota=None,
+                 max_rate=None, max_attempts=3, adaptive=True, transport=None, coalesce_size=1,
+                 attachments=None, attachment_column=None, attachment_dir=None,
+                 attachment_cache_bytes=ATTACHMENT_CACHE_BYTES):
+        self.subject = compile_template(subject_template)
+        self.body = compile_template(body_template)
+        self.email_column = email_column
+        self.sender_email = sender_email
+        self.cc = list(cc or [])
+        self.bcc = list(bcc or [])
+        self.test_mode = test_mode
+        self.send_rate = send_rate
+        self.rate_unit = rate_unit
+        # With adaptive, the rate starts at send_rate, climbs towards max_rate
+        # while the server accepts everything and backs off when it throttles
+        self.max_rate = max_rate
+        self.adaptive = adaptive
+        # Attempts per row before a transient (4xx) failure counts as failed
+        self.max_attempts = max(1, int(max_attempts))
+        self.workers = max(1, int(workers))
+        self.messages_per_connection = int(messages_per_connection)
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        # Optional metrics.RunMetrics receiving per-stage timings
+        self.metrics = metrics
+        # How messages leave: a transports.* instance, by default SMTP with
+        # the connection settings above
+        self.transport = transport
+        # Rows rendering to the same subject and body go out as one message
+        # with up to this many hidden recipients (1 turns coalescing off)
+        self.coalesce_size = max(1, int(coalesce_size))
+        # Files attached to every message, and optionally a column listing
+        # more per row (separated by attachments.PATH_SEPARATOR, relative to
+        # attachment_dir and confined to it). Each file is encoded once per run into a cache
+        # holding up to attachment_cache_bytes of encoded parts
+        self.attachments = [resolve_path(path) for path in attachments or []]
+        self.attachment_column = attachment_column or None
+        self.attachment_dir = attachment_dir or None
+        if self.attachment_column is not None and self.attachment_dir is None:
+            # Rows may only attach files from a folder chosen for them
+            raise ValueError("An attachment folder is required with an attachment column")
+        self.attachment_cache_bytes = attachment_cache_bytes
+        # Sender accounts to shard across; by default just sender_email
+        # (SenderAccount drops the spaces of a pasted app password)
+        self.accounts = list(accounts or [SenderAccount(sender_email, app_password, daily_quota=None)])
+        # Optional journal.QuotaLedger persisting each account's daily usage
+        self.quota = quota
+        # Optional journal.SuppressionList; listed addresses are dropped and
+        # hard bounces of live runs are added to it
+        self.suppression = suppression
+        # With a journal, live runs record every outcome and skip rows already sent
+        self.journal = journal
+        self.campaign_id = campaign_id or campaign_id_for(
+            sender_email, subject_template, body_template, email_column)
+
+    def required_columns(self):
+        """Columns a loader needs to read for this campaign"""
+        columns = required_columns([self.subject, self.body], self.email_column)
+        if self.attachment_column is not None and self.attachment_column not in columns:
+            columns.append(self.attachment_column)
+        return columns
+
+    def missing_attachments(self):
+        """Files attached to every message that can't be found"""
+        return [path for path in self.attachments if not os.path.isfile(path)]
+
+    def _row_paths(self, value):
+        """(paths in attachment_dir, paths refused) listed in one cell of the attachment column"""
+        paths = []
+        refused = []
+        for path in split_paths(value):
+            try:
+                paths.append(confined_path(path, self.attachment_dir))
+            except ValueError:
+                refused.append(path)
+        return tuple(paths), refused
+
+    def _row_attachments(self, values, found):
+        """(attachment paths, missing paths, refused paths) per cell of the attachment column
+
+        Refused paths are absolute or lead outside attachment_dir. found
+        remembers each path checked, so a file listed on many rows is only
+        looked up once per run.
+        """
+        rows = []
+        for value in values:
+            paths, refused = self._row_paths(value)
+            for path in paths:
+                if path not in found:
+                    found[path] = os.path.isfile(path)
+            rows.append((paths, [path for path in paths if not found[path]], refused))
+        return rows
+
+    def check_placeholders(self, columns):
+        """(unknown placeholders, unused columns) for the given data columns"""
+        return check_placeholders([self.subject, self.body], columns)
+
+    def _timed_chunks(self, chunks):
+        # Time spent producing each chunk is loading time for streamed sources
+        iterator = iter(chunks)
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            if self.metrics is not None:
+                self.metrics.record('data_load', time.perf_counter() - started)
+            yield chunk
+
+    def _jobs(self, chunks, result, skipped):
+        # Rows become (row number, recipient, subject, body, attachments)
+        # jobs; rows without a usable address or with a missing attachment
+        # are reported and skipped here
+        screen = RecipientScreen(self.suppression)
+        found_attachments = {}
+        for chunk in self._timed_chunks(chunks):
+            offset = result.total
+            result.total += len(chunk)
+            if self.email_column not in chunk.columns:
+                for idx in range(offset, offset + len(chunk)):
+                    skipped.append(SendEvent(
+                        SendEvent.SKIPPED, idx,
+                        message=f"Email address not found in column '{self.email_column}'"))
+                continue
+            if self.attachment_column is not None and self.attachment_column not in chunk.columns:
+                for idx in range(offset, offset + len(chunk)):
+                    skipped.append(SendEvent(
+                        SendEvent.SKIPPED, idx,
+                        message=f"Attachment column '{self.attachment_column}' not found"))
+                continue
+
+            # Render the whole subject and body columns of the chunk at once
+            started = time.perf_counter()
+            subjects = self.subject.render_frame(chunk).tolist()
+            bodies = self.body.render_frame(chunk).tolist()
+            if self.metrics is not None:
+                self.metrics.record('template_render', time.perf_counter() - started)
+            row_attachments = None
+            if self.attachment_column is not None:
+                row_attachments = self._row_attachments(chunk[self.attachment_column].tolist(),
+                                                        found_attachments)
+
+            # Validate, normalize and dedup the address column before any sending
+            recipients, reasons = screen.screen(chunk[self.email_column])
+            already_sent = set()
+            if self.journal is not None and not self.test_mode:
+                already_sent = self.journal.sent_among(
+                    self.campaign_id, [r for r, reason in zip(recipients, reasons) if reason is None])
+
+            for i, recipient_email in enumerate(recipients):
+                idx = offset + i
+                reason = reasons[i]
+                if reason == EMPTY:
+                    skipped.append(SendEvent(SendEvent.SKIPPED, idx, message="Email address is empty"))
+                    continue
+                if reason is not None:
+                    skipped.append(SendEvent(SendEvent.DROPPED, idx, recipient_email,
+                                             message=DROP_MESSAGES[reason], reason=reason))
+                    continue
+                if already_sent and recipient_key(recipient_email) in already_sent:
+                    skipped.append(SendEvent(SendEvent.ALREADY_SENT, idx, recipient_email,
+                                             message="Already sent in an earlier run"))
+                    continue
+                if '\n' in subjects[i] or '\r' in subjects[i]:
+                    skipped.append(SendEvent(SendEvent.SKIPPED, idx, recipient_email,
+                                             message=SUBJECT_LINE_BREAK_MESSAGE))
+                    continue
+                files = ()
+                if row_attachments is not None:
+                    files, missing, refused = row_attachments[i]
+                    if refused:
+                        skipped.append(SendEvent(SendEvent.SKIPPED, idx, recipient_email,
+                                                 message=f"Attachment outside the attachment folder: {refused[0]}"))
+                        continue
+                    if missing:
+                        skipped.append(SendEvent(SendEvent.SKIPPED, idx, recipient_email,
+                                                 message=f"Attachment not found: {missing[0]}"))
+                        continue
+
+                yield idx, recipient_email, subjects[i], bodies[i], files
+
+    def dry_run(self, chunks, keep_frame=False):
+        """Render every row without sending and return (DryRunReport, frame)
+
+        Nothing is reported per row. With keep_frame the chunks are also
+        concatenated into one compacted DataFrame so pages can be rendered
+        later with render_page; otherwise frame is None.
+        """
+        import pandas as pd
+
+        report = DryRunReport()
+        screen = RecipientScreen(self.suppression)
+        kept = []
+        # Hashes of the distinct rendered (subject, body) pairs that would be sent
+        distinct = set()
+        placeholders = list(dict.fromkeys(self.subject.placeholders + self.body.placeholders))
+        found_attachments = {}
+        for chunk in chunks:
+            report.total += len(chunk)
+            if keep_frame:
+                kept.append(chunk)
+
+            started = time.perf_counter()
+            subjects = self.subject.render_frame(chunk).tolist()
+            bodies = self.body.render_frame(chunk).tolist()
+            report.render_seconds += time.perf_counter() - started
+            report.subject_line_breaks += sum('\n' in subject or '\r' in subject for subject in subjects)
+
+            if self.email_column in chunk.columns:
+                _, reasons = screen.screen(chunk[self.email_column])
+                distinct.update(hash(pair) for pair, reason in zip(zip(subjects, bodies), reasons)
+                                if reason is None)
+            else:
+                report.missing_email_column = True
+
+            if self.attachment_column is not None:
+                if self.attachment_column in chunk.columns:
+                    for _, missing, refused in self._row_attachments(chunk[self.attachment_column].tolist(),
+                                                                     found_attachments):
+                        for path in missing:
+                            report.missing_attachments[path] = report.missing_attachments.get(path, 0) + 1
+                        for path in refused:
+                            report.refused_attachments[path] = report.refused_attachments.get(path, 0) + 1
+                else:
+                    report.missing_attachment_column = True
+
+            columns = {str(column): column for column in chunk.columns}
+            for key in placeholders:
+                if key in columns:
+                    empty_count = int((chunk[columns[key]].astype(str).str.strip() == "").sum())
+                    if empty_count:
+                        report.empty_fields[key] = report.empty_fields.get(key, 0) + empty_count
+                elif key not in report.unknown_placeholders:
+                    report.unknown_placeholders.append(key)
+
+        report.sendable = screen.accepted
+        report.distinct_messages = len(distinct)
+        report.empty_email = screen.dropped[EMPTY]
+        for reason in report.dropped:
+            report.dropped[reason] = screen.dropped[reason]
+
+        frame = None
+        if keep_frame:
+            frame = compact_frame(pd.concat(kept, ignore_index=True)) if kept else pd.DataFrame()
+        return report, frame
+
+    def render_page(self, frame, start, stop):
+        """Render only rows start..stop of a frame as (row, recipient, subject, body, attachments)
+
+        attachments lists the paths of every file the message would carry.
+        """
+        page = frame.iloc[start:stop]
+        subjects = self.subject.render_frame(page).tolist()
+        bodies = self.body.render_frame(page).tolist()
+        if self.email_column in page.columns:
+            recipients = page[self.email_column].tolist()
+        else:
+            recipients = [""] * len(page)
+        attachments = [list(self.attachments)] * len(page)
+        if self.attachment_column is not None and self.attachment_column in page.columns:
+            attachments = [self.attachments + list(self._row_paths(value)[0])
+                           for value in page[self.attachment_column].tolist()]
+        return [
+            (start + i, recipients[i], subjects[i], bodies[i], attachments[i])
+            for i in range(len(page))
+        ]
+
+    def run(self, chunks, on_event=None, stop=None):
+        """Send (or simulate) every row of the DataFrame chunks
+
+        on_event receives a SendEvent per row. Returns a CampaignResult.
+        stop, if given, is a threading.Event; once it is set no more rows
+        are read, sends already started finish and result.cancelled is set.
+        """
+        result = CampaignResult()
+        skipped = deque()
+        processed = 0
+
+        def emit(event):
+            nonlocal processed
+            processed += 1
+            event.processed = processed
+            if event.kind == SendEvent.SKIPPED:
+                result.skipped += 1
+                result.failed += 1
+            elif event.kind == SendEvent.DROPPED:
+                result.dropped[event.reason] += 1
+            elif event.kind == SendEvent.ALREADY_SENT:
+                result.already_sent += 1
+            elif event.kind == SendEvent.DEFERRED:
+                result.deferred += 1
+            elif event.kind == SendEvent.FAILED:
+                result.failed += 1
+            elif event.kind == SendEvent.REJECTED:
+                result.failed += 1
+                result.rejected += 1
+            else:
+                result.success += 1
+            if event.kind == SendEvent.SENT:
+                result.accounts[event.sender] = result.accounts.get(event.sender, 0) + 1
+                if self.quota is not None:
+                    self.quota.add(event.sender)
+            if self.metrics is not None:
+                self.metrics.increment(event.kind)
+            if self.journal is not None and event.kind in JOURNAL_STATUS:
+                self.journal.record(self.campaign_id, event.recipient, event.row,
+                                    JOURNAL_STATUS[event.kind], event.error)
+            if (self.suppression is not None and event.kind == SendEvent.REJECTED
+                    and is_hard_bounce(event.error, event.recipient)):
+                self.suppression.add([event.recipient], BOUNCED, detail=str(event.error))
+            if on_event is not None:
+                on_event(event)
+
+        def flush_skipped():
+            while skipped:
+                emit(skipped.popleft())
+
+        def stopped():
+            if stop is not None and stop.is_set():
+                result.cancelled = True
+            return result.cancelled
+
+        jobs = self._jobs(chunks, result, skipped)
+
+        if self.test_mode:
+            # Dry run: no connection and no rate limiting
+            for idx, recipient_email, subject, body, _ in jobs:
+                flush_skipped()
+                if stopped():
+                    break
+                emit(SendEvent(SendEvent.SIMULATED, idx, recipient_email, subject, body))
+            flush_skipped()
+            return result
+
+        transport = self.transport
+        if transport is None:
+            # Each account keeps one authenticated connection per worker open
+            transport = SMTPTransport(workers=self.workers,
+                                      messages_per_connection=self.messages_per_connection,
+                                      host=self.smtp_host, port=self.smtp_port, metrics=self.metrics)
+        batch_size = transport.batch_size
+        coalesce = self.coalesce_size > 1
+
+        # Files attached to every message are encoded up front (a missing
+        # one fails the run before anything is sent) and held for the run
+        attachment_cache = None
+        shared_parts = []
+        if self.attachments or self.attachment_column is not None:
+            attachment_cache = AttachmentCache(self.attachment_cache_bytes, metrics=self.metrics)
+            try:
+                shared_parts = [attachment_cache.part(path) for path in self.attachments]
+            except OSError:
+                transport.close()
+                raise
+
+        # Sends go round-robin to accounts with quota left
+        used = {}
+        if self.quota is not None:
+            used = {account.email: self.quota.used(account.email) for account in self.accounts}
+        accounts = AccountPool(self.accounts, used=used, cc=self.cc, bcc=self.bcc,
+                               bcc_header=transport.bcc_in_headers)
+        # The rate limit applies per account, so the shared bucket scales with
+        # them; a whole batch may be started at once
+        scale = len(self.accounts) / (1.0 if self.rate_unit == "second" else 60.0)
+        limiter = TokenBucket(self.send_rate * scale, capacity=max(batch_size, self.coalesce_size))
+        controller = None
+        if self.adaptive:
+            controller = AdaptiveRate(limiter, max_rate=(self.max_rate or self.send_rate) * scale)
+
+        # Rows whose recipient was refused with a temporary error; their
+        # retry goes to that address alone, not again to the CC and BCC
+        # addresses or the rest of a coalesced group that accepted it
+        refused_rows = set()
+        refused_lock = threading.Lock()
+
+        def send_job(batch):
+            # A batch is a list of (row, recipient, subject, body, attachments)
+            # jobs; it returns (sender account, [(job, error or None)]) and
+            # raises PartialFailure with the jobs to retry when some of its
+            # recipients were refused with a temporary error
+            with refused_lock:
+                retrying = {job[0] for job in batch if job[0] in refused_rows}
+            with accounts.lease(len(batch)) as account:
+                factory = accounts.factories[account.email]
+                groups = group_identical(batch, self.coalesce_size) if coalesce else [[job] for job in batch]
+                messages = []
+                errors = [None] * len(groups)
+                built = []
+                for position, group in enumerate(groups):
+                    _, recipient_email, subject, body, files = group[0]
+                    started = time.perf_counter()
+                    try:
+                        parts = shared_parts
+                        if files:
+                            parts = shared_parts + [attachment_cache.part(path) for path in files]
+                        if len(group) == 1:
+                            message, mail_options = factory.build(recipient_email, subject, body, parts)
+                            envelope = factory.envelope(recipient_email)
+                        else:
+                            recipients = [job[1] for job in group]
+                            message, mail_options = factory.build_group(recipients, subject, body, parts)
+                            envelope = factory.group_envelope(recipients)
+                        if all(job[0] in retrying for job in group):
+                            envelope = [job[1] for job in group]
+                    except (OSError, HeaderParseError) as e:
+                        # An attachment removed since it was checked, or a
+                        # header that would inject others: only these rows fail
+                        errors[position] = e
+                        continue
+                    if self.metrics is not None:
+                        self.metrics.record('mime_build', time.perf_counter() - started)
+                    messages.append((envelope, message, mail_options))
+                    built.append(position)
+                if messages:
+                    for position, error in zip(built, transport.send(account, messages)):
+                        errors[position] = error
+            # A refusal only comes back here when other recipients of the
+            # message were accepted; temporary ones are retried like a
+            # failed send
+            done, retry, refused = [], [], {}
+            for group, error in zip(groups, errors):
+                for job in group:
+                    job_error = recipient_error(job[1], error)
+                    if (isinstance(job_error, smtplib.SMTPRecipientsRefused)
+                            and transport.classify(job_error) != PERMANENT):
+                        retry.append(job)
+                        refused.update(job_error.recipients)
+                    else:
+                        done.append((job, job_error))
+            if not retry:
+                return account.email, done
+            with refused_lock:
+                refused_rows.update(job[0] for job in retry)
+            raise PartialFailure((account.email, done), retry, smtplib.SMTPRecipientsRefused(refused))
+
+        def batches(jobs):
+            # Stop reading rows once no account can send today; they are
+            # picked up by the next run through the journal
+            batch = []
+            for job in jobs:
+                if stopped():
+                    return
+                if accounts.exhausted(batch_size):
+                    result.quota_exhausted = True
+                    break
+                batch.append(job)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        def coalesced(jobs):
+            # One batch per run of identical messages. Groups wait until they
+            # are full; past COALESCE_BUFFER_ROWS held rows the oldest group is
+            # sent as it is, so unique messages don't wait for the whole list
+            groups = OrderedDict()
+            held = 0
+            for job in jobs:
+                if stopped():
+                    # Held groups are left unsent along with the unread rows
+                    return
+                if accounts.exhausted():
+                    result.quota_exhausted = True
+                    break
+                key = job[2:]
+                group = groups.setdefault(key, [])
+                group.append(job)
+                held += 1
+                if len(group) >= self.coalesce_size:
+                    del groups[key]
+                    held -= len(group)
+                    yield group
+                elif held > COALESCE_BUFFER_ROWS:
+                    _, oldest = groups.popitem(last=False)
+                    held -= len(oldest)
+                    yield oldest
+            yield from groups.values()
+
+        def retry_after(outcome):
+            # Transient failures go back on the queue with a jittered backoff;
+            # throttling also slows everyone down
+            if self.metrics is not None:
+                self.metrics.record('rate_limit_wait', outcome.waited)
+            if isinstance(outcome.error, QuotaExhausted):
+                return None
+            kind = transport.classify(outcome.error)
+            if kind == THROTTLED:
+                result.throttles += 1
+                if controller is not None:
+                    controller.throttled()
+            if kind == PERMANENT or outcome.attempts >= self.max_attempts:
+                return None
+            result.retries += 1
+            if self.metrics is not None:
+                self.metrics.increment('retries')
+            return backoff_delay(outcome.attempts)
+
+        def failure_kind(error):
+            return SendEvent.REJECTED if transport.classify(error) == PERMANENT else SendEvent.FAILED
+
+        # Coalescing makes one SMTP transaction per group; batching transports
+        # merge identical messages within each batch instead
+        units = coalesced(jobs) if coalesce and batch_size == 1 else batches(jobs)
+
+        try:
+            for outcome in send_concurrently(units, send_job, workers=self.workers * len(self.accounts),
+                                             limiter=limiter, retry=retry_after, cost=len):
+                flush_skipped()
+                throttles = transport.take_throttles()
+                if throttles:
+                    result.throttles += throttles
+                    if controller is not None:
+                        controller.throttled()
+                if outcome.ok:
+                    if self.metrics is not None:
+                        self.metrics.record('rate_limit_wait', outcome.waited)
+                    sender, job_errors = outcome.value
+                    if controller is not None and not throttles and outcome.failed_part is None:
+                        controller.succeeded()
+                    for (idx, recipient_email, subject, body, _), error in job_errors:
+                        if error is None:
+                            emit(SendEvent(SendEvent.SENT, idx, recipient_email, subject, body,
+                                           elapsed=outcome.elapsed, sender=sender, attempts=outcome.attempts))
+                        else:
+                            emit(SendEvent(failure_kind(error), idx, recipient_email, subject, body,
+                                           error=error, elapsed=outcome.elapsed, attempts=outcome.attempts))
+                    continue
+                for idx, recipient_email, subject, body, _ in outcome.job:
+                    if isinstance(outcome.error, QuotaExhausted):
+                        result.quota_exhausted = True
+                        emit(SendEvent(SendEvent.DEFERRED, idx, recipient_email, subject, body,
+                                       message=str(outcome.error)))
+                    else:
+                        error = recipient_error(recipient_email, outcome.error) or outcome.error
+                        emit(SendEvent(failure_kind(error), idx, recipient_email, subject, body,
+                                       error=error, elapsed=outcome.elapsed, attempts=outcome.attempts))
+            flush_skipped()
+        finally:
+            transport.close()
+            result.pool_stats = transport.stats()
+            result.final_rate = limiter.rate / scale
+            result.quota_left = {email: None if left == float('inf') else left
+                                 for email, left in accounts.remaining().items()}
+            if attachment_cache is not None:
+                result.attachment_stats = attachment_cache.stats()
+        return result
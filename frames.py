@@ -0,0 +1,61 @@
+"""In-memory form of loaded recipient lists
+
+Recipient lists are held as one DataFrame, column by column, and the
+sender reads them a chunk at a time (see engine.Campaign._jobs). Columns
+that repeat a few values over many rows (a company, a city, a greeting)
+are stored as categoricals: one small integer code per row plus each
+distinct value once.
+"""
+
+# Text columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def compact_frame(frame, max_unique_ratio=CATEGORY_MAX_UNIQUE_RATIO):
+    """Return the frame with its repetitive text columns as categoricals
+
+    Object columns mixing types (numbers next to the "" that replaced
+    blanks) first become their str() values: Python objects cost the most
+    memory, and Arrow, which st.dataframe and Parquet use, needs one type
+    per column. str() of every cell, which is what templates render, is
+    unchanged.
+    """
+    import pandas as pd
+
+    compacted = frame.copy()
+    changed = False
+    for position in range(len(frame.columns)):
+        values = frame.iloc[:, position]
+        if values.dtype == object and values.map(type).nunique() > 1:
+            values = values.astype(str)
+            changed = True
+        elif not (values.dtype == object or isinstance(values.dtype, pd.StringDtype)):
+            continue
+        if len(values) > 1 and values.nunique(dropna=False) <= len(values) * max_unique_ratio:
+            values = values.astype('category')
+            changed = True
+        compacted.isetitem(position, values)
+    return compacted if changed else frame
+
+
+def column_key(name):
+    """What column names are matched on: 'Email', ' email' and 'EMAIL' are one column"""
+    return str(name).strip().casefold()
+
+
+def wanted_columns(header, columns=None):
+    """The names in header to read for the given columns (all when None)
+
+    Matched on column_key, the rule loaders.merge_frames aligns sources
+    with, so a sheet headed 'Email' is read for a campaign whose column is
+    'email'. The header's own spelling is kept.
+    """
+    if columns is None:
+        return list(header)
+    keys = {column_key(column) for column in columns}
+    return [name for name in header if column_key(name) in keys]
+
+
+def frame_bytes(frame):
+    """Memory held by a frame, counting the Python strings it refers to"""
+    return int(frame.memory_usage(index=True, deep=True).sum())
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import threading
+import time
+
+# The Google libraries are imported when a client is first built, so a
+# local Excel source or an SMTP-only run never loads them
+
+SHEETS_SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+GMAIL_SEND_SCOPES = ['https://www.googleapis.com/auth/gmail.send']
+
+DEFAULT_TTL_SECONDS = 30 * 60
+
+
+def credentials_key(creds_json, scopes, kind):
+    """Hash of the credentials text, scopes and client kind used as the cache key"""
+    digest = hashlib.sha256()
+    digest.update(creds_json.encode('utf-8'))
+    digest.update('\0'.join(sorted(scopes)).encode('utf-8'))
+    digest.update(kind.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def build_thread_safe(service_name, version, creds):
+    """A discovery service that may be used from several threads at once
+
+    httplib2 connections are not thread-safe, so each thread sends this
+    service's requests over its own authorized connection, kept for that
+    thread's later requests.
+    """
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+    from googleapiclient.http import HttpRequest
+
+    local = threading.local()
+
+    def request_builder(http, *args, **kwargs):
+        if getattr(local, 'http', None) is None:
+            local.http = AuthorizedHttp(creds, http=httplib2.Http())
+        return HttpRequest(local.http, *args, **kwargs)
+
+    return build(service_name, version, credentials=creds, requestBuilder=request_builder,
+                 cache_discovery=False)
+
+
+def _credentials_info(creds_json):
+    # Raises json.JSONDecodeError for malformed JSON, like the loaders expect
+    return json.loads(creds_json)
+
+
+class ClientCache:
+    """Authorized Google API clients reused across loads and Streamlit reruns
+
+    Clients are keyed by a hash of the service account JSON and scopes so the
+    JSON parsing, credential creation and Drive discovery build only happen
+    once per key. Each client keeps its HTTP transport, and expired tokens are
+    refreshed in place. Entries unused for ttl seconds are dropped.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now):
+        expired = [key for key, (_, _, last_used) in self._entries.items()
+                   if now - last_used > self.ttl]
+        for key in expired:
+            del self._entries[key]
+
+    @staticmethod
+    def _refresh_if_needed(creds):
+        if creds.token is not None and not creds.valid:
+            from google.auth.transport.requests import Request
+            creds.refresh(Request())
+
+    def _get(self, creds_json, scopes, kind, factory):
+        key = credentials_key(creds_json, scopes, kind)
+        with self._lock:
+            now = self._clock()
+            self._evict_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                client, creds, _ = entry
+                self._entries[key] = (client, creds, now)
+        if entry is not None:
+            self._refresh_if_needed(creds)
+            return client
+
+        from google.oauth2.service_account import Credentials as ServiceCredentials
+
+        creds = ServiceCredentials.from_service_account_info(_credentials_info(creds_json), scopes=scopes)
+        client = factory(creds)
+        with self._lock:
+            self._entries[key] = (client, creds, self._clock())
+        return client
+
+    def sheets_client(self, creds_json, scopes=SHEETS_SCOPES):
+        """gspread client for the service account"""
+        import gspread
+        return self._get(creds_json, scopes, 'sheets', gspread.authorize)
+
+    def drive_service(self, creds_json, scopes=DRIVE_SCOPES):
+        """Drive v3 service for the service account, safe to share between load threads"""
+        return self._get(creds_json, scopes, 'drive', lambda creds: build_thread_safe('drive', 'v3', creds))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def gmail_credentials(creds_json, sender_email, scopes=GMAIL_SEND_SCOPES):
+    """Credentials that may send as sender_email through the Gmail API
+
+    Accepts either an OAuth authorized-user JSON (the token saved after a
+    user consented) or a service account JSON with domain-wide delegation,
+    which then impersonates sender_email.
+    """
+    info = _credentials_info(creds_json)
+    if info.get('type') == 'service_account':
+        from google.oauth2.service_account import Credentials as ServiceCredentials
+        creds = ServiceCredentials.from_service_account_info(info, scopes=scopes)
+        return creds.with_subject(sender_email)
+    from google.oauth2.credentials import Credentials as UserCredentials
+    return UserCredentials.from_authorized_user_info(info, scopes=scopes)
+
+
+def check_gmail_senders(creds_json, senders, accounts_json=None):
+    """Raise ValueError unless every sender can send as itself
+
+    An OAuth token always sends as the user who authorized it (userId
+    'me'), so one token can't serve several senders: with more than one,
+    creds_json must be a service account with domain-wide delegation, or
+    each sender needs its own token in accounts_json.
+    """
+    accounts_json = accounts_json or {}
+    shared = [email for email in dict.fromkeys(senders) if email not in accounts_json]
+    if len(shared) > 1 and json.loads(creds_json).get('type') != 'service_account':
+        raise ValueError(
+            f"An OAuth token sends only as the account that authorized it, so it can't send for "
+            f"{', '.join(shared)}. Use a service account with domain-wide delegation to send from several accounts")
+
+
+def gmail_service_factory(creds_json, accounts_json=None, senders=()):
+    """service_factory for transports.GmailAPITransport
+
+    Credentials are created once per account and shared; every call builds
+    a new service (from the bundled discovery document, so no request is
+    made) because each worker thread needs its own HTTP transport.
+    accounts_json optionally maps sender emails to their own credentials.
+    The senders the run will use are checked with check_gmail_senders.
+    """
+    accounts_json = accounts_json or {}
+    check_gmail_senders(creds_json, senders, accounts_json)
+    credentials = {}
+    lock = threading.Lock()
+
+    def factory(account):
+        with lock:
+            creds = credentials.get(account.email)
+            if creds is None:
+                creds = credentials[account.email] = gmail_credentials(
+                    accounts_json.get(account.email, creds_json), account.email)
+        from googleapiclient.discovery import build
+        return build('gmail', 'v1', credentials=creds, cache_discovery=False)
+
+    return factory
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.expanduser('~'), '.mail_sender', 'journal.sqlite3')
+
+SENT = 'sent'
+FAILED = 'failed'
+# Permanently refused (5xx); kept apart from failures worth retrying
+REJECTED = 'rejected'
+
+# Reasons an address is on the suppression list
+UNSUBSCRIBED = 'unsubscribed'
+BOUNCED = 'bounced'
+
+# Stay well below SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+
+def campaign_id_for(sender_email, subject_template, body_template, email_column):
+    """Stable default campaign ID: the same templates and sender resume the same campaign"""
+    digest = hashlib.sha1()
+    for part in (sender_email, subject_template, body_template, str(email_column)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:12]
+
+
+def recipient_key(recipient):
+    """Journal key for an address (addresses are case-insensitive in practice)"""
+    return str(recipient).strip().lower()
+
+
+def _connect(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Stores are opened by the page and then used by the send worker's
+    # thread; each is only ever used by one thread at a time
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def _select_among(connection, query, params, keys):
+    """Run query once per batch of keys; it must end with 'IN ({placeholders})'"""
+    found = set()
+    for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        batch = keys[start:start + LOOKUP_BATCH_SIZE]
+        cursor = connection.execute(query.format(placeholders=','.join('?' * len(batch))),
+                                    list(params) + batch)
+        found.update(key for (key,) in cursor)
+    return found
+
+
+class SendJournal:
+    """SQLite record of every row's outcome, keyed by campaign and recipient
+
+    Each outcome is committed as soon as it is known, so a run that dies
+    halfway can be restarted and skip everything already sent. Lookups go
+    through the (campaign, recipient) primary key.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.connection = _connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS sends ('
+            ' campaign TEXT NOT NULL,'
+            ' recipient TEXT NOT NULL,'
+            ' row INTEGER,'
+            ' status TEXT NOT NULL,'
+            ' error TEXT,'
+            ' updated_at REAL NOT NULL,'
+            ' PRIMARY KEY (campaign, recipient))'
+        )
+        self.connection.commit()
+
+    def record(self, campaign, recipient, row, status, error=None):
+        """Store the outcome of one row, replacing any earlier attempt"""
+        self.connection.execute(
+            'INSERT OR REPLACE INTO sends (campaign, recipient, row, status, error, updated_at)'
+            ' VALUES (?, ?, ?, ?, ?, ?)',
+            (campaign, recipient_key(recipient), row, status,
+             None if error is None else str(error), time.time())
+        )
+        self.connection.commit()
+
+    def sent_among(self, campaign, recipients):
+        """Return the keys of the given recipients already sent in this campaign"""
+        keys = list({recipient_key(recipient) for recipient in recipients})
+        return _select_among(
+            self.connection,
+            'SELECT recipient FROM sends WHERE campaign = ? AND status = ?'
+            ' AND recipient IN ({placeholders})',
+            (campaign, SENT), keys
+        )
+
+    def counts(self, campaign):
+        """{status: number of recipients} for a campaign"""
+        cursor = self.connection.execute(
+            'SELECT status, COUNT(*) FROM sends WHERE campaign = ? GROUP BY status', (campaign,)
+        )
+        return dict(cursor.fetchall())
+
+    def forget(self, campaign):
+        """Delete a campaign's records so the next run starts from scratch; returns how many"""
+        cursor = self.connection.execute('DELETE FROM sends WHERE campaign = ?', (campaign,))
+        self.connection.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.connection.close()
+
+
+class SuppressionList:
+    """Addresses that are never mailed again, whatever the campaign
+
+    Holds unsubscribes and hard bounces. It lives in the same SQLite file
+    as the send journal by default, keyed by the normalized address.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.connection = _connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS suppressions ('
+            ' recipient TEXT PRIMARY KEY,'
+            ' reason TEXT NOT NULL,'
+            ' detail TEXT,'
+            ' added_at REAL NOT NULL)'
+        )
+        self.connection.commit()
+
+    def add(self, recipients, reason=UNSUBSCRIBED, detail=None):
+        """Suppress addresses; returns how many were given"""
+        now = time.time()
+        rows = [(recipient_key(recipient), reason, detail, now)
+                for recipient in recipients if str(recipient).strip()]
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO suppressions (recipient, reason, detail, added_at)'
+            ' VALUES (?, ?, ?, ?)', rows
+        )
+        self.connection.commit()
+        return len(rows)
+
+    def remove(self, recipients):
+        """Mail addresses again, e.g. after a re-subscribe; returns how many were on the list"""
+        cursor = self.connection.executemany(
+            'DELETE FROM suppressions WHERE recipient = ?',
+            [(recipient_key(recipient),) for recipient in recipients if str(recipient).strip()]
+        )
+        self.connection.commit()
+        return cursor.rowcount
+
+    def suppressed_among(self, recipients):
+        """Return the keys of the given recipients that are suppressed"""
+        keys = list({recipient_key(recipient) for recipient in recipients})
+        return _select_among(
+            self.connection,
+            'SELECT recipient FROM suppressions WHERE recipient IN ({placeholders})', (), keys
+        )
+
+    def counts(self):
+        """{reason: number of addresses}"""
+        cursor = self.connection.execute('SELECT reason, COUNT(*) FROM suppressions GROUP BY reason')
+        return dict(cursor.fetchall())
+
+    def close(self):
+        self.connection.close()
+
+
+def quota_day(timestamp=None):
+    """The UTC calendar day quota usage is counted against"""
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+class QuotaLedger:
+    """Messages sent per sender account per UTC day
+
+    Persisted so that a second run on the same day starts from what the
+    first one already used.
+    """
+
+    def __init__(self, path=DEFAULT_JOURNAL_PATH):
+        self.path = path
+        self.connection = _connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS quota ('
+            ' account TEXT NOT NULL,'
+            ' day TEXT NOT NULL,'
+            ' sent INTEGER NOT NULL,'
+            ' PRIMARY KEY (account, day))'
+        )
+        self.connection.commit()
+
+    def used(self, account, day=None):
+        cursor = self.connection.execute(
+            'SELECT sent FROM quota WHERE account = ? AND day = ?',
+            (recipient_key(account), day or quota_day())
+        )
+        row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def add(self, account, count=1, day=None):
+        self.connection.execute(
+            'INSERT INTO quota (account, day, sent) VALUES (?, ?, ?)'
+            ' ON CONFLICT (account, day) DO UPDATE SET sent = sent + excluded.sent',
+            (recipient_key(account), day or quota_day(), count)
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,621 @@
+import io
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from frames import compact_frame, column_key, wanted_columns
+from recipient_cache import source_key, content_version, file_version
+from recipients import normalize_addresses, address_keys
+
+# pandas and each source's libraries (openpyxl, gspread, the Google API
+# client) are imported by the functions that need them, so starting the
+# app or the CLI doesn't pay for sources that are never selected
+
+DEFAULT_CHUNK_SIZE = 5000
+# Sources load_sources loads at the same time
+DEFAULT_LOAD_WORKERS = 8
+
+DRIVE_SHARE_STEPS = """
+1. Open the file in Google Drive
+2. Click the "Share" button
+3. Add the service account email address (shown above)
+4. Set permission to "Viewer" and send
+"""
+
+SHEETS_SHARE_STEPS = """
+1. Open the spreadsheet
+2. Click the "Share" button in the top right
+3. Add the service account email address (shown above)
+4. Set permission to "Viewer" and send
+"""
+
+
+class LoadError(Exception):
+    """A recipient list could not be loaded
+
+    message says what went wrong, hint how to fix it, and fix_steps (if any)
+    is a numbered markdown list of steps.
+    """
+
+    def __init__(self, message, hint=None, fix_steps=None):
+        super().__init__(message)
+        self.message = message
+        self.hint = hint
+        self.fix_steps = fix_steps
+
+
+def _cell_value(cell):
+    """A cell's value as pandas' openpyxl reader gives it, blanks and errors as ""
+
+    Whole numbers stored as floats become ints (12345, not 12345.0).
+    """
+    value = cell.value
+    if value is None or cell.data_type == 'e':
+        return ""
+    if cell.data_type == 'n' and value == int(value):
+        return int(value)
+    return value
+
+
+def _sheet_value(value):
+    """A formatted Sheets cell as get_all_records gives it, whole floats as ints like _cell_value
+
+    Plain numbers ("1234", "1,234") become numbers; dates, percents and
+    currencies keep the text the sheet shows ("5/1/2024", "15%", "$5.00").
+    """
+    from gspread.utils import numericise
+
+    value = numericise(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _dedup_names(names):
+    """Repeated column names numbered like pandas does: a, a.1, a.2"""
+    counts = {}
+    deduped = []
+    for name in names:
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        deduped.append(name)
+        counts[name] = count + 1
+    return deduped
+
+
+class ExcelStream:
+    """Read an .xlsx sheet lazily in bounded DataFrame chunks
+
+    Uses openpyxl's read-only mode, so only one chunk of rows is held in
+    memory at a time. When columns are given only those are kept; the rest
+    of each row is discarded as soon as it is parsed. Column names and
+    values are the ones load_excel_data gives for the same sheet, except
+    that cells right of the last header are not read.
+    """
+
+    def __init__(self, source, sheet_name, columns=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        from openpyxl import load_workbook
+
+        self.chunk_size = max(1, chunk_size)
+        self.workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            if sheet_name not in self.workbook.sheetnames:
+                # Same wording as pandas so callers can handle both alike
+                raise ValueError(f"Worksheet named '{sheet_name}' not found")
+            self.worksheet = self.workbook[sheet_name]
+
+            header_row = next(self.worksheet.iter_rows(min_row=1, max_row=1), ())
+            header_row = [_cell_value(cell) for cell in header_row]
+            while header_row and header_row[-1] == "":
+                header_row.pop()
+            if not header_row:
+                raise ValueError("Excel file is empty")
+            self.header = _dedup_names([
+                str(value) if value != "" else f"Unnamed: {index}"
+                for index, value in enumerate(header_row)
+            ])
+
+            wanted = set(wanted_columns(self.header, columns))
+            self._indices = [index for index, name in enumerate(self.header) if name in wanted]
+            self.columns = [self.header[index] for index in self._indices]
+        except Exception:
+            self.workbook.close()
+            raise
+
+        # The sheet dimension is only a hint in read-only mode and may be missing
+        max_row = self.worksheet.max_row
+        self.total_rows = max_row - 1 if max_row else None
+
+    def _rows(self):
+        # Blank rows are kept like pandas keeps them, except trailing ones,
+        # so row numbers match load_excel_data
+        blank_rows = 0
+        for cells in self.worksheet.iter_rows(min_row=2):
+            values = [_cell_value(cell) for cell in cells]
+            if all(value == "" for value in values):
+                blank_rows += 1
+                continue
+            for _ in range(blank_rows):
+                yield [""] * len(self._indices)
+            blank_rows = 0
+            yield [values[index] if index < len(values) else "" for index in self._indices]
+
+    def __iter__(self):
+        import pandas as pd
+
+        chunk = []
+        for row in self._rows():
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield pd.DataFrame(chunk, columns=self.columns)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=self.columns)
+
+    def close(self):
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+DEFAULT_SHEET_BLOCK_ROWS = 10000
+
+
+def _column_letter(number):
+    """1-based column number to its A1 letters (1 -> A, 27 -> AA)"""
+    letters = ""
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _contiguous_groups(indices):
+    groups = []
+    for index in indices:
+        if groups and groups[-1][-1] == index - 1:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+    return groups
+
+
+class SheetStream:
+    """Fetch only the needed columns of a Google Sheets worksheet, in row blocks
+
+    The header row is read first; each block is then requested with a single
+    batch_get holding one range per run of adjacent wanted columns. Values
+    are read as get_all_records read them: formatted as the sheet shows
+    them, with plain numbers turned into numbers. Blank rows are kept
+    except trailing ones, as ExcelStream reads them. Paging stops at
+    the first block that comes back empty.
+    """
+
+    def __init__(self, worksheet, columns=None, block_rows=DEFAULT_SHEET_BLOCK_ROWS):
+        self.worksheet = worksheet
+        self.block_rows = max(1, block_rows)
+        header = [str(value) for value in worksheet.row_values(1)]
+        # Repeated names are numbered as ExcelStream numbers them; columns
+        # without a name are still left out
+        self.header = [name if raw else "" for raw, name in zip(header, _dedup_names(header))]
+        wanted = set(wanted_columns(self.header, columns))
+        self._indices = [index for index, name in enumerate(self.header) if name and name in wanted]
+        self.columns = [self.header[index] for index in self._indices]
+        self.total_rows = max(0, worksheet.row_count - 1) if worksheet.row_count else None
+
+    def _fetch_block(self, first_row, last_row):
+        groups = _contiguous_groups(self._indices)
+        ranges = [
+            f"{_column_letter(group[0] + 1)}{first_row}:{_column_letter(group[-1] + 1)}{last_row}"
+            for group in groups
+        ]
+        results = self.worksheet.batch_get(ranges, major_dimension='COLUMNS',
+                                           value_render_option='FORMATTED_VALUE',
+                                           date_time_render_option='FORMATTED_STRING')
+
+        size = last_row - first_row + 1
+        columns = []
+        for group, value_range in zip(groups, results):
+            values = list(value_range)
+            for position in range(len(group)):
+                column = values[position] if position < len(values) else []
+                # Trailing empty cells are omitted by the API
+                column = [_sheet_value(value) for value in column]
+                columns.append(column + [""] * (size - len(column)))
+        return columns
+
+    def __iter__(self):
+        import pandas as pd
+
+        if not self._indices:
+            return
+        last_row = self.worksheet.row_count
+        first_row = 2
+        # Blank rows held back until a later row shows they aren't trailing
+        blank_rows = 0
+        while first_row <= last_row:
+            block_end = min(first_row + self.block_rows - 1, last_row)
+            columns = self._fetch_block(first_row, block_end)
+            rows = []
+            for row in zip(*columns):
+                if all(value == "" for value in row):
+                    blank_rows += 1
+                    continue
+                rows.extend([("",) * len(row)] * blank_rows)
+                blank_rows = 0
+                rows.append(row)
+            if not rows:
+                break
+            # object, so a column of 5.5 and 1234 doesn't turn 1234 into 1234.0
+            yield pd.DataFrame(rows, columns=self.columns, dtype=object)
+            first_row = block_end + 1
+
+    def read_all(self):
+        """Concatenate every block into one (compacted) DataFrame"""
+        import pandas as pd
+
+        blocks = list(self)
+        if not blocks:
+            return pd.DataFrame(columns=self.columns)
+        return compact_frame(pd.concat(blocks, ignore_index=True))
+
+
+def extract_file_id_from_url(url):
+    """Extract file ID from various Google Drive URL formats"""
+    if not url:
+        return None
+    
+    # Pattern 1: /file/d/{FILE_ID}/
+    pattern1 = r'/file/d/([a-zA-Z0-9_-]+)'
+    match = re.search(pattern1, url)
+    if match:
+        return match.group(1)
+    
+    # Pattern 2: ?id={FILE_ID}
+    pattern2 = r'[?&]id=([a-zA-Z0-9_-]+)'
+    match = re.search(pattern2, url)
+    if match:
+        return match.group(1)
+    
+    # Pattern 3: /d/{FILE_ID}/
+    pattern3 = r'/d/([a-zA-Z0-9_-]+)'
+    match = re.search(pattern3, url)
+    if match:
+        return match.group(1)
+    
+    return None
+
+
+def _excel_value_error(error, sheet_name):
+    error_msg = str(error)
+    if "Worksheet named" in error_msg:
+        return LoadError(f"Sheet '{sheet_name}' not found",
+                         "Check that the sheet name is correct (case-sensitive)")
+    return LoadError(f"Excel Format Error: {error_msg}",
+                     "Please check that your Excel file is in the correct format")
+
+
+def _read_excel_frame(source, sheet_name, metrics=None):
+    import pandas as pd
+
+    if hasattr(source, 'getvalue'):
+        # Uploads are read from their own copy, so several tabs of one
+        # upload can be parsed at once without sharing a file position
+        source = io.BytesIO(source.getvalue())
+    
+    # Read Excel file with pandas. Cells keep their own types (no 12345.0
+    # for a number column with blanks) and text such as "NA" is not taken
+    # as missing, as ExcelStream reads them
+    started = time.perf_counter()
+    df = pd.read_excel(source, sheet_name=sheet_name, engine='openpyxl', dtype=object, keep_default_na=False)
+    df.columns = [str(column) for column in df.columns]
+    if metrics is not None:
+        metrics.record('data_load', time.perf_counter() - started)
+    
+    # Check if dataframe is empty
+    if df.empty:
+        raise LoadError("Excel file is empty", "Please ensure the Excel file contains data")
+    
+    # Convert NaN values to empty strings for consistency (vectorized)
+    started = time.perf_counter()
+    df = df.fillna("")
+    if metrics is not None:
+        metrics.record('nan_cleanup', time.perf_counter() - started)
+    return compact_frame(df)
+
+
+def _excel_source(excel_file, sheet_name):
+    """(source key, version) of a local Excel path or an uploaded file"""
+    if isinstance(excel_file, (str, os.PathLike)):
+        return source_key('excel', os.path.abspath(excel_file), sheet_name), file_version(excel_file)
+    return (source_key('upload', getattr(excel_file, 'name', ''), sheet_name),
+            content_version(excel_file.getvalue()))
+
+
+def _spreadsheet_version(client_cache, creds_json, spreadsheet_id):
+    """Drive revision of a spreadsheet, or None when Drive can't tell"""
+    from googleapiclient.errors import HttpError
+
+    try:
+        metadata = client_cache.drive_service(creds_json).files().get(
+            fileId=spreadsheet_id, fields='version,modifiedTime'
+        ).execute()
+    except HttpError:
+        # e.g. the Drive API is not enabled for the project
+        return None
+    return metadata.get('version') or metadata.get('modifiedTime')
+
+
+def _load_through_cache(recipient_cache, source, version, load, columns=None, metrics=None):
+    """The cached frame for this version of the source, or load() it and cache it
+
+    Nothing is cached without a version, or when load() only reads some
+    columns; a cached frame can still be read back for any columns.
+    """
+    if recipient_cache is None or version is None:
+        return load()
+    started = time.perf_counter()
+    data = recipient_cache.get(source, version, columns=columns)
+    if data is not None:
+        if metrics is not None:
+            metrics.record('data_load', time.perf_counter() - started)
+        return data
+    data = load()
+    if columns is None:
+        try:
+            data = recipient_cache.put(source, version, data)
+        except (OSError, ValueError, TypeError):
+            # A full disk or an unstorable column only costs the next load
+            pass
+    return data
+
+
+def load_google_drive_excel(creds_json, file_url, sheet_name, drive_cache, client_cache, metrics=None,
+                            recipient_cache=None):
+    """Load Excel data from Google Drive through the local download cache
+
+    With a recipient_cache, the parsed sheet of an unchanged file (same
+    checksum) is read back from it without downloading or parsing.
+    """
+    from googleapiclient.errors import HttpError
+
+    # Extract file ID from URL
+    file_id = extract_file_id_from_url(file_url)
+    if not file_id:
+        raise LoadError("Invalid Google Drive URL",
+                        "Please use a valid Google Drive file URL (e.g., https://drive.google.com/file/d/FILE_ID/view)")
+    
+    try:
+        # Drive service (built once per service account and reused across reruns)
+        service = client_cache.drive_service(creds_json)
+        
+        metadata = drive_cache.metadata(service, file_id)
+        
+        # Download file (skipped when the cached copy is still current)
+        return _load_through_cache(
+            recipient_cache, source_key('drive', file_id, sheet_name), drive_cache.version(metadata),
+            lambda: _read_excel_frame(drive_cache.fetch(service, file_id, metadata), sheet_name, metrics),
+            metrics=metrics
+        )
+    except LoadError:
+        raise
+    except json.JSONDecodeError as e:
+        raise LoadError(f"JSON Format Error: {str(e)}",
+                        "Please check that your service account JSON is in the correct format")
+    except HttpError as e:
+        if e.resp.status == 404:
+            raise LoadError("File not found", "Check that the file ID is correct and the file exists")
+        elif e.resp.status == 403:
+            raise LoadError("Access permission denied", fix_steps=DRIVE_SHARE_STEPS)
+        raise LoadError(f"Google Drive API Error: {str(e)}")
+    except ValueError as e:
+        raise _excel_value_error(e, sheet_name)
+    except Exception as e:
+        raise LoadError(f"Unexpected Error: {type(e).__name__}: {str(e)}",
+                        "Please review your settings based on the error details")
+
+
+def load_excel_data(excel_file, sheet_name, metrics=None, recipient_cache=None):
+    """Load data from an uploaded Excel file or a local path
+
+    With a recipient_cache, a file whose bytes were loaded before is read
+    back from it instead of being parsed again.
+    """
+    try:
+        if recipient_cache is None:
+            return _read_excel_frame(excel_file, sheet_name, metrics)
+        source, version = _excel_source(excel_file, sheet_name)
+        return _load_through_cache(recipient_cache, source, version,
+                                   lambda: _read_excel_frame(excel_file, sheet_name, metrics),
+                                   metrics=metrics)
+    except LoadError:
+        raise
+    except ValueError as e:
+        raise _excel_value_error(e, sheet_name)
+    except Exception as e:
+        raise LoadError(f"Excel Reading Error: {type(e).__name__}: {str(e)}",
+                        "Please review your Excel file and try again")
+
+
+def stream_excel_data(excel_file, sheet_name, columns=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                      recipient_cache=None):
+    """Open an Excel file for chunked, column-projected reading
+
+    When recipient_cache holds the file's current contents the chunks come
+    from there (a recipient_cache.CachedFrame, read the same way).
+    """
+    try:
+        if recipient_cache is not None:
+            cached = recipient_cache.open(*_excel_source(excel_file, sheet_name), columns=columns,
+                                          chunk_size=chunk_size)
+            if cached is not None:
+                return cached
+        return ExcelStream(excel_file, sheet_name, columns=columns, chunk_size=chunk_size)
+    except ValueError as e:
+        if "empty" in str(e):
+            raise LoadError("Excel file is empty", "Please ensure the Excel file contains data")
+        raise _excel_value_error(e, sheet_name)
+    except Exception as e:
+        raise LoadError(f"Excel Reading Error: {type(e).__name__}: {str(e)}",
+                        "Please review your Excel file and try again")
+
+
+def load_spreadsheet_data(creds_json, sheet_url, sheet_name, client_cache, columns=None,
+                          recipient_cache=None):
+    """Load the given columns (all when None) of a worksheet in row blocks
+
+    With a recipient_cache, a whole worksheet loaded at the spreadsheet's
+    current Drive revision is read back from it. That needs the Drive API
+    enabled for the service account; without it every load goes to Sheets.
+    """
+    import gspread
+
+    try:
+        # Connect to spreadsheet (client is reused across reruns)
+        client = client_cache.sheets_client(creds_json)
+        
+        # Open spreadsheet from URL
+        spreadsheet = client.open_by_url(sheet_url)
+        
+        # Get worksheet
+        worksheet = spreadsheet.worksheet(sheet_name)
+        
+        version = None
+        if recipient_cache is not None:
+            version = _spreadsheet_version(client_cache, creds_json, spreadsheet.id)
+        
+        # Get only the needed columns as a DataFrame (same format as the Excel loaders)
+        return _load_through_cache(recipient_cache, source_key('sheets', spreadsheet.id, sheet_name), version,
+                                   lambda: SheetStream(worksheet, columns=columns).read_all(),
+                                   columns=columns)
+        
+    except json.JSONDecodeError as e:
+        raise LoadError(f"JSON Format Error: {str(e)}",
+                        "Please check that your service account JSON is in the correct format")
+    except gspread.exceptions.SpreadsheetNotFound:
+        raise LoadError("Spreadsheet not found",
+                        "Check that the URL is correct and the service account has access")
+    except PermissionError:
+        raise LoadError("Access permission denied", fix_steps=SHEETS_SHARE_STEPS)
+    except gspread.exceptions.WorksheetNotFound:
+        raise LoadError(f"Sheet '{sheet_name}' not found",
+                        "Check that the sheet name is correct (case-sensitive)")
+    except gspread.exceptions.APIError as e:
+        raise LoadError(f"Google API Error: {str(e)}", "Make sure Google Sheets API is enabled")
+    except Exception as e:
+        raise LoadError(f"Unexpected Error: {type(e).__name__}: {str(e)}",
+                        "Please review your settings based on the error details")
+
+
+def parse_source_list(text):
+    """URLs (or paths) typed one per line, blank lines ignored"""
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def parse_sheet_names(text):
+    """Sheet names separated by commas or newlines, e.g. "North, South" """
+    return [name.strip() for name in re.split(r'[,\n]', text) if name.strip()]
+
+
+def load_sources(loads, max_workers=DEFAULT_LOAD_WORKERS):
+    """Run several loads at once on a thread pool
+
+    loads is a list of (label, function) pairs, each function loading one
+    source and tab (e.g. a functools.partial of load_excel_data). Drive
+    downloads, Sheets requests and recipient cache reads overlap, so those
+    take about as long as the slowest source. Parsing a workbook is
+    CPU-bound and holds the GIL, so several cold workbooks parse one after
+    another (benchmarks/bench_multi_load.py measures about twice the
+    slowest single source). Returns
+    [(label, frame, error)] in the order given, where error is the
+    LoadError of a source that failed (and frame is then None).
+    """
+    def run(load):
+        try:
+            return load(), None
+        except LoadError as e:
+            return None, e
+
+    functions = [load for _, load in loads]
+    if len(functions) <= 1 or max_workers <= 1:
+        outcomes = [run(load) for load in functions]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(functions)),
+                                thread_name_prefix='loader') as executor:
+            outcomes = list(executor.map(run, functions))
+    return [(label, frame, error) for (label, _), (frame, error) in zip(loads, outcomes)]
+
+
+def align_columns(frames):
+    """Rename columns to the first spelling seen across the frames
+
+    'Email', ' email' and 'EMAIL' in different sources become one column.
+    Names that only differ this way within one frame are left apart.
+    """
+    spellings = {}
+    aligned = []
+    for frame in frames:
+        keys = [column_key(column) for column in frame.columns]
+        renames = {}
+        for column, key in zip(frame.columns, keys):
+            if keys.count(key) > 1:
+                continue
+            spelling = spellings.setdefault(key, column)
+            if spelling != column:
+                renames[column] = spelling
+        aligned.append(frame.rename(columns=renames) if renames else frame)
+    return aligned
+
+
+def merge_frames(frames, email_column=None):
+    """Concatenate recipient lists on the union of their columns
+
+    Columns are matched as in align_columns and kept in first-seen order;
+    a source without a column gets "" there, like a blank cell. When the
+    merged list has email_column, rows repeating an address (same key as
+    recipients.address_keys) of an earlier source are dropped, so the first
+    source listed wins. Repeats within one source are kept for
+    recipients.RecipientScreen to drop and report as duplicates. Returns
+    (frame, number of rows dropped).
+    """
+    import numpy as np
+    import pandas as pd
+
+    frames = align_columns([frame for frame in frames if frame is not None])
+    if not frames:
+        return pd.DataFrame(), 0
+    if len(frames) == 1:
+        merged = frames[0]
+    else:
+        for frame in frames:
+            if not frame.columns.is_unique:
+                duplicated = sorted({str(column) for column in frame.columns[frame.columns.duplicated()]})
+                raise LoadError(f"Duplicate column names: {', '.join(duplicated)}",
+                                "Give every column of each sheet a distinct header")
+        columns = list(dict.fromkeys(column for frame in frames for column in frame.columns))
+        merged = pd.concat([
+            frame if list(frame.columns) == columns else frame.reindex(columns=columns, fill_value="")
+            for frame in frames
+        ], ignore_index=True)
+    
+    duplicates = 0
+    if len(frames) > 1 and email_column is not None and email_column in merged.columns:
+        keys = address_keys(normalize_addresses(merged[email_column]))
+        sources = pd.Series(np.repeat(np.arange(len(frames)), [len(frame) for frame in frames]),
+                            index=keys.index)
+        # The first source listing each address keeps all of its rows
+        first_source = sources.groupby(keys.to_numpy()).transform('min')
+        repeated = (sources != first_source) & (keys != "")
+        duplicates = int(repeated.sum())
+        if duplicates:
+            merged = merged[~repeated.to_numpy()].reset_index(drop=True)
+    return compact_frame(merged), duplicates
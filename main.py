@@ -1,22 +1,73 @@
 import streamlit as st
-import gspread
-from google.oauth2.service_account import Credentials as ServiceCredentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
-from email.mime.text import MIMEText
-import base64
 import json
-import time
+import os
 import smtplib
-from email.mime.multipart import MIMEMultipart
-import pandas as pd
-import io
-import re
+import time
+from functools import partial
+from templating import compile_template, check_placeholders
+from loaders import (
+    LoadError, load_excel_data, stream_excel_data, load_spreadsheet_data, load_google_drive_excel,
+    load_sources, merge_frames, parse_source_list, parse_sheet_names
+)
+from drive_cache import DriveFileCache
+from recipient_cache import RecipientCache
+from frames import frame_bytes
+from attachments import stage_file, PATH_SEPARATOR, DEFAULT_MAX_BYTES as ATTACHMENT_CACHE_BYTES
+from google_clients import ClientCache, gmail_service_factory
+from transports import SMTP, GMAIL_API, GmailAPITransport, GMAIL_MAX_BATCH_SIZE, GMAIL_DEFAULT_BATCH_SIZE
+from engine import Campaign, SendEvent, parse_address_list, is_app_password_error
+from journal import SendJournal, SuppressionList, QuotaLedger
+from accounts import SenderAccount, parse_accounts, DEFAULT_DAILY_QUOTA
+from metrics import RunMetrics
+from worker import SendWorker, CampaignJob, QUEUED, RUNNING, DONE, FAILED, CANCELLED
 
 # Page configuration
 st.set_page_config(page_title="Gmail Auto-Sender", page_icon="📧", layout="wide")
 
+# Google API clients shared by every rerun and session of this process
+@st.cache_resource
+def get_client_cache():
+    return ClientCache()
+
+client_cache = get_client_cache()
+
+# Recipient lists already loaded, on disk, keyed by source and content version
+@st.cache_resource
+def get_recipient_cache():
+    return RecipientCache()
+
+recipient_cache = get_recipient_cache()
+
+# Drive downloads on disk, shared so concurrent reruns and sessions wait
+# for one download of a file instead of each starting their own. The
+# sidebar's settings are part of the key, so the shared instance is never
+# changed under another session
+@st.cache_resource
+def get_drive_cache(max_bytes, chunk_size):
+    return DriveFileCache(max_bytes=max_bytes, chunk_size=chunk_size)
+
+# Background worker that runs submitted campaigns, shared the same way so
+# a campaign keeps going across reruns, sessions and closed tabs
+@st.cache_resource
+def get_send_worker():
+    return SendWorker()
+
+send_worker = get_send_worker()
+
+# Rows of a loaded recipient list shown in the data preview
+PREVIEW_ROWS = 1000
+
+# Seconds between refreshes of the campaign panel while a campaign runs
+JOB_POLL_SECONDS = 1.0
+
+JOB_STATUS_LABELS = {
+    QUEUED: "⏳ Queued",
+    RUNNING: "📤 Sending",
+    DONE: "✅ Complete",
+    FAILED: "❌ Failed",
+    CANCELLED: "⏹️ Cancelled",
+}
+
 # Initialize session state
 if 'available_columns' not in st.session_state:
     st.session_state.available_columns = ["Email"]
@@ -24,8 +75,11 @@ if 'loaded_data' not in st.session_state:
     st.session_state.loaded_data = None
 if 'email_column' not in st.session_state:
     st.session_state.email_column = 'email'
-if 'data_source_key' not in st.session_state:
-    st.session_state.data_source_key = None
+if 'dry_run' not in st.session_state:
+    st.session_state.dry_run = None
+if 'celebrated_jobs' not in st.session_state:
+    # Campaigns that finished before this session opened get no balloons
+    st.session_state.celebrated_jobs = {job.id for job in send_worker.jobs() if not job.active}
 
 st.title("📧 Automatic Email Sender")
 st.markdown("---")
@@ -67,25 +121,32 @@ with st.sidebar:
         
         st.markdown("---")
         st.subheader("Spreadsheet Settings")
-        spreadsheet_url = st.text_input(
-            "Spreadsheet URL",
-            help="Enter the URL of the Google Spreadsheet containing the recipient list"
-        )
-        sheet_name = st.text_input("Sheet Name", value="Sheet1", key="sheets_sheet_name")
+        spreadsheet_urls = parse_source_list(st.text_area(
+            "Spreadsheet URLs",
+            help="Enter the URL of each Google Spreadsheet containing recipients, one per line"
+        ))
+        sheet_names = parse_sheet_names(st.text_input(
+            "Sheet Names", value="Sheet1", key="sheets_sheet_name",
+            help="Separate several sheets with commas; every sheet of every spreadsheet is loaded and merged"
+        ))
     elif data_source == "Excel File (Local Upload)":
         # Excel File section
         st.subheader("Excel File Settings")
-        excel_file = st.file_uploader(
-            "Upload Excel File",
+        excel_files = st.file_uploader(
+            "Upload Excel Files",
             type=['xlsx', 'xls'],
-            help="Upload an Excel file (.xlsx or .xls) containing the recipient list",
+            accept_multiple_files=True,
+            help="Upload one or more Excel files (.xlsx or .xls) containing the recipient list",
             key="excel_file"
         )
-        sheet_name = st.text_input("Sheet Name", value="Sheet1", key="excel_sheet_name")
+        sheet_names = parse_sheet_names(st.text_input(
+            "Sheet Names", value="Sheet1", key="excel_sheet_name",
+            help="Separate several sheets with commas; every sheet of every file is loaded and merged"
+        ))
         
         # Initialize variables for Google Sheets (to avoid errors)
         sheets_credentials_json = ""
-        spreadsheet_url = ""
+        spreadsheet_urls = []
     else:
         # Google Drive Excel section
         st.subheader("1. Google Drive Authentication")
@@ -110,16 +171,39 @@ with st.sidebar:
         
         st.markdown("---")
         st.subheader("Google Drive File Settings")
-        drive_file_url = st.text_input(
-            "Google Drive File URL",
-            help="Enter the URL of the Excel file stored in Google Drive",
+        drive_file_urls = parse_source_list(st.text_area(
+            "Google Drive File URLs",
+            help="Enter the URL of each Excel file stored in Google Drive, one per line",
             placeholder="https://drive.google.com/file/d/FILE_ID/view"
-        )
-        sheet_name = st.text_input("Sheet Name", value="Sheet1", key="drive_sheet_name")
+        ))
+        sheet_names = parse_sheet_names(st.text_input(
+            "Sheet Names", value="Sheet1", key="drive_sheet_name",
+            help="Separate several sheets with commas; every sheet of every file is loaded and merged"
+        ))
+        
+        with st.expander("Download Cache"):
+            download_chunk_mb = st.number_input(
+                "Download chunk size (MB)", min_value=1, max_value=100, value=8,
+                help="Size of each request when downloading the file"
+            )
+            cache_size_mb = st.number_input(
+                "Cache size limit (MB)", min_value=10, max_value=10000, value=512,
+                help="Least recently used files are removed above this size"
+            )
+        drive_cache = get_drive_cache(int(cache_size_mb) * 1024 * 1024, int(download_chunk_mb) * 1024 * 1024)
         
         # Initialize variables for other sources
-        spreadsheet_url = ""
-        excel_file = None
+        spreadsheet_urls = []
+        excel_files = []
+    
+    with st.expander("Recipient Cache"):
+        st.caption("Loaded recipient lists are kept on disk and reused while the file or sheet is "
+                   f"unchanged (Google Sheets also need the Drive API enabled). Entries expire after "
+                   f"{recipient_cache.ttl // (24 * 60 * 60)} days; the least recently used go first above "
+                   f"{recipient_cache.max_bytes // (1024 * 1024)} MB.")
+        if st.button("Clear recipient cache"):
+            recipient_cache.clear()
+            st.success("Recipient cache cleared")
 
 # Main area
 col1, col2 = st.columns([1, 1])
@@ -195,6 +279,21 @@ with col2:
         help="Gmail address that will be used to send emails"
     )
     
+    with st.expander("👥 Additional Sender Accounts"):
+        extra_accounts_text = st.text_area(
+            "One account per line: email, app password[, daily quota]",
+            help="Recipients are spread across the sender above and these accounts; "
+                 "when one reaches its daily quota the others take over",
+            placeholder="second@gmail.com, abcd efgh ijkl mnop\nthird@gmail.com, abcd efgh ijkl mnop, 300"
+        )
+        daily_quota = st.number_input(
+            "Daily quota per account",
+            min_value=1,
+            max_value=10000,
+            value=DEFAULT_DAILY_QUOTA,
+            help="Emails each account may send per day (UTC), counted across runs"
+        )
+    
     # CC and BCC inputs
     cc_addresses = st.text_input(
         "CC (Optional)",
@@ -209,313 +308,379 @@ with col2:
     )
     
     test_mode = st.checkbox("Test Mode (Don't actually send)", value=True)
-    delay_seconds = st.slider("Delay between emails (seconds)", min_value=1, max_value=10, value=2)
+    rate_col, unit_col = st.columns([1, 1])
+    send_rate = rate_col.number_input(
+        "Sending rate limit",
+        min_value=1,
+        max_value=10000,
+        value=30,
+        help="Maximum number of emails started per time unit, shared by all connections"
+    )
+    rate_unit = unit_col.selectbox("Per", ["minute", "second"])
+    adaptive_rate = st.checkbox(
+        "Adapt rate to server responses",
+        value=True,
+        help="Speeds up while every email is accepted and backs off when the server asks to slow down"
+    )
+    max_rate = send_rate
+    if adaptive_rate:
+        max_rate = st.number_input(
+            "Maximum sending rate",
+            min_value=int(send_rate),
+            max_value=10000,
+            value=int(send_rate),
+            help="Upper bound (per account, same unit) the adaptive rate may climb to"
+        )
+    max_attempts = st.number_input(
+        "Attempts per email",
+        min_value=1,
+        max_value=10,
+        value=3,
+        help="Temporary (4xx) failures are retried later up to this many attempts; permanent (5xx) ones are not"
+    )
+    send_workers = st.slider(
+        "Parallel connections",
+        min_value=1,
+        max_value=10,
+        value=2,
+        help="Number of SMTP connections sending at the same time"
+    )
+    messages_per_connection = st.number_input(
+        "Emails per SMTP connection",
+        min_value=1,
+        max_value=1000,
+        value=100,
+        help="The connection is reused for this many emails before reconnecting"
+    )
+    coalesce_identical = st.checkbox(
+        "Combine identical emails",
+        value=False,
+        help="Rows whose subject and body render the same are sent as one email with hidden recipients "
+             "(To: undisclosed-recipients) instead of one email each"
+    )
+    coalesce_size = 1
+    if coalesce_identical:
+        coalesce_size = st.number_input(
+            "Recipients per combined email",
+            min_value=2,
+            max_value=100,
+            value=50,
+            help="Gmail accepts up to 100 recipients per message"
+        )
+    with st.expander("📎 Attachments"):
+        attachment_files = st.file_uploader(
+            "Attach to every email",
+            accept_multiple_files=True,
+            help="Each file is encoded once per run and the same encoded bytes go into every email",
+            key="attachment_files"
+        )
+        attachment_column = st.selectbox(
+            "Column with attachment paths (optional)",
+            ["(none)"] + st.session_state.available_columns,
+            help=f"Files to attach per recipient, separated by '{PATH_SEPARATOR}'. Rows whose files "
+                 "are missing are skipped"
+        )
+        attachment_dir = st.text_input(
+            "Folder of the listed files",
+            help="Required with an attachment column: its paths are read from this folder on this "
+                 "computer, and rows listing absolute paths or files outside it are skipped"
+        )
+        attachment_cache_mb = st.number_input(
+            "Attachment memory limit (MB)",
+            min_value=8,
+            max_value=4096,
+            value=ATTACHMENT_CACHE_BYTES // (1024 * 1024),
+            help="Encoded attachments kept in memory during a run; the least recently used are dropped above this"
+        )
+    resume_campaign = st.checkbox(
+        "Skip recipients already sent (resume)",
+        value=True,
+        help="Every outcome is saved to a local journal; re-running the same campaign skips rows already sent"
+    )
+    start_over = st.checkbox(
+        "Start campaign over",
+        value=False,
+        disabled=not resume_campaign,
+        help="Forget what the journal holds for this campaign when it starts, so every row is sent again"
+    )
+    campaign_name = st.text_input(
+        "Campaign Name (Optional)",
+        help="Identifies the campaign in the send journal. Defaults to one derived from the sender and templates"
+    )
+    use_suppression = st.checkbox(
+        "Skip suppressed addresses",
+        value=True,
+        help="Never send to unsubscribed addresses or addresses that hard-bounced in an earlier run"
+    )
+    with st.expander("🚫 Suppression List"):
+        unsubscribes = st.text_area(
+            "Add unsubscribed addresses",
+            help="One address per line, or separated by commas",
+            placeholder="user1@example.com\nuser2@example.com"
+        )
+        resubscribes = st.text_area(
+            "Remove addresses",
+            help="Addresses to mail again, e.g. after they re-subscribed. One per line, or separated by commas"
+        )
+        suppression = SuppressionList()
+        try:
+            if st.button("Add to suppression list") and unsubscribes.strip():
+                added = suppression.add(parse_address_list(unsubscribes.replace("\n", ",")))
+                st.success(f"✅ Added {added} addresses")
+            if st.button("Remove from suppression list") and resubscribes.strip():
+                removed = suppression.remove(parse_address_list(resubscribes.replace("\n", ",")))
+                st.success(f"✅ Removed {removed} addresses")
+            counts = suppression.counts()
+        finally:
+            suppression.close()
+        st.caption(f"Unsubscribed: {counts.get('unsubscribed', 0)} · Hard bounces: {counts.get('bounced', 0)}")
     
     st.info("💡 Your spreadsheet should contain the following columns:\n- email: Recipient email address\n- name: Recipient name\n- Other variables used in templates")
 
-# Extract file ID from Google Drive URL
-def extract_file_id_from_url(url):
-    """Extract file ID from various Google Drive URL formats"""
-    if not url:
-        return None
-    
-    # Pattern 1: /file/d/{FILE_ID}/
-    pattern1 = r'/file/d/([a-zA-Z0-9_-]+)'
-    match = re.search(pattern1, url)
-    if match:
-        return match.group(1)
-    
-    # Pattern 2: ?id={FILE_ID}
-    pattern2 = r'[?&]id=([a-zA-Z0-9_-]+)'
-    match = re.search(pattern2, url)
-    if match:
-        return match.group(1)
-    
-    # Pattern 3: /d/{FILE_ID}/
-    pattern3 = r'/d/([a-zA-Z0-9_-]+)'
-    match = re.search(pattern3, url)
-    if match:
-        return match.group(1)
-    
-    return None
-
-# Load Google Drive Excel data
-def load_google_drive_excel(creds_json, file_url, sheet_name):
-    """Load Excel data from Google Drive"""
-    try:
-        # Validate JSON
-        creds_dict = json.loads(creds_json)
-        
-        # Extract file ID from URL
-        file_id = extract_file_id_from_url(file_url)
-        if not file_id:
-            st.error("❌ Invalid Google Drive URL")
-            st.info("💡 Please use a valid Google Drive file URL (e.g., https://drive.google.com/file/d/FILE_ID/view)")
-            return None
-        
-        # Required scopes
-        scopes = ['https://www.googleapis.com/auth/drive.readonly']
-        
-        # Create credentials
-        creds = ServiceCredentials.from_service_account_info(creds_dict, scopes=scopes)
-        
-        # Build Drive service
-        service = build('drive', 'v3', credentials=creds)
-        
-        # Download file
-        request = service.files().get_media(fileId=file_id)
-        file_content = io.BytesIO()
-        downloader = MediaIoBaseDownload(file_content, request)
-        
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        
-        # Reset file pointer to beginning
-        file_content.seek(0)
-        
-        # Read Excel file with pandas
-        df = pd.read_excel(file_content, sheet_name=sheet_name, engine='openpyxl')
-        
-        # Check if dataframe is empty
-        if df.empty:
-            st.error("❌ Excel file is empty")
-            st.info("💡 Please ensure the Excel file contains data")
-            return None
-        
-        # Convert to list of dictionaries
-        data = df.to_dict('records')
-        
-        # Convert NaN values to empty strings
-        for record in data:
-            for key, value in record.items():
-                if pd.isna(value):
-                    record[key] = ""
-        
-        return data
-        
-    except json.JSONDecodeError as e:
-        st.error(f"❌ JSON Format Error: {str(e)}")
-        st.info("💡 Please check that your service account JSON is in the correct format")
-        return None
-    except HttpError as e:
-        if e.resp.status == 404:
-            st.error("❌ File not found")
-            st.info("💡 Check that the file ID is correct and the file exists")
-        elif e.resp.status == 403:
-            st.error("❌ Access permission denied")
-            st.warning("🔧 To fix this issue:")
-            st.markdown("""
-            1. Open the file in Google Drive
-            2. Click the "Share" button
-            3. Add the service account email address (shown above)
-            4. Set permission to "Viewer" and send
-            """)
-        else:
-            st.error(f"❌ Google Drive API Error: {str(e)}")
-        return None
-    except ValueError as e:
-        error_msg = str(e)
-        if "Worksheet named" in error_msg:
-            st.error(f"❌ Sheet '{sheet_name}' not found")
-            st.info("💡 Check that the sheet name is correct (case-sensitive)")
-        else:
-            st.error(f"❌ Excel Format Error: {error_msg}")
-            st.info("💡 Please check that your Excel file is in the correct format")
-        return None
-    except Exception as e:
-        st.error(f"❌ Unexpected Error: {type(e).__name__}: {str(e)}")
-        st.info("💡 Please review your settings based on the error details")
-        return None
+# Show a loader error in the page, naming the source when several are loaded
+def show_load_error(error, source=None):
+    st.error(f"❌ {source}: {error.message}" if source else f"❌ {error.message}")
+    if error.hint:
+        st.info(f"💡 {error.hint}")
+    if error.fix_steps:
+        st.warning("🔧 To fix this issue:")
+        st.markdown(error.fix_steps)
 
-# Load Excel data
-def load_excel_data(excel_file, sheet_name):
-    """Load data from uploaded Excel file"""
+# Run a loader, showing its error in the page and returning None on failure
+def load_or_report(loader, *args, **kwargs):
     try:
-        # Read Excel file
-        df = pd.read_excel(excel_file, sheet_name=sheet_name, engine='openpyxl')
-        
-        # Check if dataframe is empty
-        if df.empty:
-            st.error("❌ Excel file is empty")
-            st.info("💡 Please ensure the Excel file contains data")
-            return None
-        
-        # Convert to list of dictionaries (same format as Google Sheets)
-        data = df.to_dict('records')
-        
-        # Convert NaN values to empty strings for consistency
-        for record in data:
-            for key, value in record.items():
-                if pd.isna(value):
-                    record[key] = ""
-        
-        return data
-        
-    except ValueError as e:
-        error_msg = str(e)
-        if "Worksheet named" in error_msg:
-            st.error(f"❌ Sheet '{sheet_name}' not found")
-            st.info("💡 Check that the sheet name is correct (case-sensitive)")
-        else:
-            st.error(f"❌ Excel Format Error: {error_msg}")
-            st.info("💡 Please check that your Excel file is in the correct format")
-        return None
-    except Exception as e:
-        st.error(f"❌ Excel Reading Error: {type(e).__name__}: {str(e)}")
-        st.info("💡 Please review your Excel file and try again")
+        return loader(*args, **kwargs)
+    except LoadError as e:
+        show_load_error(e)
         return None
 
-# Load spreadsheet data
-def load_spreadsheet_data(creds_json, sheet_url, sheet_name):
-    try:
-        # Validate JSON
-        creds_dict = json.loads(creds_json)
-        
-        # Required scopes
-        scopes = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-        
-        # Create credentials
-        creds = ServiceCredentials.from_service_account_info(creds_dict, scopes=scopes)
-        
-        # Connect to spreadsheet
-        client = gspread.authorize(creds)
-        
-        # Open spreadsheet from URL
-        spreadsheet = client.open_by_url(sheet_url)
-        
-        # Get worksheet
-        worksheet = spreadsheet.worksheet(sheet_name)
-        
-        # Get data
-        data = worksheet.get_all_records()
-        
-        return data
-        
-    except json.JSONDecodeError as e:
-        st.error(f"❌ JSON Format Error: {str(e)}")
-        st.info("💡 Please check that your service account JSON is in the correct format")
-        return None
-    except gspread.exceptions.SpreadsheetNotFound:
-        st.error("❌ Spreadsheet not found")
-        st.info("💡 Check that the URL is correct and the service account has access")
-        return None
-    except PermissionError as e:
-        st.error("❌ Access permission denied")
-        st.warning("🔧 To fix this issue:")
-        st.markdown("""
-        1. Open the spreadsheet
-        2. Click the "Share" button in the top right
-        3. Add the service account email address (shown above)
-        4. Set permission to "Viewer" and send
-        """)
-        return None
-    except gspread.exceptions.WorksheetNotFound:
-        st.error(f"❌ Sheet '{sheet_name}' not found")
-        st.info("💡 Check that the sheet name is correct (case-sensitive)")
-        return None
-    except gspread.exceptions.APIError as e:
-        st.error(f"❌ Google API Error: {str(e)}")
-        st.info("💡 Make sure Google Sheets API is enabled")
+# (label, load) for every file or spreadsheet and sheet selected in the sidebar
+def recipient_loads(columns=None, metrics=None):
+    if data_source == "Google Sheets":
+        return [(f"{url} · {name}",
+                 partial(load_spreadsheet_data, sheets_credentials_json, url, name, client_cache,
+                         columns=columns, recipient_cache=recipient_cache))
+                for url in spreadsheet_urls for name in sheet_names]
+    if data_source == "Excel File (Local Upload)":
+        return [(f"{excel_file.name} · {name}",
+                 partial(load_excel_data, excel_file, name, metrics=metrics, recipient_cache=recipient_cache))
+                for excel_file in excel_files for name in sheet_names]
+    return [(f"{url} · {name}",
+             partial(load_google_drive_excel, sheets_credentials_json, url, name, drive_cache, client_cache,
+                     metrics=metrics, recipient_cache=recipient_cache))
+            for url in drive_file_urls for name in sheet_names]
+
+# Load every source at once and merge them into one recipient list. Failed
+# sources are reported; unless allow_partial, nothing is returned when any failed
+def load_recipients(loads, email_column, allow_partial=True):
+    results = load_sources(loads)
+    failed = [(label, error) for label, _, error in results if error is not None]
+    for label, error in failed:
+        show_load_error(error, source=label if len(results) > 1 else None)
+    if failed and not allow_partial:
         return None
-    except Exception as e:
-        st.error(f"❌ Unexpected Error: {type(e).__name__}: {str(e)}")
-        st.info("💡 Please review your settings based on the error details")
+    try:
+        data, duplicates = merge_frames([frame for _, frame, _ in results], email_column)
+    except LoadError as e:
+        show_load_error(e)
         return None
+    if duplicates:
+        st.caption(f"{duplicates} rows repeating an address of an earlier source were left out")
+    return data
 
-# Email sending function
-def send_email_simple(to, subject, body, sender_email, app_password, cc=None, bcc=None):
-    """Send email using App Password with CC and BCC support"""
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = to
-        msg['Subject'] = subject
-        
-        # Add CC header if provided
-        if cc:
-            cc_list = cc if isinstance(cc, list) else [cc]
-            msg['Cc'] = ', '.join(cc_list)
-        
-        # Note: BCC is not added to headers (to keep it hidden)
-        
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
-        
-        # Prepare recipient list
-        recipients = [to]
-        if cc:
-            cc_list = cc if isinstance(cc, list) else [cc]
-            recipients.extend(cc_list)
-        if bcc:
-            bcc_list = bcc if isinstance(bcc, list) else [bcc]
-            recipients.extend(bcc_list)
-        
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, app_password)
-        server.sendmail(sender_email, recipients, msg.as_string())
-        server.quit()
-        return True
-    except smtplib.SMTPAuthenticationError as e:
-        error_msg = str(e)
-        if "Application-specific password required" in error_msg or "InvalidSecondFactor" in error_msg:
-            st.error(f"❌ Authentication Error ({to}): App password required")
-            st.warning("⚠️ Regular Gmail passwords cannot be used. Enable 2-step verification and generate an app password.")
-        else:
-            st.error(f"❌ Authentication Error ({to}): {error_msg}")
-        return False
-    except Exception as e:
-        st.error(f"❌ Sending Error ({to}): {str(e)}")
-        return False
-
-# Template processing function
-def apply_template(template, data):
-    result = template
-    for key, value in data.items():
-        placeholder = f"{{{{{key}}}}}"
-        result = result.replace(placeholder, str(value))
-    return result
+# Show a sending error in the page (must run on the script thread, never the worker's)
+def report_send_error(to, error):
+    if is_app_password_error(error):
+        st.error(f"❌ Authentication Error ({to}): App password required")
+        st.warning("⚠️ Regular Gmail passwords cannot be used. Enable 2-step verification and generate an app password.")
+    elif isinstance(error, smtplib.SMTPAuthenticationError):
+        st.error(f"❌ Authentication Error ({to}): {str(error)}")
+    else:
+        st.error(f"❌ Sending Error ({to}): {str(error)}")
+
+# Report placeholders that no column fills and columns that no template uses
+def report_placeholders(subject_template, body_template, columns):
+    unknown, unused = check_placeholders(
+        [compile_template(subject_template), compile_template(body_template)], columns
+    )
+    if unknown:
+        st.warning("⚠️ Placeholders without a matching column (left as-is): "
+                   + ", ".join(f"{{{{{key}}}}}" for key in unknown))
+    if unused:
+        st.caption("Columns not used by the templates: " + ", ".join(unused))
+    return unknown, unused
+
+# Show the results of a finished campaign job
+def show_campaign_results(job, dropped_rows):
+    campaign = job.campaign
+    result = job.result
+    st.markdown("#### 📊 Sending Results")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total", result.total)
+    col2.metric("Success", result.success)
+    col3.metric("Failed", result.failed)
+    if result.failed:
+        st.caption(f"Permanently rejected (5xx): {result.rejected} · "
+                   f"still failing after {campaign.max_attempts} attempts: "
+                   f"{result.failed - result.rejected - result.skipped}")
+    if result.retries or result.throttles:
+        st.caption(f"🔁 Retries: {result.retries} · throttling responses: {result.throttles}")
+    if campaign.adaptive and result.final_rate is not None:
+        st.caption(f"🎚️ Sending rate at the end of the run: {result.final_rate:.1f} per {campaign.rate_unit}"
+                   " per account")
+    if result.already_sent:
+        st.caption(f"⏭️ Skipped {result.already_sent} recipients already sent in campaign "
+                   f"'{campaign.campaign_id}'")
+    if result.quota_exhausted:
+        st.warning(f"⚠️ Every sender account reached its daily quota after "
+                   f"{result.success} emails; run the campaign again tomorrow to "
+                   f"send the rest (rows already sent are skipped)")
+    if len(campaign.accounts) > 1:
+        st.dataframe(
+            [{"Account": account.email, "Sent": result.accounts.get(account.email, 0),
+              "Left today": result.quota_left.get(account.email)}
+             for account in campaign.accounts],
+            use_container_width=True
+        )
+    if dropped_rows:
+        with st.expander(f"🚫 {sum(result.dropped.values())} rows dropped before sending "
+                         f"(invalid: {result.dropped['invalid']}, "
+                         f"duplicate: {result.dropped['duplicate']}, "
+                         f"suppressed: {result.dropped['suppressed']})"):
+            st.dataframe(dropped_rows, use_container_width=True)
+            if len(dropped_rows) < sum(result.dropped.values()):
+                st.caption(f"Showing the last {len(dropped_rows)}")
+    if result.cancelled:
+        st.warning(f"⏹️ Cancelled after {job.progress()[0]} of {result.total} rows; the rest were not sent"
+                   + (f" (run campaign '{campaign.campaign_id}' again to send them)"
+                      if campaign.journal is not None else ""))
+    if result.attachment_stats is not None:
+        st.caption(f"📎 Attachment files encoded: {result.attachment_stats['encodes']} "
+                   f"(reused from memory {result.attachment_stats['hits']} times)")
+    if result.pool_stats is not None and getattr(campaign.transport, 'name', SMTP) == GMAIL_API:
+        st.caption(f"🔌 Gmail API batch requests: {result.pool_stats['batches']} "
+                   f"(send requests: {result.pool_stats['requests']}, "
+                   f"retried in a later batch: {result.pool_stats['retries']})")
+    elif result.pool_stats is not None:
+        st.caption(f"🔌 SMTP handshakes: {result.pool_stats['handshakes']} "
+                   f"(reconnects: {result.pool_stats['reconnects']}, "
+                   f"recycles: {result.pool_stats['recycles']})")
+
+    # Where the run spent its time, stage by stage
+    metrics = campaign.metrics
+    stages = metrics.stages()
+    if stages:
+        st.markdown("#### ⏱️ Stage Timings")
+        summary = metrics.summary()
+        st.dataframe(
+            [
+                {
+                    "Stage": stage,
+                    "Count": summary[stage]['count'],
+                    "Total (s)": round(summary[stage]['total_seconds'], 3),
+                    "Mean (ms)": round(summary[stage]['mean_seconds'] * 1000, 2),
+                    "p50 (ms)": round(summary[stage]['p50_seconds'] * 1000, 2),
+                    "p99 (ms)": round(summary[stage]['p99_seconds'] * 1000, 2),
+                    "Max (ms)": round(summary[stage]['max_seconds'] * 1000, 2),
+                }
+                for stage in stages
+            ],
+            use_container_width=True
+        )
+        for tab, stage in zip(st.tabs(stages), stages):
+            with tab:
+                labels, counts = zip(*metrics.histogram(stage))
+                st.bar_chart({"Count": dict(zip(labels, counts))})
+    if job.metrics_files is not None:
+        st.caption(f"📈 Metrics written to {job.metrics_files[0]} and {job.metrics_files[1]}")
+    elif job.metrics_error is not None:
+        st.caption(f"⚠️ Could not write metrics files: {job.metrics_error}")
+
+# Counts of a job's skipped and failed rows, and a table of the latest ones
+def show_job_issues(job, counts, failures, skipped):
+    failed = counts[SendEvent.FAILED] + counts[SendEvent.REJECTED]
+    skipped_count = counts[SendEvent.SKIPPED]
+    if job.campaign.email_column not in job.columns:
+        # Rows without an address are only worth a warning when the column exists
+        skipped, skipped_count = [], 0
+    if skipped_count:
+        st.warning(f"⚠️ {skipped_count} rows skipped")
+    if failed:
+        # The newest failure in full, e.g. how to set up an app password
+        report_send_error(failures[-1].recipient, failures[-1].error)
+    latest = sorted(list(failures) + list(skipped), key=lambda event: event.row)
+    if latest:
+        with st.expander(f"Latest {len(latest)} of {failed + skipped_count} failed or skipped rows"):
+            st.dataframe(
+                [{"Row": event.row + 1, "Address": event.recipient or "",
+                  "Problem": event.message or f"{type(event.error).__name__}: {event.error}"}
+                 for event in latest],
+                use_container_width=True
+            )
+
+# Show one campaign job: live progress while it runs, its results once done
+def show_job(job):
+    processed, counts = job.progress()
+    failures, skipped, recent, dropped_rows = job.events()
+    with st.container(border=True):
+        st.markdown(f"**#{job.id} · {job.name}** — {JOB_STATUS_LABELS[job.status]}")
+        if job.status == RUNNING:
+            if job.total_rows:
+                st.progress(min(1.0, processed / job.total_rows))
+            st.text(f"Processed {processed}/{job.total_rows or '?'} · sent {counts[SendEvent.SENT]} · "
+                    f"failed {counts[SendEvent.FAILED] + counts[SendEvent.REJECTED]}"
+                    + (f" · last sent: {recent[-1].recipient}" if recent else ""))
+        if job.cancelling:
+            st.caption("⏹️ Stopping once the emails already being sent are done...")
+        elif job.active and st.button("⏹️ Cancel", key=f"cancel_job_{job.id}"):
+            job.cancel()
+        show_job_issues(job, counts, failures, skipped)
+        if job.status == FAILED:
+            st.error(f"❌ Campaign stopped by an error: {type(job.error).__name__}: {job.error}")
+        elif job.status == CANCELLED and job.result is None:
+            st.caption("Cancelled before it started")
+        if job.result is not None and not job.active:
+            if job.status == DONE and job.id not in st.session_state.celebrated_jobs:
+                st.session_state.celebrated_jobs.add(job.id)
+                st.balloons()
+            show_campaign_results(job, dropped_rows)
+
+# Whether the sidebar names at least one source and sheet to load
+if data_source == "Google Sheets":
+    source_ready = bool(sheets_credentials_json and spreadsheet_urls and sheet_names)
+elif data_source == "Excel File (Local Upload)":
+    source_ready = bool(excel_files and sheet_names)
+else:  # Google Drive Excel
+    source_ready = bool(sheets_credentials_json and drive_file_urls and sheet_names)
 
 # Data preview
 if st.button("📊 Preview Data", type="secondary"):
-    if data_source == "Google Sheets":
-        if sheets_credentials_json and spreadsheet_url:
-            with st.spinner("Loading data..."):
-                data = load_spreadsheet_data(sheets_credentials_json, spreadsheet_url, sheet_name)
-                if data:
-                    # Save to session state
-                    st.session_state.available_columns = list(data[0].keys()) if data else ["email"]
-                    st.session_state.loaded_data = data
-                    st.session_state.data_source_key = data_source
-        else:
-            st.warning("Please enter authentication credentials and spreadsheet URL")
+    if source_ready:
+        loads = recipient_loads()
+        with st.spinner(f"Loading {len(loads)} sheets..." if len(loads) > 1 else "Loading data..."):
+            data = load_recipients(loads, st.session_state.email_column)
+            if data is not None and not data.empty:
+                # Save to session state
+                st.session_state.available_columns = list(data.columns)
+                st.session_state.loaded_data = data
+    elif data_source == "Google Sheets":
+        st.warning("Please enter authentication credentials, spreadsheet URL and sheet name")
     elif data_source == "Excel File (Local Upload)":
-        if excel_file is not None:
-            with st.spinner("Loading data..."):
-                data = load_excel_data(excel_file, sheet_name)
-                if data:
-                    # Save to session state
-                    st.session_state.available_columns = list(data[0].keys()) if data else ["email"]
-                    st.session_state.loaded_data = data
-                    st.session_state.data_source_key = data_source
-        else:
-            st.warning("Please upload an Excel file")
+        st.warning("Please upload an Excel file and enter a sheet name")
     else:  # Google Drive Excel
-        if sheets_credentials_json and drive_file_url:
-            with st.spinner("Loading data..."):
-                data = load_google_drive_excel(sheets_credentials_json, drive_file_url, sheet_name)
-                if data:
-                    # Save to session state
-                    st.session_state.available_columns = list(data[0].keys()) if data else ["email"]
-                    st.session_state.loaded_data = data
-                    st.session_state.data_source_key = data_source
-        else:
-            st.warning("Please enter authentication credentials and Google Drive file URL")
+        st.warning("Please enter authentication credentials, Google Drive file URL and sheet name")
 
 # Display loaded data if exists
 if st.session_state.loaded_data is not None:
-    st.success(f"✅ Loaded {len(st.session_state.loaded_data)} records")
-    st.dataframe(st.session_state.loaded_data, use_container_width=True)
+    loaded_data = st.session_state.loaded_data
+    st.success(f"✅ Loaded {len(loaded_data)} records")
+    # Only the first rows are sent to the browser on each rerun
+    st.dataframe(loaded_data.head(PREVIEW_ROWS), use_container_width=True)
+    if len(loaded_data) > PREVIEW_ROWS:
+        st.caption(f"Showing the first {PREVIEW_ROWS} of {len(loaded_data)} rows "
+                   f"({frame_bytes(loaded_data) / (1024 * 1024):.1f} MB in memory)")
+    if subject_template and body_template:
+        report_placeholders(subject_template, body_template, st.session_state.loaded_data.columns)
 
 # Email column selection (always visible)
 st.markdown("---")
@@ -542,9 +707,36 @@ st.markdown("---")
 # Sending method selection
 st.subheader("📤 Email Sending Setup")
 
-st.error("⚠️ Important: Regular Gmail passwords cannot be used. You must generate an app password.")
+sending_backend = st.radio(
+    "Sending method",
+    ["SMTP (App Password)", "Gmail API (Batched)"],
+    horizontal=True,
+    help="The Gmail API sends up to 100 emails per HTTPS request instead of one SMTP transaction each"
+)
+use_gmail_api = sending_backend == "Gmail API (Batched)"
 
-st.info("""
+app_password = ""
+gmail_credentials_json = ""
+if use_gmail_api:
+    st.info("💡 Paste either an OAuth token JSON (authorized user with the gmail.send scope) or a service "
+            "account JSON with domain-wide delegation for the sender addresses (Google Workspace). "
+            "An OAuth token sends only as its own account, so additional sender accounts need a service account.")
+    gmail_credentials_json = st.text_area(
+        "Gmail API Credentials JSON",
+        height=150,
+        help="Used to call users.messages.send as each sender account"
+    )
+    gmail_batch_size = st.number_input(
+        "Emails per batch request",
+        min_value=1,
+        max_value=GMAIL_MAX_BATCH_SIZE,
+        value=GMAIL_DEFAULT_BATCH_SIZE,
+        help="Gmail accepts up to 100 requests per batch and recommends 50 or fewer"
+    )
+else:
+    st.error("⚠️ Important: Regular Gmail passwords cannot be used. You must generate an app password.")
+
+    st.info("""
 💡 **How to Get Google App Password (5 minutes):**
 
 1. **Enable 2-Step Verification**
@@ -563,129 +755,258 @@ st.info("""
    - Spaces will be automatically removed
 """)
 
-app_password = st.text_input(
-    "App Password (16 digits)", 
-    type="password", 
-    help="Enter the 16-digit app password (spaces will be ignored)",
-    placeholder="abcdefghijklmnop or abcd efgh ijkl mnop"
-)
+    app_password = st.text_input(
+        "App Password (16 digits)", 
+        type="password", 
+        help="Enter the 16-digit app password (spaces will be ignored)",
+        placeholder="abcdefghijklmnop or abcd efgh ijkl mnop"
+    )
 
 # Send execution
 if st.button("📤 Send Emails", type="primary"):
-    # Validate based on data source
+    # Validate the data source settings
     validation_error = False
     
-    if data_source == "Google Sheets":
-        if not sheets_credentials_json or not spreadsheet_url or not sender_email:
-            st.error("Please fill in all required fields")
-            validation_error = True
-    elif data_source == "Excel File (Local Upload)":
-        if excel_file is None or not sender_email:
-            st.error("Please fill in all required fields")
-            validation_error = True
-    else:  # Google Drive Excel
-        if not sheets_credentials_json or not drive_file_url or not sender_email:
-            st.error("Please fill in all required fields")
-            validation_error = True
+    if not source_ready or not sender_email:
+        st.error("Please fill in all required fields")
+        validation_error = True
     
     if not validation_error:
-        if not app_password:
+        if use_gmail_api and not gmail_credentials_json:
+            st.error("Please enter your Gmail API credentials")
+        elif not use_gmail_api and not app_password:
             st.error("Please enter your app password")
         elif not subject_template or not body_template:
             st.error("Please provide both subject and body templates")
         elif 'email_column' not in st.session_state or not st.session_state.email_column:
             st.error("Please preview data and select an email column first")
+        elif attachment_column != "(none)" and not attachment_dir.strip():
+            st.error("Please enter the folder of the files listed in the attachment column")
         else:
-            # Parse CC addresses
-            cc_list = []
-            if cc_addresses and cc_addresses.strip():
-                cc_list = [email.strip() for email in cc_addresses.split(',') if email.strip()]
-            
-            # Parse BCC addresses
-            bcc_list = []
-            if bcc_addresses and bcc_addresses.strip():
-                bcc_list = [email.strip() for email in bcc_addresses.split(',') if email.strip()]
+            try:
+                sender_accounts = [SenderAccount(sender_email, app_password, daily_quota)]
+                sender_accounts += parse_accounts(extra_accounts_text, daily_quota)
+            except ValueError as e:
+                st.error(f"❌ Additional sender accounts: {e}")
+                st.stop()
+            transport = None
+            if use_gmail_api:
+                try:
+                    service_factory = gmail_service_factory(
+                        gmail_credentials_json, senders=[account.email for account in sender_accounts])
+                except ValueError as e:
+                    st.error(f"❌ Gmail API credentials: {e}")
+                    st.stop()
+                transport = GmailAPITransport(service_factory, batch_size=gmail_batch_size,
+                                              max_attempts=max_attempts)
+            campaign = Campaign(
+                subject_template, body_template,
+                email_column=st.session_state.get('email_column', 'email'),
+                sender_email=sender_email,
+                app_password=app_password,
+                cc=parse_address_list(cc_addresses),
+                bcc=parse_address_list(bcc_addresses),
+                test_mode=test_mode,
+                send_rate=send_rate,
+                rate_unit=rate_unit,
+                workers=send_workers,
+                messages_per_connection=messages_per_connection,
+                campaign_id=campaign_name.strip() or None,
+                metrics=RunMetrics() if not test_mode else None,
+                accounts=sender_accounts,
+                max_rate=max_rate,
+                max_attempts=max_attempts,
+                adaptive=adaptive_rate,
+                transport=transport,
+                coalesce_size=coalesce_size,
+                # Uploads are saved to disk so the background run can read them
+                attachments=[stage_file(attachment.name, attachment.getvalue())
+                             for attachment in attachment_files or []],
+                attachment_column=None if attachment_column == "(none)" else attachment_column,
+                attachment_dir=attachment_dir.strip() or None,
+                attachment_cache_bytes=int(attachment_cache_mb) * 1024 * 1024,
+            )
             
+            data = None
+            excel_stream = None
             with st.spinner("Preparing to send emails..."):
-                # Check if we can reuse loaded data
-                if ('loaded_data' in st.session_state and 
-                    st.session_state.loaded_data is not None and
-                    'data_source_key' in st.session_state and 
-                    st.session_state.data_source_key == data_source):
-                    data = st.session_state.loaded_data
+                # Load through the recipient cache, which serves the list the
+                # preview loaded as long as the source is unchanged, reading
+                # only the columns this run needs
+                if data_source == "Excel File (Local Upload)" and len(excel_files) == len(sheet_names) == 1:
+                    # Stream a single upload in chunks
+                    excel_stream = load_or_report(stream_excel_data, excel_files[0], sheet_names[0],
+                                                  columns=campaign.required_columns(),
+                                                  recipient_cache=recipient_cache)
                 else:
-                    # Reload data
-                    if data_source == "Google Sheets":
-                        data = load_spreadsheet_data(sheets_credentials_json, spreadsheet_url, sheet_name)
-                    elif data_source == "Excel File (Local Upload)":
-                        data = load_excel_data(excel_file, sheet_name)
-                    else:  # Google Drive Excel
-                        data = load_google_drive_excel(sheets_credentials_json, drive_file_url, sheet_name)
+                    # Several sheets are loaded at once and merged; a run never
+                    # starts with part of its recipient list
+                    started = time.perf_counter()
+                    data = load_recipients(recipient_loads(columns=campaign.required_columns(),
+                                                           metrics=campaign.metrics),
+                                           campaign.email_column, allow_partial=False)
+                    if data_source == "Google Sheets" and campaign.metrics is not None:
+                        # (the Excel loaders record their own load time)
+                        campaign.metrics.record('data_load', time.perf_counter() - started)
             
-            if data:
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                success_count = 0
-                fail_count = 0
-                
-                # Get selected email column
-                email_col = st.session_state.get('email_column', 'email')
-                
-                for idx, row in enumerate(data):
-                    if email_col not in row:
-                        st.warning(f"⚠️ Row {idx+1}: Email address not found in column '{email_col}'")
-                        fail_count += 1
-                        continue
-                    
-                    recipient_email = row[email_col]
-                    
-                    # Check if email is empty
-                    if not recipient_email or str(recipient_email).strip() == "":
-                        st.warning(f"⚠️ Row {idx+1}: Email address is empty")
-                        fail_count += 1
-                        continue
-                    
-                    subject = apply_template(subject_template, row)
-                    body = apply_template(body_template, row)
-                    
-                    status_text.text(f"Sending: {recipient_email} ({idx+1}/{len(data)})")
-                    
-                    if test_mode:
-                        st.info(f"🧪 Test Mode: Simulating send to {recipient_email}")
-                        with st.expander(f"Email Preview: {recipient_email}"):
-                            st.write(f"**To:** {recipient_email}")
-                            if cc_list:
-                                st.write(f"**CC:** {', '.join(cc_list)}")
-                            if bcc_list:
-                                st.write(f"**BCC:** {', '.join(bcc_list)}")
-                            st.write(f"**Subject:** {subject}")
-                            st.write(f"**Body:**")
-                            st.text(body)
-                        success_count += 1
-                    else:
-                        # Remove spaces from app password
-                        clean_password = app_password.replace(" ", "")
-                        if send_email_simple(recipient_email, subject, body, sender_email, clean_password,
-                                           cc=cc_list if cc_list else None,
-                                           bcc=bcc_list if bcc_list else None):
-                            st.success(f"✅ Sent successfully: {recipient_email}")
-                            success_count += 1
-                        else:
-                            fail_count += 1
+            # Both loaded frames and streams are processed as a sequence of chunks
+            data_chunks = None
+            if data is not None and not data.empty:
+                data_chunks = [data]
+                data_columns = list(data.columns)
+                total_rows = len(data)
+            elif excel_stream is not None:
+                data_chunks = excel_stream
+                data_columns = excel_stream.header
+                total_rows = excel_stream.total_rows
+            
+            if data_chunks is not None:
+                # The SQLite stores are only opened once there is a list to run
+                campaign.suppression = SuppressionList() if use_suppression else None
+                if campaign.test_mode:
+                    # Dry run: render every email at full speed and keep only
+                    # aggregate stats; the preview below renders one page at a time
+                    with st.spinner("Rendering all emails..."):
+                        try:
+                            report, preview_frame = campaign.dry_run(data_chunks, keep_frame=True)
+                        finally:
+                            if excel_stream is not None:
+                                excel_stream.close()
+                            if campaign.suppression is not None:
+                                campaign.suppression.close()
+                    st.session_state.dry_run = {
+                        'subject_template': subject_template,
+                        'body_template': body_template,
+                        'email_column': campaign.email_column,
+                        'cc': campaign.cc,
+                        'bcc': campaign.bcc,
+                        'attachments': campaign.attachments,
+                        'attachment_column': campaign.attachment_column,
+                        'attachment_dir': campaign.attachment_dir,
+                        'report': report,
+                        'frame': preview_frame,
+                    }
+                    st.session_state.dry_run_page = 1
+                else:
+                    report_placeholders(subject_template, body_template, data_columns)
+                    if campaign.email_column not in data_columns:
+                        st.warning(f"⚠️ Email address column '{campaign.email_column}' not found")
+                    if campaign.attachment_column is not None and campaign.attachment_column not in data_columns:
+                        st.warning(f"⚠️ Attachment column '{campaign.attachment_column}' not found")
                     
-                    progress_bar.progress((idx + 1) / len(data))
-                    time.sleep(delay_seconds)
-                
-                status_text.text("Complete")
-                st.balloons()
-                
-                st.markdown("---")
-                st.subheader("📊 Sending Results")
-                col1, col2, col3 = st.columns(3)
-                col1.metric("Total", len(data))
-                col2.metric("Success", success_count)
-                col3.metric("Failed", fail_count)
+                    resources = [excel_stream, campaign.suppression]
+                    try:
+                        campaign.journal = SendJournal() if resume_campaign else None
+                        resources.append(campaign.journal)
+                        campaign.quota = QuotaLedger()
+                        resources.append(campaign.quota)
+                        
+                        if start_over and campaign.journal is not None:
+                            forgotten = campaign.journal.forget(campaign.campaign_id)
+                            st.info(f"🔁 Forgot {forgotten} journaled rows of campaign '{campaign.campaign_id}'")
+                        
+                        # From here on the worker owns the run and closes the stream and stores
+                        job = send_worker.submit(CampaignJob(
+                            campaign, data_chunks, total_rows=total_rows, columns=data_columns,
+                            name=campaign_name.strip() or subject_template, resources=resources,
+                        ))
+                    except Exception:
+                        for resource in resources:
+                            if resource is not None:
+                                resource.close()
+                        raise
+                    st.success(f"📬 Campaign queued as job #{job.id}. Its progress is shown below, "
+                               "and it keeps sending if you change settings or close this page.")
+
+# Campaigns handed to the background worker; while any is queued or running
+# the panel re-runs on its own to show their progress
+polling = send_worker.active()
+
+@st.fragment(run_every=JOB_POLL_SECONDS if polling else None)
+def show_jobs():
+    jobs = send_worker.jobs()
+    if polling and not send_worker.active():
+        # The last job just finished: one full rerun stops the polling
+        st.rerun()
+    if not jobs:
+        return
+    st.markdown("---")
+    st.subheader("📬 Campaigns")
+    if any(not job.active for job in jobs):
+        if st.button("🧹 Clear finished campaigns"):
+            send_worker.clear_finished()
+            st.rerun()
+    for job in reversed(jobs):
+        show_job(job)
+
+show_jobs()
+
+# Dry run results (kept in session state so the preview can be paged)
+if st.session_state.dry_run is not None:
+    dry_run = st.session_state.dry_run
+    report = dry_run['report']
+    
+    st.markdown("---")
+    st.subheader("🧪 Test Mode Results")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Rows", report.total)
+    col2.metric("Ready to send", report.sendable)
+    col3.metric("Dropped", report.total - report.sendable)
+    col4.metric("Render time", f"{report.render_seconds * 1000:.0f} ms")
+    
+    if report.sendable and report.distinct_messages < report.sendable:
+        st.caption(f"📨 {report.distinct_messages} distinct emails among {report.sendable} ready to send; "
+                   f"'Combine identical emails' sends each only once per batch of recipients")
+    if report.missing_email_column:
+        st.warning(f"⚠️ Email address column '{dry_run['email_column']}' not found")
+    elif report.total > report.sendable:
+        st.caption(f"Rows dropped before sending: empty address: {report.empty_email}, "
+                   f"invalid: {report.dropped['invalid']}, duplicate: {report.dropped['duplicate']}, "
+                   f"suppressed: {report.dropped['suppressed']}")
+    if report.unknown_placeholders:
+        st.warning("⚠️ Placeholders without a matching column (left as-is): "
+                   + ", ".join(f"{{{{{key}}}}}" for key in report.unknown_placeholders))
+    if report.missing_attachment_column:
+        st.warning(f"⚠️ Attachment column '{dry_run['attachment_column']}' not found; every row would be skipped")
+    if report.missing_attachments:
+        st.warning("⚠️ Attachments not found (rows listing them would be skipped): "
+                   + ", ".join(f"{path} ({rows})" for path, rows in list(report.missing_attachments.items())[:10]))
+    if report.refused_attachments:
+        st.warning("⚠️ Attachments outside the attachment folder (rows listing them would be skipped): "
+                   + ", ".join(f"{path} ({rows})" for path, rows in list(report.refused_attachments.items())[:10]))
+    if report.subject_line_breaks:
+        st.warning(f"⚠️ {report.subject_line_breaks} rows render a subject with a line break and would be skipped")
+    if report.empty_fields:
+        st.caption("Rows with an empty value per placeholder: "
+                   + ", ".join(f"{{{{{key}}}}}: {count}" for key, count in report.empty_fields.items()))
+    
+    preview_campaign = Campaign(
+        dry_run['subject_template'], dry_run['body_template'],
+        email_column=dry_run['email_column'], cc=dry_run['cc'], bcc=dry_run['bcc'],
+        attachments=dry_run['attachments'], attachment_column=dry_run['attachment_column'],
+        attachment_dir=dry_run['attachment_dir']
+    )
+    frame = dry_run['frame']
+    page_col, size_col = st.columns([1, 1])
+    page_size = size_col.selectbox("Emails per page", [10, 25, 50], key="dry_run_page_size")
+    page_count = max(1, (len(frame) + page_size - 1) // page_size)
+    page = page_col.number_input("Page", min_value=1, max_value=page_count, step=1, key="dry_run_page")
+    st.caption(f"Page {page} of {page_count}")
+    
+    start = (page - 1) * page_size
+    for idx, recipient_email, subject, body, attachments in preview_campaign.render_page(
+            frame, start, start + page_size):
+        with st.expander(f"Row {idx+1}: {recipient_email or '(no email address)'}"):
+            st.write(f"**To:** {recipient_email}")
+            if preview_campaign.cc:
+                st.write(f"**CC:** {', '.join(preview_campaign.cc)}")
+            if preview_campaign.bcc:
+                st.write(f"**BCC:** {', '.join(preview_campaign.bcc)}")
+            st.write(f"**Subject:** {subject}")
+            if attachments:
+                st.write(f"**Attachments:** {', '.join(os.path.basename(path) for path in attachments)}")
+            st.write(f"**Body:**")
+            st.text(body)
 
 # Footer
 st.markdown("---")
@@ -759,7 +1080,7 @@ with st.expander("📖 How to Use"):
     #### Use the App
     
     1. Paste the service account JSON in the sidebar
-    2. Enter the spreadsheet URL and sheet name
+    2. Enter the spreadsheet URLs and sheet names (several are loaded at once and merged)
     3. Enter your app password
     4. Choose template source (Manual Input or Upload Files)
     5. Set up email templates (either type them or upload files)
@@ -767,7 +1088,8 @@ with st.expander("📖 How to Use"):
     7. Test in Test Mode first, then send for real
     
     ### Important Notes
-    - Gmail has sending limits (approximately 500 emails per day)
-    - Set appropriate sending intervals for bulk emails
+    - Gmail has sending limits (approximately 500 emails per day); add sender accounts to send more per day
+    - Set an appropriate sending rate limit for bulk emails
     - Always test in Test Mode first before actual sending
+    - Gmail rejects emails over 25 MB, attachments included (base64 makes files about a third larger)
     """)
\ No newline at end of file
@@ -0,0 +1,171 @@
+import base64
+import email.policy
+import secrets
+from email import quoprimime
+from email.errors import HeaderParseError
+
+# Lines longer than this may not be sent as 7bit/8bit (RFC 5322)
+MAX_LINE_LENGTH = 998
+
+# Above this share of non-ASCII bytes base64 is smaller than quoted-printable
+QP_MAX_NON_ASCII_RATIO = 0.2
+
+EIGHT_BIT_MAIL_OPTION = 'BODY=8BITMIME'
+EIGHT_BIT_MAIL_OPTIONS = (EIGHT_BIT_MAIL_OPTION,)
+
+# To header of a message whose recipients must not see each other (RFC 5322 group)
+UNDISCLOSED_RECIPIENTS = 'undisclosed-recipients:;'
+
+
+def _crlf(text):
+    return text.replace('\r\n', '\n').replace('\r', '\n').replace('\n', '\r\n')
+
+
+def choose_transfer_encoding(body_bytes, allow_8bit=True):
+    """Pick the cheapest Content-Transfer-Encoding that can carry the body"""
+    long_lines = any(len(line) > MAX_LINE_LENGTH for line in body_bytes.split(b'\n'))
+    if body_bytes.isascii():
+        return 'quoted-printable' if long_lines else '7bit'
+    if allow_8bit and not long_lines:
+        return '8bit'
+    non_ascii = sum(1 for byte in body_bytes if byte > 127)
+    if non_ascii <= len(body_bytes) * QP_MAX_NON_ASCII_RATIO:
+        return 'quoted-printable'
+    return 'base64'
+
+
+def downgrade_8bit(message):
+    """The message with its 8bit parts re-encoded as quoted-printable
+
+    For servers that don't advertise 8BITMIME: only the text part of a
+    MessageFactory message can be 8bit (attachments are base64).
+    """
+    parsed = email.message_from_bytes(message, policy=email.policy.SMTP)
+    for part in parsed.walk():
+        if not part.is_multipart() and part.get('Content-Transfer-Encoding', '').lower() == '8bit':
+            raw = part.get_payload(decode=True)
+            part.replace_header('Content-Transfer-Encoding', 'quoted-printable')
+            part.set_payload(quoprimime.body_encode(raw.decode('latin-1'), eol='\n'))
+    return parsed.as_bytes()
+
+
+class MessageFactory:
+    """Builds serialized messages for one campaign
+
+    The From/Cc headers and the envelope additions are prepared once; each
+    message then only folds its To and Subject headers and encodes its body,
+    straight to bytes with the SMTP (CRLF) email policy. Bodies use 7bit or
+    8bit where possible, else quoted-printable, and base64 only for mostly
+    non-ASCII text where it is actually smaller. Attachments come already
+    encoded (attachments.AttachmentPart) and are joined in as they are.
+    """
+
+    def __init__(self, sender_email, cc=None, bcc=None, allow_8bit=True, bcc_header=False):
+        self.sender_email = sender_email
+        self.cc = list(cc or [])
+        self.bcc = list(bcc or [])
+        self.allow_8bit = allow_8bit
+        self.bcc_header = bcc_header
+        self.policy = email.policy.SMTP
+
+        # Note: BCC is not added to headers (to keep it hidden), unless the
+        # service reads recipients from the headers and strips Bcc itself
+        headers = self._fold('From', sender_email)
+        if self.cc:
+            headers += self._fold('Cc', ', '.join(self.cc))
+        headers += 'MIME-Version: 1.0\r\n'
+        self._static_headers = headers.encode('ascii')
+        self._bcc_header = ''
+        if bcc_header and self.bcc:
+            self._bcc_header = self._fold('Bcc', ', '.join(self.bcc))
+        self._envelope_extra = self.cc + self.bcc
+        # "=_" never occurs in base64 or quoted-printable text, so only
+        # 7bit/8bit bodies need checking against the boundary
+        self._boundary = self._new_boundary()
+
+    @staticmethod
+    def _new_boundary():
+        return f'=_{secrets.token_hex(12)}'.encode('ascii')
+
+    def _fold(self, name, value):
+        # A line break would end the header and start another one (e.g. a
+        # spreadsheet cell adding "Bcc: ..." through the subject)
+        if '\r' in value or '\n' in value:
+            raise HeaderParseError(f"{name} header value contains a line break (embedded header): {value!r}")
+        # Going through the header factory RFC 2047-encodes non-ASCII text
+        return self.policy.header_factory(name, value).fold(policy=self.policy)
+
+    def envelope(self, to):
+        """RCPT TO addresses for a message to one recipient"""
+        return [to] + self._envelope_extra
+
+    def group_envelope(self, recipients):
+        """RCPT TO addresses for one message shared by several recipients"""
+        return list(recipients) + self._envelope_extra
+
+    def encode_body(self, body):
+        """(header bytes, payload bytes, mail options) for a plain-text body"""
+        text = _crlf(body)
+        if not text.endswith('\r\n'):
+            text += '\r\n'
+        raw = text.encode('utf-8')
+        cte = choose_transfer_encoding(raw, self.allow_8bit)
+
+        if cte in ('7bit', '8bit'):
+            payload = raw
+        elif cte == 'quoted-printable':
+            payload = quoprimime.body_encode(raw.decode('latin-1'), eol='\r\n').encode('ascii')
+            if not payload.endswith(b'\r\n'):
+                payload += b'\r\n'
+        else:
+            payload = base64.encodebytes(raw).replace(b'\n', b'\r\n')
+
+        charset = 'us-ascii' if cte == '7bit' else 'utf-8'
+        headers = (
+            f'Content-Type: text/plain; charset="{charset}"\r\n'
+            f'Content-Transfer-Encoding: {cte}\r\n'
+        ).encode('ascii')
+        mail_options = EIGHT_BIT_MAIL_OPTIONS if cte == '8bit' else ()
+        return headers, payload, mail_options
+
+    def encode_content(self, body, attachments=()):
+        """(header bytes, payload bytes, mail options) for a body and its attachments
+
+        Without attachments this is encode_body; with them a multipart/mixed
+        holding the text part and then each attachment's encoded part.
+        """
+        body_headers, payload, mail_options = self.encode_body(body)
+        if not attachments:
+            return body_headers, payload, mail_options
+        boundary = self._boundary
+        while b'--' + boundary in payload:
+            boundary = self._new_boundary()
+        delimiter = b'--' + boundary + b'\r\n'
+        # The CRLF before a delimiter belongs to it; the body keeps its own
+        pieces = [delimiter, body_headers, b'\r\n', payload, b'\r\n']
+        for part in attachments:
+            pieces += [delimiter, part.data]
+        pieces.append(b'--' + boundary + b'--\r\n')
+        headers = b'Content-Type: multipart/mixed; boundary="' + boundary + b'"\r\n'
+        return headers, b''.join(pieces), mail_options
+
+    def build(self, to, subject, body, attachments=()):
+        """Serialize one message; returns (message bytes, mail options)"""
+        headers = (self._fold('To', to) + self._bcc_header + self._fold('Subject', subject)).encode('ascii')
+        body_headers, payload, mail_options = self.encode_content(body, attachments)
+        message = b''.join((self._static_headers, headers, body_headers, b'\r\n', payload))
+        return message, mail_options
+
+    def build_group(self, recipients, subject, body, attachments=()):
+        """Serialize one message for several recipients who stay hidden from each other
+
+        The To header names no one; the recipients only appear in the
+        envelope (see group_envelope), or in a Bcc header for services that
+        take recipients from the headers and strip it.
+        """
+        headers = self._fold('To', UNDISCLOSED_RECIPIENTS) + self._fold('Subject', subject)
+        if self.bcc_header:
+            headers += self._fold('Bcc', ', '.join(list(recipients) + self.bcc))
+        body_headers, payload, mail_options = self.encode_content(body, attachments)
+        message = b''.join((self._static_headers, headers.encode('ascii'), body_headers, b'\r\n', payload))
+        return message, mail_options
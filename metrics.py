@@ -0,0 +1,190 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_METRICS_DIR = os.path.join(os.path.expanduser('~'), '.mail_sender', 'metrics')
+
+# Histogram bucket upper bounds in seconds (Prometheus "le" labels)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+# Samples kept per stage for percentiles; older ones are replaced at random
+RESERVOIR_SIZE = 10000
+
+# Stages in the order a message goes through them
+STAGES = (
+    'data_load',
+    'nan_cleanup',
+    'template_render',
+    'mime_build',
+    'smtp_connect',
+    'smtp_starttls',
+    'smtp_login',
+    'smtp_data',
+    'rate_limit_wait',
+)
+
+# Counters that don't count rows, each exported as its own
+# mail_sender_<name>_total rather than as a rows_total outcome
+EVENT_COUNTERS = {
+    'retries': 'Sends retried after a transient failure',
+}
+
+
+class StageStats:
+    """Histogram, totals and a bounded sample of durations for one stage"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, seconds, rng):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[index] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(seconds)
+        else:
+            slot = rng.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self.samples[slot] = seconds
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_seconds': self.total,
+            'mean_seconds': self.total / self.count if self.count else 0.0,
+            'p50_seconds': self.percentile(0.50),
+            'p99_seconds': self.percentile(0.99),
+            'max_seconds': self.max,
+        }
+
+
+class RunMetrics:
+    """Thread-safe per-stage timings and counters for one sending run"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.started_at = time.time()
+        self.counters = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+
+    def record(self, stage, seconds):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats(self.buckets)
+            stats.add(seconds, self._rng)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def stages(self):
+        """Names of the stages with samples, in pipeline order"""
+        with self._lock:
+            names = list(self._stages)
+        return sorted(names, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES))
+
+    def summary(self):
+        with self._lock:
+            return {name: stats.summary() for name, stats in self._stages.items()}
+
+    def histogram(self, stage):
+        """[(bucket label, count)] for one stage, non-cumulative"""
+        with self._lock:
+            stats = self._stages.get(stage)
+            counts = list(stats.bucket_counts) if stats else [0] * (len(self.buckets) + 1)
+        labels = [f"≤{bound:g}s" for bound in self.buckets] + [f">{self.buckets[-1]:g}s"]
+        return list(zip(labels, counts))
+
+    def to_dict(self):
+        with self._lock:
+            stages = {
+                name: dict(stats.summary(), buckets={
+                    **{f"{bound:g}": count for bound, count in zip(self.buckets, stats.bucket_counts)},
+                    '+Inf': stats.bucket_counts[-1],
+                })
+                for name, stats in self._stages.items()
+            }
+            counters = dict(self.counters)
+        return {'started_at': self.started_at, 'counters': counters, 'stages': stages}
+
+    def to_prometheus(self):
+        """Prometheus text exposition format"""
+        lines = [
+            '# HELP mail_sender_stage_seconds Time spent in each stage of a sending run',
+            '# TYPE mail_sender_stage_seconds histogram',
+        ]
+        with self._lock:
+            for name, stats in self._stages.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'mail_sender_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'mail_sender_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stats.count}')
+                lines.append(f'mail_sender_stage_seconds_sum{{stage="{name}"}} {stats.total:.6f}')
+                lines.append(f'mail_sender_stage_seconds_count{{stage="{name}"}} {stats.count}')
+            counters = dict(self.counters)
+        outcomes = {name: value for name, value in counters.items() if name not in EVENT_COUNTERS}
+        if outcomes:
+            lines.append('# HELP mail_sender_rows_total Rows processed by outcome')
+            lines.append('# TYPE mail_sender_rows_total counter')
+            for name, value in outcomes.items():
+                lines.append(f'mail_sender_rows_total{{outcome="{name}"}} {value}')
+        for name, description in EVENT_COUNTERS.items():
+            if name in counters:
+                lines.append(f'# HELP mail_sender_{name}_total {description}')
+                lines.append(f'# TYPE mail_sender_{name}_total counter')
+                lines.append(f'mail_sender_{name}_total {counters[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write the metrics to path; .prom/.txt files get Prometheus text, others JSON"""
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.to_dict(), indent=2)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def export(self, directory=DEFAULT_METRICS_DIR):
+        """Write run-<timestamp>.json and .prom into directory; returns both paths"""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        base = os.path.join(directory, f"run-{stamp}")
+        # Campaigns queued together can start within the same second
+        number = 1
+        while os.path.exists(base + '.json'):
+            number += 1
+            base = os.path.join(directory, f"run-{stamp}-{number}")
+        return self.write(base + '.json'), self.write(base + '.prom')
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from frames import compact_frame, wanted_columns
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.mail_sender', 'recipients')
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Rows per chunk when an entry is read back in chunks
+DEFAULT_CHUNK_SIZE = 5000
+
+_SUFFIX = '.parquet'
+
+
+def source_key(*parts):
+    """Cache key of a recipient source, e.g. ('sheets', spreadsheet id, sheet name)
+
+    Also used for versions, which may be any string (a checksum, a revision
+    number or a timestamp).
+    """
+    return hashlib.sha1('\x00'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:16]
+
+
+def content_version(data):
+    """Version of a source known only by its bytes (uploads, local files)"""
+    return hashlib.sha1(data).hexdigest()[:16]
+
+
+def file_version(path, block_size=1024 * 1024):
+    """content_version of a local file, read in blocks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def storable_frame(frame):
+    """The frame as it is cached, and so as every load returns it
+
+    Parquet needs string column names and one type per column, which
+    frames.compact_frame already ensures for the values; categorical
+    columns are stored with dictionary encoding.
+    """
+    frame = compact_frame(frame)
+    if any(not isinstance(column, str) for column in frame.columns):
+        frame = frame.copy()
+        frame.columns = [str(column) for column in frame.columns]
+    return frame
+
+
+class CachedFrame:
+    """A cached recipient list read in DataFrame chunks, like loaders.ExcelStream
+
+    Only the given columns are read from the file, one row batch at a time.
+    """
+
+    def __init__(self, path, columns=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        import pyarrow.parquet as pq
+
+        self.chunk_size = max(1, chunk_size)
+        self._file = pq.ParquetFile(path)
+        self.header = list(self._file.schema_arrow.names)
+        self.columns = wanted_columns(self.header, columns)
+        self.total_rows = self._file.metadata.num_rows
+
+    def __iter__(self):
+        for batch in self._file.iter_batches(batch_size=self.chunk_size, columns=self.columns):
+            yield batch.to_pandas()
+
+    def read_all(self):
+        return self._file.read(columns=self.columns).to_pandas()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class RecipientCache:
+    """Disk cache of loaded recipient lists, keyed by source and content version
+
+    Each entry is a Parquet file named <source key>.<version>.<written at>,
+    so a changed source (new upload bytes, Drive checksum or Sheets
+    revision) is a miss and never served stale. Entries older than ttl
+    seconds are dropped, and the least recently used ones are evicted once
+    the cache grows past max_bytes, as in drive_cache.DriveFileCache.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL_SECONDS,
+                 max_bytes=DEFAULT_MAX_BYTES, clock=time.time):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self.hits = 0
+        self.misses = 0
+
+    def _entries(self, source=None):
+        """[(path, source, version, written at)] of every complete entry"""
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            if not name.endswith(_SUFFIX):
+                continue
+            fields = name[:-len(_SUFFIX)].split('.')
+            if len(fields) != 3 or not fields[2].isdigit():
+                continue
+            if source is None or fields[0] == source:
+                entries.append((os.path.join(self.cache_dir, name), fields[0], fields[1], int(fields[2])))
+        return entries
+
+    def _expired(self, written):
+        return self._clock() - written > self.ttl
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def open(self, source, version, columns=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """CachedFrame of the entry for this version of the source, or None"""
+        version = source_key(version)
+        for path, _, entry_version, written in self._entries(source):
+            if entry_version != version or self._expired(written):
+                continue
+            try:
+                frame = CachedFrame(path, columns=columns, chunk_size=chunk_size)
+            except (OSError, ValueError):
+                # Unreadable (e.g. truncated by a full disk): load again
+                self._remove(path)
+                continue
+            self.hits += 1
+            # Mark as recently used for eviction (another load may have
+            # evicted it meanwhile; the open file still reads)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return frame
+        self.misses += 1
+        return None
+
+    def get(self, source, version, columns=None):
+        """Cached DataFrame (only the given columns) or None"""
+        cached = self.open(source, version, columns=columns)
+        if cached is None:
+            return None
+        with cached:
+            return cached.read_all()
+
+    def put(self, source, version, frame):
+        """Store a loaded frame and return it as later hits will return it"""
+        frame = storable_frame(frame)
+        version = source_key(version)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{source}.{version}.{int(self._clock())}{_SUFFIX}")
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        os.close(fd)
+        try:
+            frame.to_parquet(temp_path, index=False)
+            os.replace(temp_path, path)
+        except Exception:
+            self._remove(temp_path)
+            raise
+        # Older versions of the source can never be hit again
+        for old_path, _, _, _ in self._entries(source):
+            if old_path != path:
+                self._remove(old_path)
+        self.evict(keep=path)
+        return frame
+
+    def evict(self, keep=None):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        entries = []
+        total = 0
+        for path, _, _, written in self._entries():
+            if path != keep and self._expired(written):
+                self._remove(path)
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for path, _, _, _ in self._entries():
+            self._remove(path)
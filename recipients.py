@@ -0,0 +1,95 @@
+import re
+
+# Reasons a row is dropped before sending
+EMPTY = 'empty'
+INVALID = 'invalid'
+DUPLICATE = 'duplicate'
+SUPPRESSED = 'suppressed'
+
+DROP_REASONS = (EMPTY, INVALID, DUPLICATE, SUPPRESSED)
+
+# Pragmatic RFC 5321 subset: dot-atom local part and a dotted domain with a
+# letter TLD. Quoted local parts and address literals are not accepted.
+_LOCAL = r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+_DOMAIN = r"(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}"
+EMAIL_PATTERN = re.compile(f"{_LOCAL}@{_DOMAIN}")
+
+# Local parts are limited to 64 characters and whole addresses to 254
+MAX_LOCAL_LENGTH = 64
+MAX_ADDRESS_LENGTH = 254
+
+
+def normalize_addresses(values):
+    """Normalize a Series of addresses for sending
+
+    Surrounding whitespace, a mailto: prefix and angle brackets are removed
+    and the domain is lowercased. The local part is kept as typed; only
+    the dedup key (see address_keys) ignores its case.
+    """
+    text = values.fillna("").astype(str).str.strip()
+    text = text.str.replace(r'^mailto:', '', case=False, regex=True).str.strip('<> \t')
+    local, at, domain = (text.str.rpartition('@')[i] for i in range(3))
+    return local + at + domain.str.lower()
+
+
+def address_keys(normalized):
+    """Dedup and lookup keys; matches journal.recipient_key"""
+    return normalized.str.lower()
+
+
+def valid_addresses(normalized):
+    """Boolean Series: which normalized addresses are syntactically deliverable"""
+    local_length = normalized.str.split('@').str[0].str.len()
+    return (
+        normalized.str.fullmatch(EMAIL_PATTERN).fillna(False).astype(bool)
+        & (normalized.str.len() <= MAX_ADDRESS_LENGTH)
+        & (local_length <= MAX_LOCAL_LENGTH)
+    )
+
+
+class RecipientScreen:
+    """Drops undeliverable rows before any SMTP work is spent on them
+
+    Each chunk's address column is normalized and validated column-wise.
+    Keys of accepted addresses go into a set, so a duplicate is caught
+    however far apart its rows are, and the remaining addresses are looked
+    up in the suppression list (if any) in one batch per chunk.
+    """
+
+    def __init__(self, suppression=None):
+        self.suppression = suppression
+        self.seen = set()
+        self.accepted = 0
+        self.dropped = {reason: 0 for reason in DROP_REASONS}
+
+    def screen(self, addresses):
+        """(normalized addresses, reasons) for one chunk's address Series
+
+        Both are lists aligned with the input; a reason of None means the
+        row should be sent, otherwise it is one of DROP_REASONS.
+        """
+        import pandas as pd
+
+        normalized = normalize_addresses(addresses)
+        keys = address_keys(normalized)
+        empty = normalized == ""
+        valid = valid_addresses(normalized) & ~empty
+
+        reasons = pd.Series(None, index=normalized.index, dtype=object)
+        reasons[~valid] = INVALID
+        reasons[empty] = EMPTY
+        duplicate = valid & (keys.duplicated() | keys.isin(self.seen))
+        reasons[duplicate] = DUPLICATE
+
+        candidates = reasons.isna()
+        if self.suppression is not None and candidates.any():
+            suppressed = self.suppression.suppressed_among(keys[candidates].tolist())
+            if suppressed:
+                reasons[candidates & keys.isin(suppressed)] = SUPPRESSED
+
+        self.seen.update(keys[valid].tolist())
+        counts = reasons.value_counts()
+        for reason in DROP_REASONS:
+            self.dropped[reason] += int(counts.get(reason, 0))
+        self.accepted += int(reasons.isna().sum())
+        return normalized.tolist(), [None if pd.isna(reason) else reason for reason in reasons]
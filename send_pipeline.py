@@ -0,0 +1,226 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting how many sends start per second"""
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(max(1, capacity))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate):
+        """Change the refill rate, keeping the tokens earned so far"""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+
+    def pause(self, seconds):
+        """Hold back every sender for about this long, e.g. after throttling"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+    def acquire(self, tokens=1):
+        """Block until the tokens are available; return the seconds spent waiting
+
+        More tokens than the capacity could never be available, so asking
+        for them raises ValueError instead of waiting forever.
+        """
+        if tokens > self.capacity:
+            raise ValueError(f"cannot take {tokens} tokens from a bucket holding {self.capacity:g}")
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                # Allow for float rounding, or a refill landing a hair short
+                # of a whole token would spin on sleeps too small to count
+                if self._tokens >= tokens - 1e-9:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+
+class AdaptiveRate:
+    """Steers a TokenBucket's rate from the server's responses (AIMD)
+
+    Every clean send raises the rate by a small step up to max_rate; a
+    throttling response halves it (down to min_rate) and pauses all senders
+    for a jittered backoff. Further throttles during that pause are the
+    same event and are ignored, so a burst of in-flight failures backs off
+    only once. Call it from a single thread.
+    """
+
+    def __init__(self, limiter, max_rate=None, min_rate=None, increase=0.02, decrease=0.5,
+                 backoff=5.0, clock=time.monotonic, rng=None):
+        self.limiter = limiter
+        start = limiter.rate
+        self.max_rate = max(start, max_rate or start)
+        self.min_rate = min(start, min_rate or start / 10.0)
+        # Additive step per clean send, as a share of the starting rate
+        self.step = start * increase
+        self.decrease = decrease
+        self.backoff = backoff
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._quiet_until = 0.0
+        self.throttles = 0
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    def succeeded(self):
+        if self.limiter.rate < self.max_rate and self._clock() >= self._quiet_until:
+            self.limiter.set_rate(min(self.max_rate, self.limiter.rate + self.step))
+
+    def throttled(self):
+        now = self._clock()
+        if now < self._quiet_until:
+            return
+        self.throttles += 1
+        self.limiter.set_rate(max(self.min_rate, self.limiter.rate * self.decrease))
+        pause = self.backoff * self._rng.uniform(0.5, 1.5)
+        self.limiter.pause(pause)
+        self._quiet_until = now + pause
+
+
+def backoff_delay(attempt, base=2.0, cap=60.0, rng=random):
+    """Exponential backoff with full jitter before retry number `attempt` (1-based)"""
+    return rng.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class PartialFailure(Exception):
+    """Raised by send_one when only part of a job failed
+
+    value is what send_one would have returned for the part that is done;
+    job is the part that failed with error, and is retried on its own.
+    """
+
+    def __init__(self, value, job, error):
+        super().__init__(str(error))
+        self.value = value
+        self.job = job
+        self.error = error
+
+
+class SendResult:
+    """Outcome of one job run through the pipeline"""
+
+    def __init__(self, job, ok, error=None, elapsed=0.0, waited=0.0, value=None):
+        self.job = job
+        self.ok = ok
+        # Whatever send_one returned
+        self.value = value
+        # How many times the job was run, including retries
+        self.attempts = 1
+        self.error = error
+        self.elapsed = elapsed
+        self.waited = waited
+        # The failed SendResult of the rest of a job that raised PartialFailure
+        self.failed_part = None
+
+
+def _run_job(job, send_one, limiter, tokens):
+    waited = limiter.acquire(tokens) if limiter is not None else 0.0
+    started = time.perf_counter()
+    try:
+        value = send_one(job)
+    except PartialFailure as e:
+        elapsed = time.perf_counter() - started
+        result = SendResult(job, True, elapsed=elapsed, waited=waited, value=e.value)
+        result.failed_part = SendResult(e.job, False, error=e.error, elapsed=elapsed)
+        return result
+    except Exception as e:
+        return SendResult(job, False, error=e, elapsed=time.perf_counter() - started, waited=waited)
+    return SendResult(job, True, elapsed=time.perf_counter() - started, waited=waited, value=value)
+
+
+# Marks the end of the job iterator
+_NO_JOB = object()
+
+
+def send_concurrently(jobs, send_one, workers=4, limiter=None, retry=None, cost=None,
+                      clock=time.monotonic, sleep=time.sleep):
+    """Run send_one(job) for every job on a pool of worker threads
+
+    Jobs are pulled lazily so at most a few per worker are in flight, and a
+    shared limiter (e.g. a TokenBucket) paces sends across all workers.
+    Yields a SendResult per job in completion order; send_one signals a
+    failure by raising.
+
+    retry, if given, is called with every failed SendResult and returns the
+    seconds to wait before running the job again, or None to give up. Jobs
+    waiting for a retry are run ahead of fresh jobs once due, and only the
+    final outcome of each job is yielded. When send_one raises
+    PartialFailure, the done part is yielded as a success and the failed
+    part goes through retry like a failed job of its own.
+
+    cost(job), if given, is the number of limiter tokens a job takes (e.g.
+    the messages in a batch); the limiter's capacity must allow for it.
+    """
+    workers = max(1, workers)
+    max_in_flight = workers * 2
+    jobs = iter(jobs)
+    jobs_left = True
+    # Future -> attempt number
+    pending = {}
+    # Heap of (due time, sequence, job, attempt number)
+    retries = []
+    sequence = itertools.count()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sender') as executor:
+        while True:
+            while len(pending) < max_in_flight:
+                if retries and retries[0][0] <= clock():
+                    _, _, job, attempt = heapq.heappop(retries)
+                elif jobs_left:
+                    job = next(jobs, _NO_JOB)
+                    if job is _NO_JOB:
+                        jobs_left = False
+                        continue
+                    attempt = 1
+                else:
+                    break
+                tokens = cost(job) if cost is not None else 1
+                pending[executor.submit(_run_job, job, send_one, limiter, tokens)] = attempt
+
+            if not pending:
+                if not retries:
+                    return
+                sleep(max(0.0, retries[0][0] - clock()))
+                continue
+
+            timeout = max(0.0, retries[0][0] - clock()) if retries else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                result.attempts = pending.pop(future)
+                for outcome in (result, result.failed_part):
+                    if outcome is None:
+                        continue
+                    outcome.attempts = result.attempts
+                    delay = retry(outcome) if retry is not None and not outcome.ok else None
+                    if delay is None:
+                        yield outcome
+                    else:
+                        heapq.heappush(retries, (clock() + delay, next(sequence), outcome.job,
+                                                 outcome.attempts + 1))
+
@@ -0,0 +1,257 @@
+import smtplib
+import threading
+import queue
+from contextlib import contextmanager, nullcontext
+
+from messages import EIGHT_BIT_MAIL_OPTION, downgrade_8bit
+
+SMTP_HOST = 'smtp.gmail.com'
+SMTP_PORT = 587
+
+# Reply code the server uses when it is closing the channel ("service not available")
+SMTP_CLOSING_CODE = 421
+
+
+class PoolStats:
+    """Counters describing how much connection work a run actually did"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.handshakes = 0
+        self.reconnects = 0
+        self.recycles = 0
+        self.messages = 0
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'handshakes': self.handshakes,
+                'reconnects': self.reconnects,
+                'recycles': self.recycles,
+                'messages': self.messages,
+            }
+
+
+def is_connection_lost(error):
+    """Return True if the error means the connection is gone and a reconnect may help"""
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in error.recipients.values()]
+        return bool(codes) and all(code == SMTP_CLOSING_CODE for code in codes)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == SMTP_CLOSING_CODE
+    if isinstance(error, smtplib.SMTPException):
+        return False
+    # Dropped or reset sockets surface as plain OSErrors
+    return isinstance(error, OSError)
+
+
+# How a failed send should be treated
+TRANSIENT = 'transient'
+THROTTLED = 'throttled'
+PERMANENT = 'permanent'
+
+
+def _error_codes(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return [(code, message) for code, message in error.recipients.values()]
+    if isinstance(error, smtplib.SMTPResponseException):
+        return [(error.smtp_code, error.smtp_error)]
+    return []
+
+
+def classify_smtp_error(error):
+    """TRANSIENT, THROTTLED or PERMANENT for an exception raised while sending
+
+    4xx replies are transient and 5xx replies permanent. Throttling (421,
+    or a 4.7.x enhanced status such as Gmail's "try again later") is a
+    transient failure that also means the sender should slow down.
+    Dropped connections are transient; anything else is permanent.
+    """
+    codes = _error_codes(error)
+    if not codes:
+        if isinstance(error, (smtplib.SMTPServerDisconnected, OSError)):
+            return TRANSIENT
+        return PERMANENT
+    if any(code >= 500 for code, _ in codes):
+        return PERMANENT
+    for code, message in codes:
+        text = message.decode('utf-8', 'replace') if isinstance(message, bytes) else str(message)
+        if code == SMTP_CLOSING_CODE or text.startswith('4.7.') or ' 4.7.' in text:
+            return THROTTLED
+    if all(400 <= code < 500 for code, _ in codes):
+        return TRANSIENT
+    return PERMANENT
+
+
+class SMTPSession:
+    """A single authenticated SMTP connection that is reused across messages"""
+
+    def __init__(self, sender_email, app_password, host=SMTP_HOST, port=SMTP_PORT,
+                 max_messages=100, timeout=30, stats=None, metrics=None):
+        self.sender_email = sender_email
+        self.app_password = app_password
+        self.host = host
+        self.port = port
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.stats = stats if stats is not None else PoolStats()
+        # Optional metrics.RunMetrics receiving per-stage timings
+        self.metrics = metrics
+        self.server = None
+        self.sent_on_connection = 0
+
+    def connect(self):
+        """Open the connection, upgrade to TLS and log in"""
+        self.close()
+        with self._timed('smtp_connect'):
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            with self._timed('smtp_starttls'):
+                server.starttls()
+            with self._timed('smtp_login'):
+                server.login(self.sender_email, self.app_password)
+        except Exception:
+            self._quit(server)
+            raise
+        self.server = server
+        self.sent_on_connection = 0
+        self.stats.increment('handshakes')
+
+    def _timed(self, stage):
+        return self.metrics.time(stage) if self.metrics is not None else nullcontext()
+
+    def close(self):
+        """Close the connection, ignoring errors from an already dead socket"""
+        if self.server is not None:
+            self._quit(self.server)
+            self.server = None
+            self.sent_on_connection = 0
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _ensure_connected(self):
+        if self.server is None:
+            self.connect()
+        elif self.max_messages and self.sent_on_connection >= self.max_messages:
+            # Recycle long-lived connections before the server starts refusing them
+            self.stats.increment('recycles')
+            self.connect()
+
+    def _for_server(self, message, mail_options):
+        """(message, ESMTP options) as this server can take them
+
+        Options it doesn't advertise are left out; without 8BITMIME an 8bit
+        body is re-encoded as quoted-printable rather than sent as it is.
+        """
+        options = [option for option in mail_options
+                   if self.server.has_extn(option.split('=')[-1].lower())]
+        if EIGHT_BIT_MAIL_OPTION in mail_options and EIGHT_BIT_MAIL_OPTION not in options:
+            message = downgrade_8bit(message)
+        return message, options
+
+    def sendmail(self, from_addr, recipients, message, mail_options=()):
+        """Send one message, reconnecting once if the connection was dropped
+
+        A 421 "try again later" is raised instead, after closing the
+        connection, so the caller can back off.
+        """
+        self._ensure_connected()
+        try:
+            with self._timed('smtp_data'):
+                result = self.server.sendmail(from_addr, recipients, *self._for_server(message, mail_options))
+        except Exception as e:
+            if not is_connection_lost(e):
+                raise
+            if classify_smtp_error(e) == THROTTLED:
+                # The server asked to come back later: drop the connection and
+                # let the caller back off instead of reconnecting straight away
+                self.close()
+                raise
+            self.stats.increment('reconnects')
+            self.connect()
+            with self._timed('smtp_data'):
+                result = self.server.sendmail(from_addr, recipients, *self._for_server(message, mail_options))
+        self.sent_on_connection += 1
+        self.stats.increment('messages')
+        return result
+
+
+class SMTPPool:
+    """A bounded pool of SMTPSession objects shared for a whole sending run"""
+
+    def __init__(self, sender_email, app_password, size=1, max_messages=100,
+                 host=SMTP_HOST, port=SMTP_PORT, timeout=30, metrics=None):
+        self.sender_email = sender_email
+        self.app_password = app_password
+        self.size = max(1, size)
+        self.max_messages = max_messages
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.stats = PoolStats()
+        self.metrics = metrics
+        self._idle = queue.LifoQueue()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _new_session(self):
+        return SMTPSession(
+            self.sender_email, self.app_password, host=self.host, port=self.port,
+            max_messages=self.max_messages, timeout=self.timeout, stats=self.stats,
+            metrics=self.metrics
+        )
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._sessions) < self.size:
+                session = self._new_session()
+                self._sessions.append(session)
+                return session
+        return self._idle.get()
+
+    @contextmanager
+    def session(self):
+        """Borrow a session for the duration of the with-block"""
+        session = self._acquire()
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
+
+    def sendmail(self, from_addr, recipients, message, mail_options=()):
+        with self.session() as session:
+            return session.sendmail(from_addr, recipients, message, mail_options)
+
+    @property
+    def handshakes(self):
+        return self.stats.handshakes
+
+    def close(self):
+        """Close every connection opened by the pool"""
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
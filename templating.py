@@ -0,0 +1,119 @@
+import re
+from functools import lru_cache
+
+# {{variable_name}} placeholders; braces are not allowed inside the name
+PLACEHOLDER_PATTERN = re.compile(r'\{\{([^{}]*)\}\}')
+
+
+def _column_text(values):
+    """str() of every cell of a Series; categoricals convert each distinct value once"""
+    import pandas as pd
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes = values.cat.codes
+        if not (codes < 0).any():
+            return pd.Series(values.cat.categories.astype(str).take(codes), index=values.index)
+    text = values.astype(str)
+    if text.isna().any():
+        # From pandas 3 astype(str) leaves missing cells missing; give them
+        # their str() ("nan", "None") like apply_template does
+        text = values.astype(object).map(str)
+    return text
+
+
+class CompiledTemplate:
+    """A template parsed once into literal and placeholder segments"""
+
+    def __init__(self, text):
+        self.text = text
+        # Literal text and raw placeholder text, in order. Placeholder slots
+        # are overwritten per row; missing keys keep their raw {{key}} text.
+        self._parts = []
+        self._slots = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            if match.start() > position:
+                self._parts.append(text[position:match.start()])
+            self._slots.append((len(self._parts), match.group(1)))
+            self._parts.append(match.group(0))
+            position = match.end()
+        if position < len(text):
+            self._parts.append(text[position:])
+        self.placeholders = list(dict.fromkeys(key for _, key in self._slots))
+
+    @property
+    def segments(self):
+        """(literal, key) pairs in order; exactly one of the two is None"""
+        slot_keys = dict(self._slots)
+        return [(None, slot_keys[i]) if i in slot_keys else (part, None)
+                for i, part in enumerate(self._parts)]
+
+    def render(self, row):
+        """Fill the placeholders from a row dict in a single join"""
+        parts = self._parts[:]
+        for index, key in self._slots:
+            if key in row:
+                parts[index] = str(row[key])
+        return ''.join(parts)
+
+    def render_frame(self, frame):
+        """Render every row of a DataFrame at once, returning a string Series
+
+        Each placeholder column is converted to str once and the segments
+        are concatenated column-wise instead of row by row. Cells render as
+        render() renders them, so unfilled NaN cells come out as "nan".
+        """
+        import pandas as pd
+
+        columns = {str(column): column for column in frame.columns}
+        slot_keys = dict(self._slots)
+        # Text dtype of the installed pandas (object, or str from pandas 3),
+        # so even an empty result can be concatenated with the columns
+        result = pd.Series('', index=frame.index, dtype=str)
+        for index, part in enumerate(self._parts):
+            key = slot_keys.get(index)
+            if key is not None and key in columns:
+                result = result + _column_text(frame[columns[key]])
+            else:
+                result = result + part
+        return result
+
+    def __repr__(self):
+        return f"CompiledTemplate({self.text[:40]!r}, placeholders={self.placeholders!r})"
+
+
+@lru_cache(maxsize=64)
+def compile_template(text):
+    """Return the (cached) compiled form of a template string"""
+    return CompiledTemplate(text)
+
+
+def apply_template(template, data):
+    """Fill the {{key}} placeholders of a template string from a row dict"""
+    return compile_template(template).render(data)
+
+
+def check_placeholders(templates, columns):
+    """Compare the placeholders of compiled templates against the data columns
+
+    Returns (unknown, unused): placeholders with no matching column, and
+    columns that no template refers to.
+    """
+    columns = [str(column) for column in columns]
+    used = []
+    for template in templates:
+        used.extend(template.placeholders)
+    used = list(dict.fromkeys(used))
+    column_set = set(columns)
+    unknown = [key for key in used if key not in column_set]
+    used_set = set(used)
+    unused = [column for column in columns if column not in used_set]
+    return unknown, unused
+
+
+def required_columns(templates, email_column):
+    """Columns a run actually reads: every placeholder plus the email column"""
+    columns = [email_column]
+    for template in templates:
+        columns.extend(template.placeholders)
+    return list(dict.fromkeys(str(column) for column in columns))
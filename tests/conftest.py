@@ -0,0 +1,51 @@
+import os
+import smtplib
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smtp_pool import classify_smtp_error
+
+
+class RecordingTransport:
+    """Accepts every message except those to the refused addresses"""
+
+    name = 'smtp'
+    batch_size = 1
+    bcc_in_headers = False
+
+    def __init__(self, refused=()):
+        self.refused = set(refused)
+        self.sent = []
+
+    def send(self, account, messages):
+        errors = []
+        for recipients, message, mail_options in messages:
+            if recipients[0] in self.refused:
+                errors.append(smtplib.SMTPRecipientsRefused({recipients[0]: (554, b'5.7.1 Message rejected')}))
+            else:
+                self.sent.append(recipients[0])
+                errors.append(None)
+        return errors
+
+    @staticmethod
+    def classify(error):
+        return classify_smtp_error(error)
+
+    def take_throttles(self):
+        return 0
+
+    def stats(self):
+        return {'messages': len(self.sent)}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def recording_transport():
+    """RecordingTransport, called as recording_transport(refused=...) for each transport a test needs"""
+    return RecordingTransport
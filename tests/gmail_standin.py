@@ -0,0 +1,141 @@
+"""Offline stand-in for the Gmail API batch endpoint
+
+An httplib2-compatible object, in the spirit of googleapiclient's
+HttpMockSequence, that answers every part of a batch request instead of
+replaying fixed responses. Build a service on it without credentials:
+
+    standin = GmailBatchStandin(latency=0.05, error_rates={429: 0.01})
+    service = build('gmail', 'v1', http=standin, static_discovery=True)
+
+Injected errors per sub-request:
+
+    429  rate limit exceeded (retryable, slow down)
+    500  backend error (retryable)
+    400  invalid message (permanent)
+"""
+import base64
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import httplib2
+
+_BOUNDARY = re.compile(r'boundary="?([^";]+)"?')
+_CONTENT_ID = re.compile(r'^Content-ID:\s*<([^>]+)>', re.IGNORECASE | re.MULTILINE)
+
+_REASONS = {
+    429: ('Too Many Requests', 'rateLimitExceeded', 'User-rate limit exceeded'),
+    500: ('Internal Server Error', 'backendError', 'Backend Error'),
+    400: ('Bad Request', 'invalidArgument', 'Invalid To header'),
+}
+
+
+class StandinStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.http_requests = 0
+        self.batches = 0
+        self.sub_requests = 0
+        self.messages = 0
+        self.bytes = 0
+        self.injected = {code: 0 for code in _REASONS}
+
+    def add(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'http_requests': self.http_requests,
+                'batches': self.batches,
+                'sub_requests': self.sub_requests,
+                'messages': self.messages,
+                'bytes': self.bytes,
+                'injected': dict(self.injected),
+            }
+
+
+class GmailBatchStandin:
+    """Answers users.messages.send, singly or in batches, without a network"""
+
+    def __init__(self, latency=0.0, error_rates=None, seed=1):
+        # Seconds added to every HTTP round trip
+        self.latency = latency
+        # {429: rate, 500: rate, 400: rate}
+        self.error_rates = dict(error_rates or {})
+        self.random = random.Random(seed)
+        self.stats = StandinStats()
+        # Raw messages accepted, in order
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def _inject(self):
+        with self._lock:
+            for code, rate in self.error_rates.items():
+                if rate and self.random.random() < rate:
+                    with self.stats.lock:
+                        self.stats.injected[code] += 1
+                    return code
+        return None
+
+    def _answer(self, body):
+        """(status, JSON bytes) for one messages.send request body"""
+        code = self._inject()
+        if code is not None:
+            reason, error_reason, message = _REASONS[code]
+            return code, reason, json.dumps({'error': {
+                'code': code, 'message': message,
+                'errors': [{'reason': error_reason, 'message': message}],
+            }}).encode('utf-8')
+        raw = json.loads(body)['raw']
+        with self._lock:
+            self.sent.append(base64.urlsafe_b64decode(raw))
+            message_id = f"{len(self.sent):016x}"
+        self.stats.add('messages')
+        return 200, 'OK', json.dumps({'id': message_id, 'threadId': message_id,
+                                      'labelIds': ['SENT']}).encode('utf-8')
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        body = body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        self.stats.add('http_requests')
+        self.stats.add('bytes', len(body))
+
+        if '/batch' not in uri:
+            status, reason, content = self._answer(body)
+            return httplib2.Response({'status': str(status), 'content-type': 'application/json'}), content
+
+        self.stats.add('batches')
+        boundary = _BOUNDARY.search(headers['content-type']).group(1)
+        parts = body.split(b'--' + boundary.encode('ascii'))[1:-1]
+        response_boundary = uuid.uuid4().hex
+        out = []
+        for part in parts:
+            text = part.decode('utf-8')
+            content_id = _CONTENT_ID.search(text).group(1)
+            # The embedded HTTP request's body follows its blank line
+            inner = text.split('\r\n\r\n', 2)[-1] if '\r\n\r\n' in text else text.split('\n\n', 2)[-1]
+            self.stats.add('sub_requests')
+            status, reason, content = self._answer(inner.strip())
+            out.append(
+                f"--{response_boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{content.decode('utf-8')}\r\n"
+            )
+        out.append(f"--{response_boundary}--\r\n")
+        response = httplib2.Response({
+            'status': '200',
+            'content-type': f'multipart/mixed; boundary={response_boundary}',
+        })
+        return response, ''.join(out).encode('utf-8')
@@ -0,0 +1,231 @@
+"""In-process SMTP server standing in for smtp.gmail.com in tests and benchmarks
+
+Speaks enough ESMTP for smtplib: EHLO, STARTTLS (with a throwaway
+self-signed certificate), AUTH PLAIN/LOGIN, MAIL, RCPT, DATA, RSET, NOOP
+and QUIT. Every reply can be delayed to emulate network latency, and
+errors can be injected at a configurable rate:
+
+    421  the server closes the connection (client must reconnect)
+    451  temporary failure on DATA
+    550  permanent recipient rejection on RCPT
+"""
+import os
+import random
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+
+def make_self_signed_cert(directory):
+    """Write cert.pem/key.pem for localhost into directory and return their paths"""
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    try:
+        import datetime
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256())
+        )
+        with open(key_path, 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM,
+                                      serialization.PrivateFormat.TraditionalOpenSSL,
+                                      serialization.NoEncryption()))
+        with open(cert_path, 'wb') as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+    except ImportError:
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+             '-subj', '/CN=localhost', '-keyout', key_path, '-out', cert_path],
+            check=True, capture_output=True
+        )
+    return cert_path, key_path
+
+
+class StandinStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.tls_handshakes = 0
+        self.logins = 0
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self.injected = {421: 0, 451: 0, 550: 0}
+
+    def add(self, name, amount=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'connections': self.connections,
+                'tls_handshakes': self.tls_handshakes,
+                'logins': self.logins,
+                'messages': self.messages,
+                'recipients': self.recipients,
+                'bytes': self.bytes,
+                'injected': dict(self.injected),
+            }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.config = self.server.config
+        self.stats = self.server.stats
+        self.stats.add('connections')
+
+    def reply(self, line):
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+        self.wfile.flush()
+
+    def inject(self, code):
+        rate = self.config.error_rates.get(code, 0)
+        if rate and self.config.random.random() < rate:
+            with self.stats.lock:
+                self.stats.injected[code] += 1
+            return True
+        return False
+
+    def ehlo(self, tls):
+        lines = ['250-localhost', '250-8BITMIME', '250-SIZE 35882577']
+        if not tls:
+            lines.append('250-STARTTLS')
+        lines.append('250 AUTH PLAIN LOGIN')
+        for line in lines:
+            self.wfile.write(line.encode('ascii') + b'\r\n')
+        if self.config.latency:
+            time.sleep(self.config.latency)
+        self.wfile.flush()
+
+    def handle(self):
+        tls = False
+        self.reply('220 localhost ESMTP stand-in')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.ehlo(tls)
+            elif verb == 'STARTTLS':
+                self.reply('220 Ready to start TLS')
+                tls_socket = self.server.ssl_context.wrap_socket(self.request, server_side=True)
+                self.request = tls_socket
+                self.rfile = tls_socket.makefile('rb')
+                self.wfile = tls_socket.makefile('wb')
+                tls = True
+                self.stats.add('tls_handshakes')
+            elif verb == 'AUTH':
+                parts = command.split()
+                if len(parts) >= 2 and parts[1].upper() == 'LOGIN' and len(parts) == 2:
+                    self.reply('334 VXNlcm5hbWU6')
+                    self.rfile.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                elif len(parts) == 2:
+                    self.reply('334 ')
+                    self.rfile.readline()
+                self.stats.add('logins')
+                self.reply('235 2.7.0 Accepted')
+            elif verb == 'MAIL':
+                if self.inject(421):
+                    self.reply('421 4.7.0 Try again later, closing connection')
+                    return
+                self.reply('250 2.1.0 OK')
+            elif verb == 'RCPT':
+                if self.inject(550):
+                    self.reply('550 5.1.1 No such user')
+                else:
+                    self.stats.add('recipients')
+                    self.reply('250 2.1.5 OK')
+            elif verb == 'DATA':
+                self.reply('354 Go ahead')
+                size = 0
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b'.\r\n':
+                        break
+                    size += len(data)
+                self.stats.add('bytes', size)
+                if self.inject(451):
+                    self.reply('451 4.3.0 Temporary failure')
+                else:
+                    self.stats.add('messages')
+                    self.reply('250 2.0.0 OK queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 2.0.0 OK')
+            elif verb == 'QUIT':
+                self.reply('221 2.0.0 Bye')
+                return
+            else:
+                self.reply('502 5.5.2 Command not recognized')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandinConfig:
+    def __init__(self, latency=0.0, error_rates=None, seed=1):
+        # Seconds added before every reply
+        self.latency = latency
+        # {421: rate, 451: rate, 550: rate}
+        self.error_rates = dict(error_rates or {})
+        self.random = random.Random(seed)
+
+
+class SMTPStandin:
+    """Run the stand-in on a free localhost port in a background thread"""
+
+    def __init__(self, latency=0.0, error_rates=None, seed=1):
+        self.config = StandinConfig(latency, error_rates, seed)
+        self.stats = StandinStats()
+        self._cert_dir = tempfile.TemporaryDirectory()
+        cert_path, key_path = make_self_signed_cert(self._cert_dir.name)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.config = self.config
+        self.server.stats = self.stats
+        self.server.ssl_context = context
+        self.host, self.port = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._cert_dir.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,92 @@
+import pandas as pd
+import pytest
+
+from accounts import AccountPool, QuotaExhausted, SenderAccount, parse_accounts
+from engine import Campaign
+from journal import QuotaLedger
+
+
+def pool(*quotas, used=None):
+    return AccountPool([SenderAccount(f"sender{i}@example.com", 'pw', quota) for i, quota in enumerate(quotas)],
+                       used=used)
+
+
+def lease_all(accounts, count, size=1):
+    leased = []
+    for _ in range(count):
+        with accounts.lease(size) as account:
+            leased.append(account.email)
+    return leased
+
+
+def test_leases_go_round_robin_and_spill_over_when_an_account_runs_out():
+    accounts = pool(2, 5)
+    assert lease_all(accounts, 6) == [
+        'sender0@example.com', 'sender1@example.com', 'sender0@example.com',
+        'sender1@example.com', 'sender1@example.com', 'sender1@example.com',
+    ]
+    assert accounts.remaining() == {'sender0@example.com': 0, 'sender1@example.com': 1}
+
+
+def test_usage_from_earlier_runs_counts_against_the_quota():
+    accounts = pool(3, 3, used={'sender0@example.com': 3})
+    assert lease_all(accounts, 3) == ['sender1@example.com'] * 3
+    assert accounts.exhausted()
+    with pytest.raises(QuotaExhausted):
+        lease_all(accounts, 1)
+
+
+def test_a_batch_only_goes_to_an_account_that_can_take_all_of_it():
+    accounts = pool(3, 10)
+    assert lease_all(accounts, 2, size=4) == ['sender1@example.com', 'sender1@example.com']
+    assert accounts.remaining() == {'sender0@example.com': 3, 'sender1@example.com': 2}
+    assert accounts.exhausted(4)
+    assert not accounts.exhausted(3)
+
+
+def test_a_failed_send_gives_its_quota_back():
+    accounts = pool(1)
+    with pytest.raises(OSError):
+        with accounts.lease():
+            raise OSError("connection lost")
+    assert accounts.remaining() == {'sender0@example.com': 1}
+    assert lease_all(accounts, 1) == ['sender0@example.com']
+
+
+def test_accounts_without_a_quota_are_never_exhausted():
+    accounts = pool(None)
+    assert len(lease_all(accounts, 1000)) == 1000
+    assert not accounts.exhausted()
+
+
+def test_parse_accounts():
+    accounts = parse_accounts("# extra senders\na@example.com, abcd efgh ijkl mnop\n\nb@example.com, pw, 300\n",
+                              daily_quota=100)
+    assert [(a.email, a.app_password, a.daily_quota) for a in accounts] == [
+        ('a@example.com', 'abcdefghijklmnop', 100), ('b@example.com', 'pw', 300)]
+    with pytest.raises(ValueError, match='Line 1'):
+        parse_accounts("a@example.com")
+
+
+def test_quota_usage_is_kept_per_account_and_day(tmp_path):
+    ledger = QuotaLedger(str(tmp_path / 'journal.sqlite3'))
+    try:
+        ledger.add('Sender@Example.com', day='2026-05-01')
+        ledger.add('sender@example.com', 2, day='2026-05-01')
+        ledger.add('sender@example.com', day='2026-05-02')
+        assert ledger.used('sender@example.com', day='2026-05-01') == 3
+        assert ledger.used('sender@example.com', day='2026-05-02') == 1
+        assert ledger.used('other@example.com', day='2026-05-01') == 0
+    finally:
+        ledger.close()
+
+
+def test_a_run_reports_the_quota_left_per_account(recording_transport):
+    recipients = pd.DataFrame({'email': [f"user{i}@example.com" for i in range(4)]})
+    accounts = [SenderAccount('sender0@example.com', 'pw', 1), SenderAccount('sender1@example.com', 'pw', 2),
+                SenderAccount('sender2@example.com', 'pw', None)]
+    campaign = Campaign('Hi', 'Body', test_mode=False, send_rate=1e6, rate_unit='second',
+                        accounts=accounts, transport=recording_transport())
+    result = campaign.run([recipients])
+    assert result.accounts == {'sender0@example.com': 1, 'sender1@example.com': 2, 'sender2@example.com': 1}
+    assert result.quota_left == {'sender0@example.com': 0, 'sender1@example.com': 0, 'sender2@example.com': None}
@@ -0,0 +1,84 @@
+import email
+import email.policy
+import os
+
+import pandas as pd
+import pytest
+
+from attachments import AttachmentCache, confined_path, encode_attachment
+from engine import Campaign, SendEvent
+from messages import MessageFactory
+
+
+@pytest.fixture
+def folder(tmp_path):
+    folder = tmp_path / 'attachments'
+    (folder / 'invoices').mkdir(parents=True)
+    (folder / 'invoices' / 'a.pdf').write_bytes(b'%PDF a')
+    (tmp_path / 'secret.txt').write_text('secret')
+    return folder
+
+
+def test_confined_path_accepts_files_inside_the_folder(folder):
+    assert confined_path('invoices/a.pdf', str(folder)) == os.path.realpath(folder / 'invoices' / 'a.pdf')
+    assert confined_path('invoices/../invoices/a.pdf', str(folder)) == os.path.realpath(folder / 'invoices' / 'a.pdf')
+
+
+@pytest.mark.parametrize('path', ['../secret.txt', 'invoices/../../secret.txt', '/etc/passwd'])
+def test_confined_path_refuses_paths_leaving_the_folder(folder, path):
+    with pytest.raises(ValueError):
+        confined_path(path, str(folder))
+
+
+def test_confined_path_refuses_symbolic_links_out_of_the_folder(folder):
+    os.symlink(folder.parent / 'secret.txt', folder / 'link.txt')
+    with pytest.raises(ValueError):
+        confined_path('link.txt', str(folder))
+
+
+def test_rows_attaching_files_outside_the_folder_are_skipped(folder, recording_transport):
+    recipients = pd.DataFrame({
+        'email': ['a@example.com', 'b@example.com', 'c@example.com'],
+        'files': ['invoices/a.pdf', '../secret.txt', str(folder.parent / 'secret.txt')],
+    })
+    transport = recording_transport()
+    campaign = Campaign('Invoice', 'Attached', sender_email='sender@example.com', app_password='pw',
+                        test_mode=False, send_rate=1e6, rate_unit='second', transport=transport,
+                        attachment_column='files', attachment_dir=str(folder))
+    events = []
+    campaign.run([recipients], on_event=events.append)
+
+    assert transport.sent == ['a@example.com']
+    assert [(event.row, event.kind) for event in events if event.kind != SendEvent.SENT] == [
+        (1, SendEvent.SKIPPED), (2, SendEvent.SKIPPED)]
+    report, _ = campaign.dry_run([recipients])
+    assert report.refused_attachments == {'../secret.txt': 1, str(folder.parent / 'secret.txt'): 1}
+
+
+def test_an_attachment_column_needs_a_folder():
+    with pytest.raises(ValueError):
+        Campaign('Invoice', 'Attached', attachment_column='files')
+
+
+def test_build_with_attachments(tmp_path):
+    path = tmp_path / 'brochure.pdf'
+    path.write_bytes(bytes(range(256)) * 40)
+    raw, _ = MessageFactory('sender@example.com').build('user@example.com', 'Brochure', 'Attached.',
+                                                         [encode_attachment(str(path))])
+    message = email.message_from_bytes(raw, policy=email.policy.default)
+
+    assert message.get_content_type() == 'multipart/mixed'
+    assert message.get_body().get_content().replace('\r\n', '\n') == 'Attached.\n'
+    [attachment] = message.iter_attachments()
+    assert attachment.get_filename() == 'brochure.pdf'
+    assert attachment.get_content_type() == 'application/pdf'
+    assert attachment.get_content() == path.read_bytes()
+
+
+def test_each_file_is_encoded_once_per_cache(tmp_path):
+    path = str(tmp_path / 'brochure.pdf')
+    with open(path, 'wb') as f:
+        f.write(b'%PDF brochure')
+    cache = AttachmentCache()
+    assert cache.part(path) is cache.part(path)
+    assert cache.encodes == 1
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+import cli
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / 'recipients.xlsx'
+    pd.DataFrame({'email': ['a@example.com', 'bad', 'A@example.com', 'b@example.com'],
+                  'name': ['Ann', 'Bad', 'Ann again', 'Bob']}).to_excel(path, index=False)
+    return str(path)
+
+
+def run(tmp_path, *argv):
+    return cli.main(list(argv) + ['--suppression', str(tmp_path / 'suppression.sqlite3'),
+                                  '--journal', str(tmp_path / 'journal.sqlite3'),
+                                  '--cache-dir', str(tmp_path / 'cache')])
+
+
+def test_a_dry_run_renders_and_counts_without_sending(tmp_path, workbook, capsys):
+    status = run(tmp_path, '--excel', workbook, '--subject', 'Hi {{name}}', '--body', 'Dear {{name}} {{plan}}',
+                 '--preview', '1')
+    out = capsys.readouterr().out
+    assert status == 0
+    assert "--- row 1: a@example.com\nSubject: Hi Ann\n" in out
+    assert "row 2:" not in out
+    assert "dry run: rows=4 ready=2 empty=0 invalid=1 duplicate=1 suppressed=0" in out
+    assert "warning: placeholders without a column: plan" in out
+
+
+def test_an_unreadable_template_file_is_an_error_not_a_traceback(tmp_path, workbook, capsys):
+    status = run(tmp_path, '--excel', workbook, '--subject-file', str(tmp_path / 'missing.txt'), '--body', 'b')
+    assert status == 2
+    assert capsys.readouterr().err == f"error: cannot read {tmp_path / 'missing.txt'}: No such file or directory\n"
+
+
+def test_every_store_is_closed_when_an_attachment_is_missing(tmp_path, workbook, monkeypatch, capsys):
+    closed = []
+
+    def tracked(store_class):
+        class Tracked(store_class):
+            def close(self):
+                closed.append(store_class.__name__)
+                super().close()
+        return Tracked
+
+    for name in ('SendJournal', 'SuppressionList', 'QuotaLedger'):
+        monkeypatch.setattr(cli, name, tracked(getattr(cli, name)))
+    monkeypatch.setenv('GMAIL_APP_PASSWORD', 'pw')
+    status = run(tmp_path, '--excel', workbook, '--subject', 's', '--body', 'b', '--send',
+                 '--sender', 'me@example.com', '--attach', str(tmp_path / 'missing.pdf'))
+    assert status == 2
+    assert "error: attachment not found" in capsys.readouterr().err
+    assert sorted(closed) == ['QuotaLedger', 'SendJournal', 'SuppressionList']
+
+
+def test_a_live_run_reports_unknown_placeholders_before_it_starts(tmp_path, workbook, monkeypatch, capsys):
+    class Started(Exception):
+        pass
+
+    def run_campaign(campaign, chunks, on_event=None, stop=None):
+        raise Started(capsys.readouterr().out)
+
+    monkeypatch.setattr(cli.Campaign, 'run', run_campaign)
+    monkeypatch.setenv('GMAIL_APP_PASSWORD', 'pw')
+    with pytest.raises(Started) as started:
+        run(tmp_path, '--excel', workbook, '--subject', 'Hi {{name}}', '--body', 'Your {{plan}}', '--send',
+            '--sender', 'me@example.com')
+    assert "warning: placeholders without a column: plan" in str(started.value)
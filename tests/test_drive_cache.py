@@ -0,0 +1,110 @@
+import os
+
+import httplib2
+import pytest
+
+from drive_cache import DriveFileCache
+
+
+class FakeDrive:
+    """The parts of a Drive v3 service DriveFileCache uses, serving files from memory
+
+    Media requests answer the Range header MediaIoBaseDownload sends, so a
+    download arrives in chunk_size pieces.
+    """
+
+    def __init__(self):
+        self.files_by_id = {}
+        self.metadata_by_id = {}
+        self.ranges = []
+
+    def put(self, file_id, content, md5):
+        self.files_by_id[file_id] = content
+        self.metadata_by_id[file_id] = {'id': file_id, 'md5Checksum': md5, 'size': str(len(content))}
+
+    def files(self):
+        return self
+
+    def get(self, fileId, fields=None):
+        return FakeCall(dict(self.metadata_by_id[fileId]))
+
+    def get_media(self, fileId):
+        return FakeMediaRequest(self, fileId)
+
+    def request(self, uri, method='GET', headers=None, **kwargs):
+        content = self.files_by_id[uri]
+        start, end = (int(bound) for bound in headers['range'].split('=')[1].split('-'))
+        self.ranges.append((start, end))
+        piece = content[start:end + 1]
+        response = httplib2.Response({
+            'status': 206, 'content-range': f"bytes {start}-{start + len(piece) - 1}/{len(content)}"})
+        return response, piece
+
+
+class FakeCall:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeMediaRequest:
+    def __init__(self, drive, file_id):
+        self.http = drive
+        self.uri = file_id
+        self.headers = {}
+
+
+@pytest.fixture
+def drive():
+    return FakeDrive()
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_an_unchanged_file_is_not_downloaded_again(tmp_path, drive):
+    cache = DriveFileCache(str(tmp_path), chunk_size=1024)
+    drive.put('f1', b'workbook', md5='v1')
+    first = cache.fetch(drive, 'f1')
+    second = cache.fetch(drive, 'f1')
+    assert first == second and read(second) == b'workbook'
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert len(drive.ranges) == 1
+
+
+def test_a_changed_checksum_downloads_the_new_version(tmp_path, drive):
+    cache = DriveFileCache(str(tmp_path), chunk_size=1024)
+    drive.put('f1', b'old', md5='v1')
+    old = cache.fetch(drive, 'f1')
+    drive.put('f1', b'new', md5='v2')
+    new = cache.fetch(drive, 'f1')
+    assert new != old and read(new) == b'new'
+    assert cache.misses == 2
+    # The old version is removed once the new one is in place
+    assert not os.path.exists(old)
+
+
+def test_a_large_file_is_downloaded_in_chunk_size_pieces(tmp_path, drive):
+    cache = DriveFileCache(str(tmp_path), chunk_size=1000)
+    content = os.urandom(3500)
+    drive.put('big', content, md5='v1')
+    assert read(cache.fetch(drive, 'big')) == content
+    assert drive.ranges == [(0, 999), (1000, 1999), (2000, 2999), (3000, 3999)]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.part')]
+
+
+def test_the_least_recently_used_files_are_evicted_above_the_size_cap(tmp_path, drive):
+    cache = DriveFileCache(str(tmp_path), max_bytes=2500, chunk_size=4096)
+    paths = {}
+    for age, file_id in enumerate(['oldest', 'older', 'newest']):
+        drive.put(file_id, b'x' * 1000, md5=file_id)
+        paths[file_id] = cache.fetch(drive, file_id)
+        # Distinct use times, oldest first
+        os.utime(paths[file_id], (1000 + age, 1000 + age))
+    cache.evict()
+    assert not os.path.exists(paths['oldest'])
+    assert os.path.exists(paths['older']) and os.path.exists(paths['newest'])
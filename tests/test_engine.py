@@ -0,0 +1,153 @@
+import email
+import email.policy
+import smtplib
+
+import pandas as pd
+import pytest
+
+import engine
+from engine import Campaign, SendEvent, group_identical
+from messages import MessageFactory, UNDISCLOSED_RECIPIENTS
+from smtp_pool import classify_smtp_error
+
+
+class RefusingTransport:
+    """Refuses each address in refusals with its reply, once per listed reply
+
+    Like SMTPTransport, a message is only failed outright when every
+    recipient was refused; otherwise the refused ones come back as its error.
+    """
+
+    name = 'smtp'
+    batch_size = 1
+    bcc_in_headers = False
+
+    def __init__(self, refusals):
+        self.refusals = {address: list(replies) for address, replies in refusals.items()}
+        self.envelopes = []
+
+    def send(self, account, messages):
+        [(recipients, message, mail_options)] = messages
+        self.envelopes.append(list(recipients))
+        refused = {address: self.refusals[address].pop(0)
+                   for address in recipients if self.refusals.get(address)}
+        if len(refused) == len(recipients):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        return [smtplib.SMTPRecipientsRefused(refused) if refused else None]
+
+    @staticmethod
+    def classify(error):
+        return classify_smtp_error(error)
+
+    def take_throttles(self):
+        return 0
+
+    def stats(self):
+        return {'messages': len(self.envelopes)}
+
+    def close(self):
+        pass
+
+
+TOO_MANY = (452, b'4.5.3 Too many recipients')
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(engine, 'backoff_delay', lambda attempt: 0.0)
+
+
+def run(transport, emails, **options):
+    campaign = Campaign('Hello', 'Body', sender_email='sender@example.com', app_password='pw',
+                        test_mode=False, send_rate=1e6, rate_unit='second', adaptive=False,
+                        transport=transport, **options)
+    events = []
+    result = campaign.run([pd.DataFrame({'email': emails})], on_event=events.append)
+    return result, events
+
+
+def test_a_temporarily_refused_group_member_is_retried_alone():
+    transport = RefusingTransport({'b@example.com': [TOO_MANY]})
+    result, events = run(transport, ['a@example.com', 'b@example.com', 'c@example.com'], coalesce_size=3)
+
+    assert transport.envelopes == [['a@example.com', 'b@example.com', 'c@example.com'], ['b@example.com']]
+    assert (result.success, result.failed, result.retries) == (3, 0, 1)
+    assert [(event.recipient, event.attempts) for event in events if event.kind == SendEvent.SENT] == [
+        ('a@example.com', 1), ('c@example.com', 1), ('b@example.com', 2)]
+
+
+def test_a_temporarily_refused_recipient_is_retried_without_its_cc():
+    transport = RefusingTransport({'a@example.com': [TOO_MANY]})
+    result, _ = run(transport, ['a@example.com'], cc=['cc@example.com'])
+
+    assert transport.envelopes == [['a@example.com', 'cc@example.com'], ['a@example.com']]
+    assert (result.success, result.retries) == (1, 1)
+
+
+def test_a_refusal_left_after_the_last_attempt_fails_only_that_recipient():
+    transport = RefusingTransport({'b@example.com': [TOO_MANY, TOO_MANY]})
+    result, events = run(transport, ['a@example.com', 'b@example.com'], coalesce_size=2, max_attempts=2)
+
+    assert (result.success, result.failed, result.rejected) == (1, 1, 0)
+    [failed] = [event for event in events if event.kind == SendEvent.FAILED]
+    assert (failed.recipient, failed.attempts) == ('b@example.com', 2)
+    assert failed.error.recipients == {'b@example.com': TOO_MANY}
+
+
+def test_a_permanently_refused_group_member_is_not_retried():
+    transport = RefusingTransport({'b@example.com': [(550, b'5.1.1 No such user')]})
+    result, _ = run(transport, ['a@example.com', 'b@example.com'], coalesce_size=2)
+
+    assert transport.envelopes == [['a@example.com', 'b@example.com']]
+    assert (result.success, result.rejected, result.retries) == (1, 1, 0)
+
+
+def test_a_throttling_refusal_counts_as_a_throttle():
+    transport = RefusingTransport({'b@example.com': [(451, b'4.7.0 Try again later')]})
+    result, _ = run(transport, ['a@example.com', 'b@example.com'], coalesce_size=2)
+
+    assert (result.success, result.throttles, result.retries) == (2, 1, 1)
+
+
+def test_identical_messages_are_grouped_up_to_the_group_size():
+    jobs = [(0, 'a@example.com', 'Hi', 'Body', ()), (1, 'b@example.com', 'Hi', 'Other', ()),
+            (2, 'c@example.com', 'Hi', 'Body', ()), (3, 'd@example.com', 'Hi', 'Body', ())]
+    assert [[job[0] for job in group] for group in group_identical(jobs, 2)] == [[0, 2], [1], [3]]
+
+
+def test_build_group_hides_recipients():
+    factory = MessageFactory('sender@example.com', bcc=['bcc@example.com'])
+    raw, _ = factory.build_group(['a@example.com', 'b@example.com'], 'News', 'Hello')
+    message = email.message_from_bytes(raw, policy=email.policy.default)
+
+    assert message['To'] == UNDISCLOSED_RECIPIENTS
+    assert message['Bcc'] is None
+    assert factory.group_envelope(['a@example.com', 'b@example.com']) == [
+        'a@example.com', 'b@example.com', 'bcc@example.com']
+
+    raw, _ = MessageFactory('sender@example.com', bcc_header=True).build_group(
+        ['a@example.com', 'b@example.com'], 'News', 'Hello')
+    assert email.message_from_bytes(raw, policy=email.policy.default)['Bcc'] == 'a@example.com, b@example.com'
+
+
+def test_dry_run_counts_dropped_rows_and_pages_render_only_their_rows():
+    campaign = Campaign('Hi {{name}}', 'Dear {{name}}, {{missing}}')
+    chunks = [pd.DataFrame({'email': ['a@example.com', '', 'not-an-address'], 'name': ['Ann', 'Bob', 'Cy']}),
+              pd.DataFrame({'email': ['A@example.com', 'b@example.com', 'c@example.com'],
+                            'name': ['Ann', '', 'Cy']})]
+    report, frame = campaign.dry_run(chunks, keep_frame=True)
+
+    assert (report.total, report.sendable, report.empty_email) == (6, 3, 1)
+    assert report.dropped == {'invalid': 1, 'duplicate': 1, 'suppressed': 0}
+    assert report.distinct_messages == 3
+    assert report.unknown_placeholders == ['missing']
+    assert report.empty_fields == {'name': 1}
+    assert len(frame) == 6
+
+    # The preview pages through every row, dropped ones included
+    assert campaign.render_page(frame, 2, 4) == [
+        (2, 'not-an-address', 'Hi Cy', 'Dear Cy, {{missing}}', []),
+        (3, 'A@example.com', 'Hi Ann', 'Dear Ann, {{missing}}', []),
+    ]
+    assert [row for row, *_ in campaign.render_page(frame, 4, 6)] == [4, 5]
+    assert campaign.render_page(frame, 6, 8) == []
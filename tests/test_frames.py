@@ -0,0 +1,41 @@
+import pandas as pd
+
+from frames import compact_frame
+from templating import CompiledTemplate
+
+
+def test_text_columns_become_categoricals_only_up_to_the_unique_ratio():
+    frame = pd.DataFrame({
+        'email': [f"user{i}@example.com" for i in range(10)],
+        'city': ['Oslo', 'Rome'] * 5,
+        # 5 distinct values in 10 rows is exactly the default ratio of 0.5
+        'plan': ['a', 'b', 'c', 'd', 'e'] * 2,
+        'team': [f"t{i % 6}" for i in range(10)],
+    })
+    compacted = compact_frame(frame)
+    assert isinstance(compacted['city'].dtype, pd.CategoricalDtype)
+    assert isinstance(compacted['plan'].dtype, pd.CategoricalDtype)
+    assert not isinstance(compacted['team'].dtype, pd.CategoricalDtype)
+    assert not isinstance(compacted['email'].dtype, pd.CategoricalDtype)
+    assert not isinstance(compact_frame(frame, max_unique_ratio=0.1)['city'].dtype, pd.CategoricalDtype)
+
+
+def test_mixed_type_columns_become_their_str_values():
+    frame = pd.DataFrame({'email': [f"user{i}@example.com" for i in range(4)],
+                          'amount': pd.Series([10, "", 12.5, 13], dtype=object)})
+    compacted = compact_frame(frame)
+    assert compacted['amount'].tolist() == ['10', '', '12.5', '13']
+    # A number column of one type is left as it is
+    numbers = pd.DataFrame({'count': [1, 2, 3]})
+    assert compact_frame(numbers) is numbers
+
+
+def test_templates_render_the_same_from_plain_and_compacted_frames():
+    frame = pd.DataFrame({
+        'name': [f"Person {i}" for i in range(12)],
+        'city': ['Oslo', 'Rome', 'Lima'] * 4,
+        'amount': pd.Series([i if i % 3 else "" for i in range(12)], dtype=object),
+        'score': [i / 2 for i in range(12)],
+    })
+    template = CompiledTemplate("{{name}} in {{city}} owes {{amount}} ({{score}}) {{missing}}")
+    assert template.render_frame(compact_frame(frame)).tolist() == template.render_frame(frame).tolist()
@@ -0,0 +1,81 @@
+import datetime
+import json
+
+import pytest
+
+import google_clients
+from google_clients import ClientCache
+
+
+@pytest.fixture(scope='module')
+def creds_json():
+    serialization = pytest.importorskip('cryptography.hazmat.primitives.serialization')
+    rsa = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode('ascii')
+    return json.dumps({
+        'type': 'service_account', 'project_id': 'test', 'private_key_id': '1', 'private_key': pem,
+        'client_email': 'loader@test.iam.gserviceaccount.com', 'client_id': '1',
+        'token_uri': 'https://oauth2.googleapis.com/token',
+    })
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Every Drive client built, each holding the credentials it was built with"""
+    built = []
+
+    def build(service_name, version, creds):
+        client = {'creds': creds}
+        built.append(client)
+        return client
+
+    monkeypatch.setattr(google_clients, 'build_thread_safe', build)
+    return built
+
+
+def test_a_client_is_reused_within_the_ttl_and_rebuilt_after_it(creds_json, builds):
+    clock = Clock()
+    cache = ClientCache(ttl=60, clock=clock)
+    first = cache.drive_service(creds_json)
+    clock.now = 59
+    assert cache.drive_service(creds_json) is first
+    # The TTL counts from the last use
+    clock.now = 118
+    assert cache.drive_service(creds_json) is first
+    clock.now = 179
+    assert cache.drive_service(creds_json) is not first
+    assert len(builds) == 2
+
+
+def test_an_expired_token_is_refreshed_on_the_reused_client(creds_json, builds, monkeypatch):
+    refreshed = []
+
+    def refresh(creds, request):
+        refreshed.append(creds)
+        creds.token = 'new'
+        creds.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+    monkeypatch.setattr('google.oauth2.service_account.Credentials.refresh', refresh)
+    cache = ClientCache(clock=Clock())
+    creds = cache.drive_service(creds_json)['creds']
+    creds.token = 'old'
+    creds.expiry = datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+
+    assert cache.drive_service(creds_json)['creds'] is creds
+    assert refreshed == [creds] and creds.token == 'new'
+    assert len(builds) == 1
+
+
+def test_malformed_json_raises_json_decode_error(builds):
+    with pytest.raises(json.JSONDecodeError):
+        ClientCache().drive_service('{not json')
@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+from engine import Campaign, SendEvent
+from journal import SENT, REJECTED, UNSUBSCRIBED, SendJournal, SuppressionList
+
+
+RECIPIENTS = pd.DataFrame({'email': ['a@example.com', 'b@example.com', 'c@example.com'],
+                           'name': ['Ann', 'Bob', 'Cy']})
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = SendJournal(str(tmp_path / 'journal.sqlite3'))
+    yield journal
+    journal.close()
+
+
+def run(journal, transport):
+    campaign = Campaign('Hello {{name}}', 'Body', sender_email='sender@example.com', app_password='pw',
+                        test_mode=False, send_rate=1e6, rate_unit='second', journal=journal,
+                        campaign_id='spring', transport=transport)
+    events = []
+    result = campaign.run([RECIPIENTS], on_event=events.append)
+    return result, events
+
+
+def test_a_run_resumes_where_the_last_one_stopped(journal, recording_transport):
+    first = recording_transport(refused={'b@example.com'})
+    result, _ = run(journal, first)
+    assert first.sent == ['a@example.com', 'c@example.com']
+    assert (result.success, result.rejected) == (2, 1)
+    assert journal.counts('spring') == {SENT: 2, REJECTED: 1}
+
+    # Only the row that didn't go out is sent again
+    second = recording_transport()
+    result, events = run(journal, second)
+    assert second.sent == ['b@example.com']
+    assert (result.success, result.already_sent) == (1, 2)
+    assert [event.kind for event in events if event.kind == SendEvent.ALREADY_SENT] == [SendEvent.ALREADY_SENT] * 2
+    assert journal.counts('spring') == {SENT: 3}
+
+    third = recording_transport()
+    result, _ = run(journal, third)
+    assert third.sent == []
+    assert result.already_sent == 3
+
+
+def test_outcomes_survive_reopening_the_journal(tmp_path, recording_transport):
+    path = str(tmp_path / 'journal.sqlite3')
+    journal = SendJournal(path)
+    try:
+        run(journal, recording_transport(refused={'c@example.com'}))
+    finally:
+        journal.close()
+
+    journal = SendJournal(path)
+    try:
+        assert journal.counts('spring') == {SENT: 2, REJECTED: 1}
+        transport = recording_transport()
+        result, _ = run(journal, transport)
+        assert transport.sent == ['c@example.com']
+        assert result.already_sent == 2
+    finally:
+        journal.close()
+
+
+def test_campaigns_are_journaled_apart(journal):
+    journal.record('spring', 'A@Example.com', 0, SENT)
+    assert journal.sent_among('spring', ['a@example.com', 'b@example.com']) == {'a@example.com'}
+    assert journal.sent_among('autumn', ['a@example.com']) == set()
+
+
+def test_forgetting_a_campaign_sends_every_row_again(journal, recording_transport):
+    run(journal, recording_transport())
+    journal.record('autumn', 'a@example.com', 0, SENT)
+    assert journal.forget('spring') == 3
+    assert journal.counts('spring') == {}
+    assert journal.counts('autumn') == {SENT: 1}
+
+    transport = recording_transport()
+    result, _ = run(journal, transport)
+    assert transport.sent == ['a@example.com', 'b@example.com', 'c@example.com']
+    assert (result.success, result.already_sent) == (3, 0)
+
+
+def test_removed_addresses_are_mailed_again(tmp_path):
+    suppression = SuppressionList(str(tmp_path / 'journal.sqlite3'))
+    try:
+        assert suppression.add(['A@example.com', 'b@example.com', ' ']) == 2
+        assert suppression.remove([' a@EXAMPLE.com', 'nobody@example.com']) == 1
+        assert suppression.suppressed_among(['a@example.com', 'b@example.com']) == {'b@example.com'}
+        assert suppression.counts() == {UNSUBSCRIBED: 1}
+    finally:
+        suppression.close()
@@ -0,0 +1,171 @@
+import datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from loaders import ExcelStream, SheetStream, load_excel_data, merge_frames
+from recipient_cache import RecipientCache
+from templating import CompiledTemplate
+
+
+def write_sheet(path, frame, sheet_name='Sheet1'):
+    frame.to_excel(path, sheet_name=sheet_name, index=False)
+    return str(path)
+
+
+class FakeWorksheet:
+    """The parts of a gspread Worksheet that SheetStream reads"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.row_count = len(rows)
+        self.render_options = set()
+
+    def row_values(self, number):
+        return self.rows[number - 1]
+
+    def batch_get(self, ranges, major_dimension='COLUMNS', value_render_option=None,
+                  date_time_render_option=None):
+        # Cells hold the text the sheet shows, as FORMATTED_VALUE returns it
+        self.render_options.add((value_render_option, date_time_render_option))
+        results = []
+        for cell_range in ranges:
+            start, end = cell_range.split(':')
+            first = ord(start[0]) - ord('A')
+            last = ord(end[0]) - ord('A')
+            first_row, last_row = int(start[1:]), int(end[1:])
+            block = self.rows[first_row - 1:last_row]
+            columns = [[row[column] for row in block] for column in range(first, last + 1)]
+            # Like the API, trailing empty cells of a column are left out
+            for column in columns:
+                while column and column[-1] == "":
+                    column.pop()
+            results.append(columns)
+        return results
+
+
+def read_stream(path, columns=None):
+    with ExcelStream(path, 'Sheet1', columns=columns) as stream:
+        return pd.concat(list(stream), ignore_index=True)
+
+
+@pytest.fixture
+def sources(tmp_path):
+    first = write_sheet(tmp_path / 'first.xlsx', pd.DataFrame({
+        'email': ['a@example.com'], 'name': ['Ann'], 'notes': ['x']}))
+    second = write_sheet(tmp_path / 'second.xlsx', pd.DataFrame({
+        'Email': ['b@example.com'], ' Name': ['Bob'], 'notes': ['y']}))
+    return first, second
+
+
+def test_excel_stream_projects_columns_ignoring_case_and_spaces(sources):
+    with ExcelStream(sources[1], 'Sheet1', columns=['email', 'name']) as stream:
+        assert stream.columns == ['Email', ' Name']
+    assert read_stream(sources[1], ['email', 'name']).to_dict('records') == [
+        {'Email': 'b@example.com', ' Name': 'Bob'}]
+
+
+def test_projected_sources_merge_like_whole_ones(sources):
+    merged, _ = merge_frames([read_stream(path, ['email', 'name']) for path in sources], 'email')
+    expected, _ = merge_frames([read_stream(path) for path in sources], 'email')
+    assert list(merged.columns) == ['email', 'name']
+    assert merged.astype(str).to_dict('records') == expected[['email', 'name']].astype(str).to_dict('records')
+
+
+def test_merge_drops_repeats_across_sources_but_not_within_one():
+    first = pd.DataFrame({'email': ['a@example.com', 'A@example.com', 'b@example.com']})
+    second = pd.DataFrame({'email': ['a@EXAMPLE.com', 'c@example.com', 'c@example.com']})
+    merged, dropped = merge_frames([first, second], 'email')
+    assert dropped == 1
+    assert merged['email'].astype(str).tolist() == [
+        'a@example.com', 'A@example.com', 'b@example.com', 'c@example.com', 'c@example.com']
+    single, dropped = merge_frames([first], 'email')
+    assert dropped == 0 and len(single) == 3
+
+
+def test_sheet_stream_projects_columns_ignoring_case_and_spaces():
+    worksheet = FakeWorksheet([['Email', 'Notes', 'NAME'], ['b@example.com', 'n', 'Bob']])
+    stream = SheetStream(worksheet, columns=['email', 'name'])
+    assert stream.columns == ['Email', 'NAME']
+    assert stream.read_all().to_dict('records') == [{'Email': 'b@example.com', 'NAME': 'Bob'}]
+
+
+def test_sheet_stream_numbers_repeated_headers_like_excel_stream():
+    worksheet = FakeWorksheet([['email', 'name', '', 'name', 'Greeting'],
+                               ['a@example.com', 'Ann', 'x', 'A2', 'Hi {{name}}']])
+    stream = SheetStream(worksheet)
+    assert stream.columns == ['email', 'name', 'name.1', 'Greeting']
+    frame = stream.read_all()
+    assert frame.to_dict('records') == [{'email': 'a@example.com', 'name': 'Ann', 'name.1': 'A2',
+                                         'Greeting': 'Hi {{name}}'}]
+    assert CompiledTemplate('Hello {{name}}').render_frame(frame).tolist() == ['Hello Ann']
+
+
+def test_sheet_stream_keeps_blank_rows_but_not_trailing_ones():
+    worksheet = FakeWorksheet([['email', 'name'], ['a@example.com', 'Ann'], ['', ''],
+                               ['', ''], ['b@example.com', 'Bob'], ['', ''], ['', '']])
+    frame = SheetStream(worksheet, block_rows=2).read_all()
+    assert frame['email'].tolist() == ['a@example.com', '', '', 'b@example.com']
+
+
+def test_sheet_stream_reads_numbers_like_get_all_records_whole_floats_as_ints():
+    worksheet = FakeWorksheet([['email', 'zip', 'price', 'flag'],
+                               ['a@example.com', '12345', '5.5', 'TRUE'], ['b@example.com', '7', '1,234.0', 'FALSE']])
+    frame = SheetStream(worksheet).read_all()
+    assert worksheet.render_options == {('FORMATTED_VALUE', 'FORMATTED_STRING')}
+    assert frame.astype(str).to_dict('records') == [
+        {'email': 'a@example.com', 'zip': '12345', 'price': '5.5', 'flag': 'TRUE'},
+        {'email': 'b@example.com', 'zip': '7', 'price': '1234', 'flag': 'FALSE'}]
+    assert CompiledTemplate('{{zip}} {{price}}').render_frame(frame).tolist() == ['12345 5.5', '7 1234']
+
+
+def test_sheet_stream_keeps_dates_percents_and_currencies_as_shown():
+    worksheet = FakeWorksheet([['email', 'date', 'rate', 'fee'],
+                               ['a@example.com', '5/1/2024', '15%', '$5.00'],
+                               ['b@example.com', '5/2/2024 10:30:00', '7.5%', '$1,234.50']])
+    frame = SheetStream(worksheet).read_all()
+    assert worksheet.render_options == {('FORMATTED_VALUE', 'FORMATTED_STRING')}
+    assert CompiledTemplate('{{date}} {{rate}} {{fee}}').render_frame(frame).tolist() == [
+        '5/1/2024 15% $5.00', '5/2/2024 10:30:00 7.5% $1,234.50']
+
+
+def test_cached_frame_projects_columns_ignoring_case_and_spaces(tmp_path):
+    cache = RecipientCache(str(tmp_path / 'cache'))
+    cache.put('source', 'v1', pd.DataFrame({'Email': ['b@example.com'], 'Notes': ['n'], 'Name ': ['Bob']}))
+    with cache.open('source', 'v1', columns=['email', 'name']) as cached:
+        assert cached.columns == ['Email', 'Name ']
+        assert cached.read_all().to_dict('records') == [{'Email': 'b@example.com', 'Name ': 'Bob'}]
+
+
+def test_excel_stream_reads_the_values_load_excel_data_does(tmp_path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = 'Sheet1'
+    sheet.append(['email', 'zip', 'name', 'name', None, 2024, 'flag', 'when', 'score', 'note'])
+    sheet.append(['a@example.com', 12345, 'Ann', 'A2', 'x', 1, True, datetime.datetime(2024, 5, 1), 1.5, 'NA'])
+    sheet.append([None] * 10)
+    sheet.append(['b@example.com', None, 'Bob', 'B2', None, 2, False, None, 2.0, '#N/A'])
+    sheet.append(['c@example.com', 7.0, ' Cy ', 'C2', 'y', None, None, datetime.datetime(2024, 5, 2, 10, 30)])
+    sheet.append([None] * 10)
+    path = str(tmp_path / 'recipients.xlsx')
+    workbook.save(path)
+
+    loaded = load_excel_data(path, 'Sheet1')
+    streamed = read_stream(path)
+    assert list(streamed.columns) == list(loaded.columns) == [
+        'email', 'zip', 'name', 'name.1', 'Unnamed: 4', '2024', 'flag', 'when', 'score', 'note']
+    assert streamed.astype(str).values.tolist() == loaded.astype(str).values.tolist()
+    assert loaded['zip'].astype(str).tolist() == ['12345', '', '', '7']
+    assert loaded['note'].astype(str).tolist() == ['NA', '', '', '']
+
+
+def test_excel_stream_chunks_match_the_whole_sheet(tmp_path):
+    frame = pd.DataFrame({'email': [f"user{i}@example.com" for i in range(25)],
+                          'count': [i if i % 4 else None for i in range(25)]})
+    path = write_sheet(tmp_path / 'recipients.xlsx', frame)
+    with ExcelStream(path, 'Sheet1', chunk_size=7) as stream:
+        chunks = list(stream)
+    assert [len(chunk) for chunk in chunks] == [7, 7, 7, 4]
+    streamed = pd.concat(chunks, ignore_index=True)
+    assert streamed.astype(str).values.tolist() == load_excel_data(path, 'Sheet1').astype(str).values.tolist()
@@ -0,0 +1,120 @@
+import email
+import email.policy
+from email.errors import HeaderParseError
+
+import pandas as pd
+import pytest
+
+from attachments import encode_attachment
+from engine import Campaign, SendEvent
+from messages import MessageFactory, downgrade_8bit
+from smtp_pool import SMTPSession
+
+
+def parse(raw):
+    return email.message_from_bytes(raw, policy=email.policy.default)
+
+
+def text(part):
+    # Messages are serialized with CRLF line ends
+    return part.get_content().replace('\r\n', '\n')
+
+
+def test_build_parses_back_to_the_same_message():
+    factory = MessageFactory('sender@example.com', cc=['cc@example.com'], bcc=['bcc@example.com'])
+    raw, _ = factory.build('user@example.com', 'Grüße, Anna', "Hallo Anna,\n\nschöne Grüße.")
+    message = parse(raw)
+
+    assert message['From'] == 'sender@example.com'
+    assert message['To'] == 'user@example.com'
+    assert message['Cc'] == 'cc@example.com'
+    assert message['Bcc'] is None
+    assert message['Subject'] == 'Grüße, Anna'
+    assert text(message) == "Hallo Anna,\n\nschöne Grüße.\n"
+    assert factory.envelope('user@example.com') == ['user@example.com', 'cc@example.com', 'bcc@example.com']
+
+
+@pytest.mark.parametrize('subject', [
+    'Hello\r\nBcc: victim@example.com',
+    'Hello\nBcc: victim@example.com',
+    'Hello\rBcc: victim@example.com',
+])
+def test_header_injection_through_the_subject_is_rejected(subject):
+    factory = MessageFactory('sender@example.com')
+    with pytest.raises(HeaderParseError):
+        factory.build('user@example.com', subject, 'Body')
+    with pytest.raises(HeaderParseError):
+        factory.build_group(['a@example.com', 'b@example.com'], subject, 'Body')
+
+
+def test_header_injection_through_addresses_is_rejected():
+    with pytest.raises(HeaderParseError):
+        MessageFactory('sender@example.com').build('user@example.com\nBcc: victim@example.com', 'Hi', 'Body')
+    with pytest.raises(HeaderParseError):
+        MessageFactory('sender@example.com\r\nBcc: victim@example.com')
+    with pytest.raises(HeaderParseError):
+        MessageFactory('sender@example.com', cc=['cc@example.com\nBcc: victim@example.com'])
+
+
+def test_line_breaks_in_the_body_stay_in_the_body():
+    raw, _ = MessageFactory('sender@example.com').build('user@example.com', 'Hi', 'Line\r\nBcc: x@example.com')
+    message = parse(raw)
+    assert message['Bcc'] is None
+    assert text(message) == 'Line\nBcc: x@example.com\n'
+
+
+def test_a_line_break_in_a_subject_fails_only_that_row(recording_transport):
+    recipients = pd.DataFrame({'email': ['a@example.com', 'b@example.com'],
+                               'name': ['Ann', 'Bob\r\nBcc: victim@example.com']})
+    transport = recording_transport()
+    campaign = Campaign('Hello {{name}}', 'Body', sender_email='sender@example.com', app_password='pw',
+                        test_mode=False, send_rate=1e6, rate_unit='second', transport=transport)
+    events = []
+    result = campaign.run([recipients], on_event=events.append)
+    assert transport.sent == ['a@example.com']
+    assert (result.success, result.failed) == (1, 1)
+    assert [(event.row, event.kind) for event in events if event.kind != SendEvent.SENT] == [(1, SendEvent.SKIPPED)]
+
+
+def test_downgrade_8bit_reencodes_the_text_as_quoted_printable(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(bytes(range(256)))
+    raw, mail_options = MessageFactory('sender@example.com').build(
+        'user@example.com', 'Grüße', 'Schöne Grüße', [encode_attachment(str(path))])
+    assert mail_options == ('BODY=8BITMIME',)
+
+    downgraded = downgrade_8bit(raw)
+    assert downgraded.isascii()
+    message = parse(downgraded)
+    assert message['Subject'] == 'Grüße'
+    assert message.get_body()['Content-Transfer-Encoding'] == 'quoted-printable'
+    assert text(message.get_body()) == 'Schöne Grüße\n'
+    assert next(message.iter_attachments()).get_content() == path.read_bytes()
+
+
+class FakeServer:
+    """An smtplib.SMTP connection to a server advertising the given extensions"""
+
+    def __init__(self, extensions):
+        self.extensions = extensions
+        self.sent = []
+
+    def has_extn(self, name):
+        return name in self.extensions
+
+    def sendmail(self, from_addr, recipients, message, mail_options=()):
+        self.sent.append((message, list(mail_options)))
+        return {}
+
+
+@pytest.mark.parametrize('extensions, encoding', [({'8bitmime'}, '8bit'), (set(), 'quoted-printable')])
+def test_8bit_bodies_only_go_to_servers_advertising_8bitmime(extensions, encoding):
+    raw, mail_options = MessageFactory('sender@example.com').build('user@example.com', 'Hi', 'Grüße')
+    session = SMTPSession('sender@example.com', 'pw')
+    session.server = FakeServer(extensions)
+    session.sendmail('sender@example.com', ['user@example.com'], raw, mail_options)
+
+    [(sent, options)] = session.server.sent
+    assert options == (['BODY=8BITMIME'] if encoding == '8bit' else [])
+    assert parse(sent)['Content-Transfer-Encoding'] == encoding
+    assert text(parse(sent)) == 'Grüße\n'
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from metrics import RunMetrics
+
+
+def test_retries_are_exported_apart_from_row_outcomes():
+    metrics = RunMetrics()
+    metrics.increment('sent', 3)
+    metrics.increment('failed')
+    metrics.increment('retries', 2)
+    lines = metrics.to_prometheus().splitlines()
+    assert 'mail_sender_rows_total{outcome="sent"} 3' in lines
+    assert 'mail_sender_rows_total{outcome="failed"} 1' in lines
+    assert 'mail_sender_retries_total 2' in lines
+    assert not any('outcome="retries"' in line for line in lines)
+
+
+def test_durations_fall_in_the_first_bucket_they_fit():
+    metrics = RunMetrics(buckets=(0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.01, 0.05, 0.5, 2.0, 3.0):
+        metrics.record('smtp_data', seconds)
+    assert metrics.histogram('smtp_data') == [('≤0.01s', 2), ('≤0.1s', 1), ('≤1s', 1), ('>1s', 2)]
+    assert metrics.histogram('smtp_login') == [('≤0.01s', 0), ('≤0.1s', 0), ('≤1s', 0), ('>1s', 0)]
+
+
+def test_json_export_holds_counters_and_per_stage_summaries(tmp_path):
+    metrics = RunMetrics(buckets=(0.1, 1.0))
+    metrics.record('template_render', 0.05)
+    metrics.record('template_render', 0.15)
+    metrics.increment('sent', 2)
+    metrics.write(str(tmp_path / 'run.json'))
+    exported = json.loads((tmp_path / 'run.json').read_text())
+
+    assert set(exported) == {'started_at', 'counters', 'stages'}
+    assert exported['counters'] == {'sent': 2}
+    stage = exported['stages']['template_render']
+    assert stage['count'] == 2
+    assert stage['total_seconds'] == pytest.approx(0.2)
+    assert stage['mean_seconds'] == pytest.approx(0.1)
+    assert stage['max_seconds'] == pytest.approx(0.15)
+    assert {'p50_seconds', 'p99_seconds'} <= set(stage)
+    assert stage['buckets'] == {'0.1': 1, '1': 1, '+Inf': 0}
+
+
+def test_prometheus_export_is_a_cumulative_histogram_with_sum_and_count(tmp_path):
+    metrics = RunMetrics(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 2.0):
+        metrics.record('smtp_data', seconds)
+    metrics.write(str(tmp_path / 'run.prom'))
+    text = (tmp_path / 'run.prom').read_text()
+    lines = text.splitlines()
+
+    assert lines[:2] == ['# HELP mail_sender_stage_seconds Time spent in each stage of a sending run',
+                         '# TYPE mail_sender_stage_seconds histogram']
+    assert lines[2:7] == [
+        'mail_sender_stage_seconds_bucket{stage="smtp_data",le="0.1"} 1',
+        'mail_sender_stage_seconds_bucket{stage="smtp_data",le="1"} 2',
+        'mail_sender_stage_seconds_bucket{stage="smtp_data",le="+Inf"} 3',
+        'mail_sender_stage_seconds_sum{stage="smtp_data"} 2.550000',
+        'mail_sender_stage_seconds_count{stage="smtp_data"} 3',
+    ]
+    assert text.endswith('\n')
+    # No counters were incremented, so no rows_total family is written
+    assert 'mail_sender_rows_total' not in text
@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+
+from recipient_cache import RecipientCache
+
+
+class Clock:
+    def __init__(self, now=1000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def frame(rows=50):
+    return pd.DataFrame({'email': [f"user{i}@example.com" for i in range(rows)],
+                         'name': [f"Person {i}" for i in range(rows)]})
+
+
+def entry_path(cache, source):
+    [(path, _, _, _)] = cache._entries(source)
+    return path
+
+
+def test_an_entry_expires_after_the_ttl(tmp_path):
+    clock = Clock()
+    cache = RecipientCache(str(tmp_path), ttl=60, clock=clock)
+    cache.put('source', 'v1', frame())
+    clock.now += 60
+    assert cache.get('source', 'v1') is not None
+    clock.now += 1
+    assert cache.get('source', 'v1') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # Expired entries are removed at the next eviction
+    cache.put('other', 'v1', frame())
+    assert cache._entries('source') == []
+
+
+def test_the_least_recently_used_entry_is_evicted_above_the_size_cap(tmp_path):
+    clock = Clock()
+    cache = RecipientCache(str(tmp_path), clock=clock)
+    cache.put('first', 'v1', frame())
+    cache.put('second', 'v1', frame())
+    size = os.path.getsize(entry_path(cache, 'first'))
+    # Reading "first" makes "second" the least recently used
+    os.utime(entry_path(cache, 'first'), (2000, 2000))
+    os.utime(entry_path(cache, 'second'), (1000, 1000))
+    cache.get('first', 'v1')
+
+    cache.max_bytes = size * 2 + size // 2
+    cache.put('third', 'v1', frame())
+    assert cache.get('second', 'v1') is None
+    assert cache.get('first', 'v1') is not None
+    assert cache.get('third', 'v1') is not None
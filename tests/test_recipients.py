@@ -0,0 +1,38 @@
+import pandas as pd
+
+from recipients import DUPLICATE, EMPTY, INVALID, SUPPRESSED, RecipientScreen
+
+
+class FakeSuppression:
+    def __init__(self, keys):
+        self.keys = set(keys)
+
+    def suppressed_among(self, keys):
+        return self.keys.intersection(keys)
+
+
+def test_invalid_addresses_are_dropped():
+    screen = RecipientScreen()
+    _, reasons = screen.screen(pd.Series(['a@example.com', 'no-at-sign', 'a@b', 'two@@example.com',
+                                          'x' * 65 + '@example.com', 'ok@example.co.uk']))
+    assert reasons == [None, INVALID, INVALID, INVALID, INVALID, None]
+
+
+def test_addresses_are_normalized_and_duplicates_found_ignoring_case_and_whitespace():
+    screen = RecipientScreen()
+    normalized, reasons = screen.screen(pd.Series([' Ann@Example.COM ', 'mailto:ann@example.com',
+                                                   '<ANN@example.com>', 'bob@example.com']))
+    assert normalized == ['Ann@example.com', 'ann@example.com', 'ANN@example.com', 'bob@example.com']
+    assert reasons == [None, DUPLICATE, DUPLICATE, None]
+
+    # Later chunks are checked against the addresses already accepted
+    _, reasons = screen.screen(pd.Series(['BOB@example.com', 'cy@example.com']))
+    assert reasons == [DUPLICATE, None]
+
+
+def test_drop_counts_are_kept_per_reason_across_chunks():
+    screen = RecipientScreen(FakeSuppression({'gone@example.com'}))
+    screen.screen(pd.Series(['a@example.com', '', None, 'bad', 'Gone@example.com']))
+    screen.screen(pd.Series(['A@example.com', 'b@example.com', '  ']))
+    assert screen.accepted == 2
+    assert screen.dropped == {EMPTY: 3, INVALID: 1, DUPLICATE: 1, SUPPRESSED: 1}
@@ -0,0 +1,136 @@
+import pytest
+
+from send_pipeline import AdaptiveRate, TokenBucket
+
+
+class FakeClock:
+    """A monotonic clock that only moves when something sleeps on it"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class MidpointRng:
+    """Jitter that always lands in the middle of its range"""
+
+    def uniform(self, low, high):
+        return (low + high) / 2
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def bucket(clock, rate, capacity=1):
+    return TokenBucket(rate, capacity=capacity, clock=clock, sleep=clock.sleep)
+
+
+def test_sends_are_paced_at_the_rate(clock):
+    limiter = bucket(clock, rate=10)
+    started = []
+    for _ in range(5):
+        limiter.acquire()
+        started.append(clock.now)
+    assert started == pytest.approx([0.0, 0.1, 0.2, 0.3, 0.4])
+
+
+def test_a_full_bucket_allows_a_burst_of_its_capacity(clock):
+    limiter = bucket(clock, rate=2, capacity=3)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire() == pytest.approx(0.5)
+
+    # Idle time refills it, but never above the capacity
+    clock.now += 60
+    assert limiter.acquire(3) == 0.0
+    assert limiter.acquire() == pytest.approx(0.5)
+
+
+def test_a_batch_takes_as_many_tokens_as_it_has_messages(clock):
+    limiter = bucket(clock, rate=10, capacity=5)
+    assert limiter.acquire(5) == 0.0
+    assert limiter.acquire(5) == pytest.approx(0.5)
+
+
+def test_more_tokens_than_the_capacity_are_refused(clock):
+    limiter = bucket(clock, rate=10, capacity=5)
+    with pytest.raises(ValueError):
+        limiter.acquire(6)
+    assert clock.sleeps == []
+
+
+def test_a_new_rate_applies_from_the_next_token(clock):
+    limiter = bucket(clock, rate=1)
+    limiter.acquire()
+    limiter.set_rate(4)
+    assert limiter.acquire() == pytest.approx(0.25)
+
+
+def test_a_pause_holds_back_every_sender(clock):
+    limiter = bucket(clock, rate=10, capacity=5)
+    limiter.pause(2.0)
+    assert limiter.acquire() == pytest.approx(2.1)
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def adaptive(clock, rate=10, **options):
+    return AdaptiveRate(bucket(clock, rate), clock=clock, rng=MidpointRng(), **options)
+
+
+def test_a_throttle_halves_the_rate_and_pauses_senders(clock):
+    control = adaptive(clock, backoff=4.0)
+    control.throttled()
+    assert control.rate == pytest.approx(5)
+    assert control.throttles == 1
+    # The next send waits out the 4 s pause, then one token at the new rate
+    assert control.limiter.acquire() == pytest.approx(4.2)
+
+
+def test_throttles_during_the_pause_are_the_same_event(clock):
+    control = adaptive(clock, backoff=4.0)
+    control.throttled()
+    clock.now += 3.9
+    control.throttled()
+    assert (control.rate, control.throttles) == (pytest.approx(5), 1)
+    clock.now += 0.1
+    control.throttled()
+    assert (control.rate, control.throttles) == (pytest.approx(2.5), 2)
+
+
+def test_the_rate_never_drops_below_the_minimum(clock):
+    control = adaptive(clock, min_rate=4, backoff=1.0)
+    for _ in range(3):
+        control.throttled()
+        clock.now += 1.0
+    assert control.rate == pytest.approx(4)
+
+
+def test_clean_sends_raise_the_rate_additively_up_to_the_maximum(clock):
+    control = adaptive(clock, max_rate=11, increase=0.02)
+    control.succeeded()
+    assert control.rate == pytest.approx(10.2)
+    for _ in range(10):
+        control.succeeded()
+    assert control.rate == pytest.approx(11)
+
+
+def test_no_increase_while_the_pause_lasts(clock):
+    control = adaptive(clock, max_rate=20, backoff=4.0)
+    control.throttled()
+    control.succeeded()
+    assert control.rate == pytest.approx(5)
+    clock.now += 4.0
+    control.succeeded()
+    assert control.rate == pytest.approx(5.2)
@@ -0,0 +1,90 @@
+import smtplib
+import socket
+import threading
+
+import pytest
+
+from messages import MessageFactory
+from smtp_pool import SMTPPool, SMTPSession
+from smtp_standin import SMTPStandin
+
+SENDER = 'sender@example.com'
+
+
+@pytest.fixture
+def standin():
+    with SMTPStandin() as standin:
+        yield standin
+
+
+def send(target, count):
+    factory = MessageFactory(SENDER)
+    for number in range(count):
+        raw, mail_options = factory.build(f"user{number}@example.com", 'Hello', 'Grüße')
+        assert target.sendmail(SENDER, [f"user{number}@example.com"], raw, mail_options) == {}
+
+
+def test_one_handshake_serves_every_message(standin):
+    with SMTPPool(SENDER, 'pw', host=standin.host, port=standin.port) as pool:
+        send(pool, 5)
+        assert pool.stats.as_dict() == {'handshakes': 1, 'reconnects': 0, 'recycles': 0, 'messages': 5}
+    server = standin.stats.as_dict()
+    assert (server['connections'], server['tls_handshakes'], server['logins'], server['messages']) == (1, 1, 1, 5)
+
+
+def test_connections_are_recycled_after_max_messages(standin):
+    with SMTPPool(SENDER, 'pw', max_messages=2, host=standin.host, port=standin.port) as pool:
+        send(pool, 5)
+        assert pool.stats.as_dict() == {'handshakes': 3, 'reconnects': 0, 'recycles': 2, 'messages': 5}
+    assert standin.stats.as_dict()['connections'] == 3
+
+
+def test_a_dropped_connection_is_reopened_and_the_message_sent(standin):
+    session = SMTPSession(SENDER, 'pw', host=standin.host, port=standin.port)
+    try:
+        send(session, 1)
+        session.server.sock.shutdown(socket.SHUT_RDWR)
+        send(session, 1)
+        assert session.stats.as_dict() == {'handshakes': 2, 'reconnects': 1, 'recycles': 0, 'messages': 2}
+    finally:
+        session.close()
+    assert standin.stats.as_dict()['messages'] == 2
+
+
+def test_try_again_later_closes_the_connection_without_reconnecting(standin):
+    session = SMTPSession(SENDER, 'pw', host=standin.host, port=standin.port)
+    try:
+        send(session, 1)
+        standin.config.error_rates[421] = 1.0
+        with pytest.raises(smtplib.SMTPSenderRefused) as refused:
+            send(session, 1)
+        assert refused.value.smtp_code == 421
+        assert session.server is None
+        assert session.stats.as_dict() == {'handshakes': 1, 'reconnects': 0, 'recycles': 0, 'messages': 1}
+
+        standin.config.error_rates[421] = 0.0
+        send(session, 1)
+        assert session.stats.handshakes == 2
+    finally:
+        session.close()
+
+
+def test_the_pool_opens_at_most_size_connections(standin):
+    with SMTPPool(SENDER, 'pw', size=2, host=standin.host, port=standin.port) as pool:
+        errors = []
+
+        def sender():
+            try:
+                send(pool, 10)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=sender) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert pool.stats.messages == 40
+        assert 1 <= pool.handshakes <= 2
+    assert standin.stats.as_dict()['messages'] == 40
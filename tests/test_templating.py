@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from templating import CompiledTemplate, apply_template, check_placeholders
+
+TEMPLATE = "Hi {{name}}, {{count}} x {{price}} from {{city}} ({{note}}) {{missing}}"
+
+
+def test_render_frame_matches_apply_template_row_by_row():
+    frame = pd.DataFrame({
+        'name': ['Ann', None, np.nan, 'Dee'],
+        'count': [1, 2, 3, 4],
+        'price': [1.5, np.nan, 2.0, 1234.0],
+        'city': pd.Series(['Oslo', 'Oslo', None, 'Rome']).astype('category'),
+        'note': pd.Series([7, 'x', None, ''], dtype=object),
+    })
+    rendered = CompiledTemplate(TEMPLATE).render_frame(frame).tolist()
+    assert rendered == [apply_template(TEMPLATE, row) for row in frame.to_dict('records')]
+    assert rendered[0] == "Hi Ann, 1 x 1.5 from Oslo (7) {{missing}}"
+
+
+def test_render_frame_of_no_rows_is_empty():
+    frame = pd.DataFrame({'name': ['Ann']}).iloc[:0]
+    assert CompiledTemplate(TEMPLATE).render_frame(frame).tolist() == []
+
+
+def test_check_placeholders_lists_unknown_placeholders_and_unused_columns():
+    templates = [CompiledTemplate("Hi {{name}}"), CompiledTemplate("{{name}}, your {{plan}} at {{ city }}")]
+    unknown, unused = check_placeholders(templates, ['email', 'name', 'city', 2024])
+    assert unknown == ['plan', ' city ']
+    assert unused == ['email', 'city', '2024']
+    assert check_placeholders([CompiledTemplate("Hello")], []) == ([], [])
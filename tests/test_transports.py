@@ -0,0 +1,161 @@
+import email
+import email.policy
+import errno
+import json
+import smtplib
+
+import httplib2
+import pytest
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from accounts import SenderAccount
+from gmail_standin import GmailBatchStandin
+from google_clients import check_gmail_senders
+from messages import MessageFactory
+from smtp_pool import TRANSIENT, THROTTLED, PERMANENT, classify_smtp_error
+from transports import GmailAPITransport, classify_http_error
+
+ACCOUNT = SenderAccount('sender@example.com', '')
+
+
+class ScriptedStandin(GmailBatchStandin):
+    """Answers each send with the next status in codes (None is success)
+
+    fail_requests lists 1-based HTTP requests that raise instead of being
+    answered, as when the network goes away (an error the API client
+    doesn't retry itself).
+    """
+
+    def __init__(self, codes, fail_requests=()):
+        super().__init__()
+        self.codes = list(codes)
+        self.fail_requests = set(fail_requests)
+        self.requests = 0
+
+    def _inject(self):
+        return self.codes.pop(0) if self.codes else None
+
+    def request(self, uri, *args, **kwargs):
+        self.requests += 1
+        if self.requests in self.fail_requests:
+            raise OSError(errno.ENETUNREACH, "Network is unreachable")
+        return super().request(uri, *args, **kwargs)
+
+
+def gmail_transport(standin, max_attempts=3):
+    delays = []
+    transport = GmailAPITransport(lambda account: build('gmail', 'v1', http=standin, static_discovery=True),
+                                  batch_size=10, max_attempts=max_attempts, sleep=delays.append)
+    return transport, delays
+
+
+def outgoing(count):
+    factory = MessageFactory(ACCOUNT.email)
+    return [([f"user{i}@example.com"], factory.build(f"user{i}@example.com", f"Message {i}", "Hello")[0], ())
+            for i in range(count)]
+
+
+def subjects(standin):
+    return [email.message_from_bytes(raw, policy=email.policy.default)['Subject'] for raw in standin.sent]
+
+
+def http_error(status, reason=''):
+    content = json.dumps({'error': {'code': status, 'message': reason,
+                                    'errors': [{'reason': reason, 'message': reason}]}})
+    return HttpError(httplib2.Response({'status': status}), content.encode('utf-8'))
+
+
+def test_gmail_batch_retries_only_transient_failures():
+    # 429 and 500 are sent again in a second batch; 400 is final
+    standin = ScriptedStandin([None, 429, 400, 500])
+    transport, delays = gmail_transport(standin)
+    errors = transport.send(ACCOUNT, outgoing(4))
+
+    assert errors[0] is None and errors[1] is None and errors[3] is None
+    assert isinstance(errors[2], HttpError) and errors[2].resp.status == 400
+    assert subjects(standin) == ['Message 0', 'Message 1', 'Message 3']
+    assert len(delays) == 1
+    stats = transport.stats()
+    assert (stats['batches'], stats['requests'], stats['retries'], stats['messages']) == (2, 6, 2, 3)
+    assert transport.take_throttles() == 1
+    assert transport.take_throttles() == 0
+
+
+def test_gmail_batch_reports_errors_left_after_the_last_attempt():
+    standin = ScriptedStandin([500, None, 500, 500])
+    transport, delays = gmail_transport(standin, max_attempts=3)
+    errors = transport.send(ACCOUNT, outgoing(2))
+
+    assert errors[1] is None
+    assert classify_http_error(errors[0]) == TRANSIENT
+    assert subjects(standin) == ['Message 1']
+    assert len(delays) == 2
+
+
+def test_gmail_batch_lost_on_retry_fails_only_the_retried_messages():
+    # Part of the first batch went out, so a lost retry must not raise
+    standin = ScriptedStandin([500, None], fail_requests=[2])
+    transport, _ = gmail_transport(standin, max_attempts=2)
+    errors = transport.send(ACCOUNT, outgoing(2))
+
+    assert isinstance(errors[0], OSError) and errors[0].errno == errno.ENETUNREACH
+    assert errors[1] is None
+    assert subjects(standin) == ['Message 1']
+
+
+def test_gmail_batch_lost_on_retry_is_sent_again():
+    standin = ScriptedStandin([500, None], fail_requests=[2])
+    transport, delays = gmail_transport(standin, max_attempts=3)
+    assert transport.send(ACCOUNT, outgoing(2)) == [None, None]
+    assert subjects(standin) == ['Message 1', 'Message 0']
+    assert len(delays) == 2
+
+
+def test_gmail_batch_lost_on_first_attempt_raises():
+    standin = ScriptedStandin([], fail_requests=[1])
+    transport, _ = gmail_transport(standin)
+    with pytest.raises(OSError):
+        transport.send(ACCOUNT, outgoing(2))
+    assert standin.sent == []
+
+
+@pytest.mark.parametrize('error, kind', [
+    (smtplib.SMTPResponseException(421, b'4.7.0 Try again later, closing connection'), THROTTLED),
+    (smtplib.SMTPSenderRefused(451, b'4.7.0 Temporary System Problem', 'sender@example.com'), THROTTLED),
+    (smtplib.SMTPDataError(450, b'4.2.1 Mailbox busy'), TRANSIENT),
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (452, b'4.2.2 Over quota')}), TRANSIENT),
+    (smtplib.SMTPRecipientsRefused({'a@example.com': (452, b'4.2.2 Over quota'),
+                                    'b@example.com': (550, b'5.1.1 No such user')}), PERMANENT),
+    (smtplib.SMTPDataError(552, b'5.3.4 Message too big'), PERMANENT),
+    (smtplib.SMTPServerDisconnected('Connection unexpectedly closed'), TRANSIENT),
+    (ConnectionResetError(), TRANSIENT),
+    (smtplib.SMTPAuthenticationError(535, b'5.7.8 Username and Password not accepted'), PERMANENT),
+    (ValueError('not an SMTP problem'), PERMANENT),
+])
+def test_classify_smtp_error(error, kind):
+    assert classify_smtp_error(error) == kind
+
+
+@pytest.mark.parametrize('error, kind', [
+    (http_error(429, 'rateLimitExceeded'), THROTTLED),
+    (http_error(403, 'userRateLimitExceeded'), THROTTLED),
+    (http_error(403, 'insufficientPermissions'), PERMANENT),
+    (http_error(500, 'backendError'), TRANSIENT),
+    (http_error(503, 'backendError'), TRANSIENT),
+    (http_error(400, 'invalidArgument'), PERMANENT),
+    (http_error(404, 'notFound'), PERMANENT),
+    (ConnectionResetError(), TRANSIENT),
+    (ValueError('not an HTTP problem'), PERMANENT),
+])
+def test_classify_http_error(error, kind):
+    assert classify_http_error(error) == kind
+
+
+def test_one_oauth_token_cannot_send_for_several_senders():
+    token = json.dumps({'type': 'authorized_user', 'client_id': 'c', 'client_secret': 's', 'refresh_token': 'r'})
+    check_gmail_senders(token, ['a@example.com', 'a@example.com'])
+    check_gmail_senders(token, ['a@example.com', 'b@example.com'], accounts_json={'b@example.com': token})
+    check_gmail_senders(json.dumps({'type': 'service_account'}), ['a@example.com', 'b@example.com'])
+    with pytest.raises(ValueError, match='domain-wide delegation'):
+        check_gmail_senders(token, ['a@example.com', 'b@example.com'])
@@ -0,0 +1,25 @@
+import pandas as pd
+
+from engine import Campaign, SendEvent
+from worker import DONE, ISSUES_SIZE, CampaignJob, SendWorker
+
+
+def test_a_job_counts_every_problem_but_keeps_only_the_latest(recording_transport):
+    rows = 200
+    recipients = pd.DataFrame({'email': [f"user{i}@example.com" if i % 4 else "" for i in range(rows)]})
+    transport = recording_transport(refused={f"user{i}@example.com" for i in range(1, rows, 4)})
+    campaign = Campaign('Hello', 'Body', sender_email='sender@example.com', app_password='pw', test_mode=False,
+                        send_rate=1e6, rate_unit='second', transport=transport)
+    worker = SendWorker()
+    job = worker.submit(CampaignJob(campaign, [recipients], total_rows=rows, columns=['email']))
+    worker.wait()
+
+    assert job.status == DONE
+    processed, counts = job.progress()
+    assert processed == rows
+    assert (counts[SendEvent.SENT], counts[SendEvent.REJECTED], counts[SendEvent.SKIPPED]) == (100, 50, 50)
+    failures, skipped, _, _ = job.events()
+    assert len(failures) == len(skipped) == ISSUES_SIZE
+    assert failures[-1].row == 197 and skipped[-1].row == 196
+    # Rendered messages are not held on to
+    assert all(event.subject is None and event.body is None for event in failures + skipped)
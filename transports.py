@@ -0,0 +1,256 @@
+"""Ways of handing built messages to a mail service
+
+A transport sends serialized messages from a SenderAccount. The engine
+gives it up to batch_size messages per call, each as (envelope recipients,
+message bytes, ESMTP mail options), and gets back one error per message
+(None when sent). A message with several recipients that went out to only
+some of them gets an smtplib.SMTPRecipientsRefused naming the others. A
+call raises only when nothing could be sent, which the engine then retries
+as a whole. classify() tells transient failures from permanent ones using
+the smtp_pool constants.
+"""
+import base64
+import smtplib
+import threading
+import time
+
+from smtp_pool import SMTPPool, SMTP_HOST, SMTP_PORT, TRANSIENT, THROTTLED, PERMANENT, classify_smtp_error
+from send_pipeline import backoff_delay
+
+SMTP = 'smtp'
+GMAIL_API = 'gmail_api'
+
+# Gmail accepts up to 100 calls per batch but recommends no more than 50
+GMAIL_MAX_BATCH_SIZE = 100
+GMAIL_DEFAULT_BATCH_SIZE = 50
+
+# HTTP statuses worth retrying; 429 and 403 rate-limit reasons mean slow down
+RETRYABLE_HTTP_STATUSES = (408, 429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+class TransportStats:
+    """Thread-safe counters of a transport's work, like smtp_pool.PoolStats"""
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(names, 0)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + amount
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+class SMTPTransport:
+    """One SMTP connection pool per sender account, one message per call"""
+
+    name = SMTP
+    batch_size = 1
+    # BCC recipients only go in the envelope
+    bcc_in_headers = False
+
+    def __init__(self, workers=1, messages_per_connection=100, host=SMTP_HOST, port=SMTP_PORT,
+                 metrics=None):
+        self.workers = workers
+        self.messages_per_connection = messages_per_connection
+        self.host = host
+        self.port = port
+        self.metrics = metrics
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, account):
+        with self._lock:
+            pool = self._pools.get(account.email)
+            if pool is None:
+                pool = self._pools[account.email] = SMTPPool(
+                    account.email, account.app_password, size=self.workers,
+                    max_messages=self.messages_per_connection,
+                    host=self.host, port=self.port, metrics=self.metrics
+                )
+            return pool
+
+    @staticmethod
+    def _partial_error(refused):
+        # sendmail only raises when every recipient was refused
+        return smtplib.SMTPRecipientsRefused(refused) if refused else None
+
+    def send(self, account, messages):
+        pool = self._pool(account)
+        if len(messages) == 1:
+            recipients, message, mail_options = messages[0]
+            return [self._partial_error(pool.sendmail(account.email, recipients, message, mail_options))]
+        errors = []
+        for recipients, message, mail_options in messages:
+            try:
+                errors.append(self._partial_error(
+                    pool.sendmail(account.email, recipients, message, mail_options)))
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    @staticmethod
+    def classify(error):
+        return classify_smtp_error(error)
+
+    def take_throttles(self):
+        # Throttling surfaces as exceptions from send, which the engine sees
+        return 0
+
+    def stats(self):
+        """Connection counters summed over every account"""
+        totals = {'handshakes': 0, 'reconnects': 0, 'recycles': 0, 'messages': 0}
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            for name, value in pool.stats.as_dict().items():
+                totals[name] += value
+        return totals
+
+    def close(self):
+        with self._lock:
+            pools = list(self._pools.values())
+        for pool in pools:
+            pool.close()
+
+
+def _http_error_reason(error):
+    try:
+        details = error.error_details
+    except AttributeError:
+        return ''
+    if isinstance(details, list) and details and isinstance(details[0], dict):
+        return details[0].get('reason', '')
+    return ''
+
+
+def classify_http_error(error):
+    """TRANSIENT, THROTTLED or PERMANENT for a Gmail API error"""
+    from googleapiclient.errors import HttpError
+
+    if not isinstance(error, HttpError):
+        # Connection problems before any response arrived
+        return TRANSIENT if isinstance(error, OSError) else PERMANENT
+    status = error.resp.status
+    if status == 429 or (status == 403 and _http_error_reason(error) in RATE_LIMIT_REASONS):
+        return THROTTLED
+    if status in RETRYABLE_HTTP_STATUSES:
+        return TRANSIENT
+    return PERMANENT
+
+
+class GmailAPITransport:
+    """Sends through the Gmail API, many messages per HTTP batch request
+
+    Each call becomes one batch of users.messages.send requests on the
+    account's authorized service, so the HTTPS round trip and auth headers
+    are paid once per batch rather than once per message. Requests of a
+    batch that fail transiently (429, 5xx) are sent again in a smaller
+    batch after a backoff, up to max_attempts.
+
+    service_factory(account) returns a Gmail v1 service. httplib2 transports
+    are not thread-safe, so it is called once per account and worker thread.
+    Tests can return one built with an HttpMockSequence.
+    """
+
+    name = GMAIL_API
+    # Gmail takes the recipients from the headers and strips Bcc itself
+    bcc_in_headers = True
+
+    def __init__(self, service_factory, batch_size=GMAIL_DEFAULT_BATCH_SIZE, max_attempts=3,
+                 sleep=time.sleep):
+        self.service_factory = service_factory
+        self.batch_size = max(1, min(GMAIL_MAX_BATCH_SIZE, int(batch_size)))
+        self.max_attempts = max(1, int(max_attempts))
+        self._sleep = sleep
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = TransportStats('batches', 'requests', 'messages', 'retries', 'throttles')
+        # Throttles not yet picked up by take_throttles
+        self._new_throttles = 0
+
+    def _service(self, account):
+        """(service, users.messages resource) of this thread for the account"""
+        services = getattr(self._local, 'services', None)
+        if services is None:
+            services = self._local.services = {}
+        entry = services.get(account.email)
+        if entry is None:
+            service = self.service_factory(account)
+            # Building a resource re-creates all of its methods from the
+            # discovery document, which costs more than the request itself
+            entry = services[account.email] = (service, service.users().messages())
+        return entry
+
+    def _execute(self, entry, messages, indexes):
+        failures = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                failures[int(request_id)] = exception
+
+        service, resource = entry
+        batch = service.new_batch_http_request(callback=callback)
+        for index in indexes:
+            raw = base64.urlsafe_b64encode(messages[index][1]).decode('ascii')
+            batch.add(resource.send(userId='me', body={'raw': raw}), request_id=str(index))
+        batch.execute()
+        self._stats.increment('batches')
+        self._stats.increment('requests', len(indexes))
+        return failures
+
+    def send(self, account, messages):
+        entry = self._service(account)
+        errors = [None] * len(messages)
+        pending = list(range(len(messages)))
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt == 1:
+                failures = self._execute(entry, messages, pending)
+            else:
+                try:
+                    failures = self._execute(entry, messages, pending)
+                except Exception as e:
+                    # Part of the batch already went out, so it must not be
+                    # retried as a whole; report the rest as failed
+                    failures = dict.fromkeys(pending, e)
+            retry = []
+            for index in pending:
+                error = failures.get(index)
+                errors[index] = error
+                if error is None:
+                    continue
+                kind = classify_http_error(error)
+                if kind == THROTTLED:
+                    self._stats.increment('throttles')
+                    with self._lock:
+                        self._new_throttles += 1
+                if kind != PERMANENT:
+                    retry.append(index)
+            if not retry or attempt == self.max_attempts:
+                break
+            self._stats.increment('retries', len(retry))
+            self._sleep(backoff_delay(attempt))
+            pending = retry
+        self._stats.increment('messages', sum(1 for error in errors if error is None))
+        return errors
+
+    @staticmethod
+    def classify(error):
+        return classify_http_error(error)
+
+    def take_throttles(self):
+        """Throttled requests since the last call, for the rate controller"""
+        with self._lock:
+            count, self._new_throttles = self._new_throttles, 0
+        return count
+
+    def stats(self):
+        return self._stats.as_dict()
+
+    def close(self):
+        # Services of worker threads go away with the threads
+        self._local = threading.local()
@@ -0,0 +1,215 @@
+"""Runs campaigns on a background thread so they outlive the page
+
+Streamlit reruns the script on every interaction and stops it when the
+tab closes, so a send loop inside the script dies with it and freezes the
+page while it runs. Campaigns are instead submitted to a SendWorker, which
+runs them one at a time, in submission order, on its own thread. The page
+only reads each CampaignJob's progress, which the job keeps up to date from
+the campaign's events.
+"""
+import itertools
+import queue
+import threading
+import time
+from collections import deque
+
+from engine import SendEvent
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# Recently sent recipients kept per job for the progress display
+RECENT_SIZE = 20
+# Most recent failed and skipped rows kept per job; earlier ones are only counted
+ISSUES_SIZE = 20
+# Most recent rows dropped before sending kept per job for the results table
+DROPPED_ROWS_SIZE = 1000
+
+
+def _without_content(event):
+    """The event without its rendered subject and body, which the page never shows"""
+    return SendEvent(event.kind, event.row, event.recipient, error=event.error, message=event.message,
+                     reason=event.reason, sender=event.sender, attempts=event.attempts)
+
+
+class CampaignJob:
+    """A campaign waiting for, or being run by, the SendWorker
+
+    Everything the page shows is read through the methods below, under the
+    job's lock, while the worker thread updates it.
+    """
+
+    def __init__(self, campaign, chunks, total_rows=None, columns=None, name=None, resources=()):
+        self.id = None
+        self.campaign = campaign
+        self.chunks = chunks
+        self.total_rows = total_rows
+        # Columns of the recipient list (rows without an address are only
+        # worth a warning when the address column exists)
+        self.columns = list(columns or [])
+        self.name = name or campaign.campaign_id
+        # Objects with a close() method released when the run ends, such as
+        # the Excel stream and the journal
+        self.resources = [resource for resource in resources if resource is not None]
+        self.status = QUEUED
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        # Exception that ended the run early (FAILED only)
+        self.error = None
+        # (json path, prometheus path) of the exported metrics, or why not
+        self.metrics_files = None
+        self.metrics_error = None
+        self._processed = 0
+        self._counts = dict.fromkeys((SendEvent.SENT, SendEvent.FAILED, SendEvent.REJECTED,
+                                      SendEvent.SKIPPED, SendEvent.DROPPED), 0)
+        self._failures = deque(maxlen=ISSUES_SIZE)
+        self._skipped = deque(maxlen=ISSUES_SIZE)
+        self._dropped = deque(maxlen=DROPPED_ROWS_SIZE)
+        self._recent = deque(maxlen=RECENT_SIZE)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.status not in FINISHED
+
+    def cancel(self):
+        """Drop a queued job, or stop a running one after its in-flight sends"""
+        with self._lock:
+            if self.status == QUEUED:
+                self.status = CANCELLED
+                self.finished = time.time()
+        self._stop.set()
+
+    @property
+    def cancelling(self):
+        return self._stop.is_set() and self.status == RUNNING
+
+    def progress(self):
+        """(rows processed, {sent/failed/rejected/skipped/dropped: count})"""
+        with self._lock:
+            return self._processed, dict(self._counts)
+
+    def events(self):
+        """Lists of the latest failed, skipped and sent SendEvents, and dropped rows
+
+        Only the most recent ones are kept (see ISSUES_SIZE); progress()
+        counts them all.
+        """
+        with self._lock:
+            return list(self._failures), list(self._skipped), list(self._recent), list(self._dropped)
+
+    def _record(self, event):
+        with self._lock:
+            self._processed = event.processed
+            if event.kind in self._counts:
+                self._counts[event.kind] += 1
+            if event.kind == SendEvent.SENT:
+                self._recent.append(event)
+            elif event.kind in (SendEvent.FAILED, SendEvent.REJECTED):
+                self._failures.append(_without_content(event))
+            elif event.kind == SendEvent.SKIPPED:
+                self._skipped.append(_without_content(event))
+            elif event.kind == SendEvent.DROPPED:
+                self._dropped.append({"Row": event.row + 1, "Address": event.recipient,
+                                      "Reason": event.message})
+
+    def _release(self):
+        for resource in self.resources:
+            try:
+                resource.close()
+            except Exception:
+                pass
+
+    def run(self):
+        """Run the campaign on the calling thread; the worker calls this"""
+        with self._lock:
+            cancelled = self.status != QUEUED
+            if not cancelled:
+                self.status = RUNNING
+                self.started = time.time()
+        if cancelled:
+            self._release()
+            return
+        status = DONE
+        try:
+            self.result = self.campaign.run(self.chunks, on_event=self._record, stop=self._stop)
+            if self.result.cancelled:
+                status = CANCELLED
+        except Exception as e:
+            self.error = e
+            status = FAILED
+        finally:
+            self._release()
+        if self.campaign.metrics is not None and self.result is not None:
+            try:
+                self.metrics_files = self.campaign.metrics.export()
+            except OSError as e:
+                self.metrics_error = e
+        with self._lock:
+            self.status = status
+            self.finished = time.time()
+
+
+class SendWorker:
+    """A job queue and the thread that works through it
+
+    One campaign runs at a time, so campaigns sharing sender accounts don't
+    compete for their quota and rate limit; each still sends on its own
+    pool of threads. The thread is started on the first submission and
+    restarted if it ever dies.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        # Job id -> CampaignJob, in submission order
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        """Queue a CampaignJob and return it with its id set"""
+        with self._lock:
+            job.id = next(self._ids)
+            self._jobs[job.id] = job
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._work, name='campaign-worker', daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        return job
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            finally:
+                self._queue.task_done()
+
+    def jobs(self):
+        """Every job still listed, oldest first"""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def active(self):
+        """True while any job is queued or running"""
+        return any(job.active for job in self.jobs())
+
+    def clear_finished(self):
+        """Forget finished jobs, releasing their results"""
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if not job.active]:
+                del self._jobs[job_id]
+
+    def wait(self):
+        """Block until every submitted job has finished (for scripts and tests)"""
+        self._queue.join()